@@ -1,9 +1,12 @@
 import os
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, AsyncIterator
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.datastructures import UploadFile as StarletteUploadFile
 from pydantic import BaseModel
 from supabase import create_client, Client
 from dotenv import load_dotenv
@@ -22,14 +25,57 @@ import PyPDF2
 import io
 import asyncio
 import aiofiles
+import openai
 from openai import AsyncOpenAI
 import hashlib
+import copy
+import functools
+import unicodedata
+import sys
+import time
+import math
+import zlib
+import sqlite3
+import threading
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+import socket
+import urllib.parse
+import httpx
+from collections import OrderedDict, defaultdict, deque
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia e encerra recursos compartilhados: pool HTTP, cache, fila de jobs, telemetria e tarefas de manutenção"""
+    bind_openai_client_to_pool()
+    if not is_testing and HTTP_PREWARM_URLS:
+        # Pré-aquecimento em segundo plano para não atrasar o início do servidor
+        background_tasks.append(asyncio.create_task(http_pool.prewarm(HTTP_PREWARM_URLS)))
+    warmed = warm_cache_from_disk()
+    if warmed:
+        print(f"Cache: {warmed} entradas pré-carregadas do disco")
+    background_tasks.append(asyncio.create_task(sweep_cache_periodically()))
+    background_tasks.append(asyncio.create_task(flush_usage_periodically()))
+    job_queue.ensure_started()
+    try:
+        yield
+    finally:
+        loop = asyncio.get_running_loop()
+        for task in background_tasks + list(refresh_tasks.values()):
+            if task.get_loop() is loop:  # Tarefas de um loop já encerrado não podem ser canceladas
+                task.cancel()
+        background_tasks.clear()
+        refresh_tasks.clear()
+        await job_queue.close()
+        usage_telemetry.flush()
+        unbind_openai_client_from_pool()
+        await http_pool.aclose()
+
 # Configuração do FastAPI
-app = FastAPI(title="Brand Co-Pilot API", version="1.0.0")
+app = FastAPI(title="Brand Co-Pilot API", version="1.0.0", lifespan=lifespan)
 
 # Configurar CORS
 app.add_middleware(
@@ -47,6 +93,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache"],
 )
 
 # Configuração do Supabase
@@ -68,10 +115,20 @@ if not is_testing:
     if not openai_api_key or openai_api_key == "SUA_OPENAI_API_KEY_AQUI":
         raise ValueError("OPENAI_API_KEY não configurada. Configure a variável de ambiente no Railway.")
 
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 60))
+# Servidor compatível alternativo (ex.: openai_stub_server.py em testes de carga); vazio = API oficial
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+
 # Inicializar clientes
 try:
     supabase: Client = create_client(url or "https://test.supabase.co", key or "test-key")
-    openai_client = AsyncOpenAI(api_key=openai_api_key or "test-key")
+    openai_client = AsyncOpenAI(
+        api_key=openai_api_key or "test-key",
+        base_url=OPENAI_BASE_URL,
+        timeout=OPENAI_TIMEOUT,
+        # Retentativas de 429 ficam a cargo do rate limiter (visíveis e coordenadas entre chamadas)
+        max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", 0))
+    )
 except Exception as e:
     if is_testing:
         # Em testes, criar mock clients básicos
@@ -81,6 +138,158 @@ except Exception as e:
     else:
         raise e
 
+# Cliente HTTP compartilhado: um pool httpx por host (keep-alive, HTTP/2, contexto TLS único)
+try:
+    import h2  # noqa: F401 - necessário para HTTP/2 no httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP2_ENABLED = os.environ.get("HTTP2_ENABLED", "true").lower() not in ("0", "false", "no") and HTTP2_AVAILABLE
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", 20))
+HTTP_MAX_KEEPALIVE_PER_HOST = int(os.environ.get("HTTP_MAX_KEEPALIVE_PER_HOST", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 60))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+
+def parse_host_limits(value: str) -> Dict[str, int]:
+    """Converte "host=conexões,host=conexões" em dicionário"""
+    limits = {}
+    for item in value.split(","):
+        host, _, limit = item.partition("=")
+        if host.strip() and limit.strip().isdigit():
+            limits[host.strip().lower()] = int(limit)
+    return limits
+
+# Limites específicos por host; os demais usam HTTP_MAX_CONNECTIONS_PER_HOST
+HTTP_HOST_LIMITS = parse_host_limits(os.environ.get("HTTP_HOST_LIMITS", "api.openai.com=32"))
+HTTP_PREWARM_URLS = [
+    url.strip() for url in os.environ.get(
+        "HTTP_PREWARM_URLS", f"{(OPENAI_BASE_URL or 'https://api.openai.com/v1').rstrip('/')}/models,https://images.unsplash.com/"
+    ).split(",") if url.strip()
+]
+
+class HttpClientPool:
+    """Um httpx.AsyncClient por origem, recriados se o event loop mudar, com estatísticas por host"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.stats: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"requests": 0, "errors": 0, "http2_responses": 0}
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._retired: List[httpx.AsyncClient] = []
+        self._ssl_context = None
+
+    @staticmethod
+    def origin(url: str) -> str:
+        parsed = urllib.parse.urlsplit(url)
+        return f"{parsed.scheme}://{parsed.netloc}".lower()
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Conexões ficam presas ao loop em que foram abertas
+            self._retire(self._loop, list(self.clients.values()))
+            self.clients = {}
+            self._loop = loop
+        origin = self.origin(url)
+        client = self.clients.get(origin)
+        if client is None:
+            if self._ssl_context is None:
+                # Contexto TLS compartilhado: certificados carregados uma vez e sessões reaproveitáveis
+                self._ssl_context = httpx.create_ssl_context()
+            max_connections = HTTP_HOST_LIMITS.get(urllib.parse.urlsplit(url).hostname or "",
+                                                   HTTP_MAX_CONNECTIONS_PER_HOST)
+            client = httpx.AsyncClient(
+                http2=HTTP2_ENABLED,
+                verify=self._ssl_context,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=min(HTTP_MAX_KEEPALIVE_PER_HOST, max_connections),
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                follow_redirects=True,
+                transport=self.transport
+            )
+            self.clients[origin] = client
+        return client
+
+    def _retire(self, loop: Optional[asyncio.AbstractEventLoop], clients: List[httpx.AsyncClient]):
+        """Fecha os clientes de um loop substituído no próprio loop; se ele estiver parado, no próximo aclose()"""
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            for client in clients:
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            self._retired.extend(clients)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        stats = self.stats[self.origin(url)]
+        stats["requests"] += 1
+        try:
+            response = await self.client_for(url).request(method, url, **kwargs)
+        except Exception:
+            stats["errors"] += 1
+            raise
+        if response.http_version == "HTTP/2":
+            stats["http2_responses"] += 1
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def prewarm(self, urls: List[str]) -> int:
+        """Abre conexões (DNS, TCP, TLS) antecipadamente; retorna quantos hosts responderam"""
+        async def warm(url: str) -> bool:
+            try:
+                await self.request("HEAD", url, timeout=HTTP_CONNECT_TIMEOUT * 2)
+                return True
+            except Exception as e:
+                print(f"HTTP: falha ao pré-aquecer {url}: {e}")
+                return False
+        return sum(await asyncio.gather(*(warm(url) for url in urls)))
+
+    async def aclose(self):
+        clients, self.clients = list(self.clients.values()), {}
+        retired, self._retired = self._retired, []
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"HTTP: erro ao fechar cliente: {e}")
+        for client in retired:
+            try:
+                await client.aclose()
+            except Exception:
+                pass  # Loop original já encerrado: os transportes foram junto com ele
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_ENABLED,
+            "open_hosts": sorted(self.clients),
+            "hosts": {origin: dict(stats) for origin, stats in self.stats.items()}
+        }
+
+http_pool = HttpClientPool()
+
+_standalone_openai_client = None
+
+def bind_openai_client_to_pool():
+    """Faz o SDK da OpenAI usar o pool compartilhado do loop atual"""
+    global openai_client, _standalone_openai_client
+    if isinstance(openai_client, AsyncOpenAI):
+        _standalone_openai_client = openai_client
+        openai_client = openai_client.with_options(http_client=http_pool.client_for(str(openai_client.base_url)))
+
+def unbind_openai_client_from_pool():
+    """Volta ao cliente próprio do SDK antes de o pool ser fechado"""
+    global openai_client, _standalone_openai_client
+    if _standalone_openai_client is not None:
+        openai_client = _standalone_openai_client
+        _standalone_openai_client = None
+
 # Carregar modelos de IA otimizados para deploy
 try:
     # Usar YAKE para extração de palavras-chave (leve e eficaz)
@@ -103,9 +312,847 @@ except Exception as e:
     brand_attributes_classifier = None
     sentiment_analyzer = None
 
-# Cache simples em memória para reduzir custos da API
-content_cache = {}
-CACHE_EXPIRY = 3600  # 1 hora
+# Cache em memória para reduzir custos da API
+CACHE_EXPIRY = int(os.environ.get("CACHE_TTL", 3600))  # 1 hora
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 1000))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 64 MB
+CACHE_COMPRESS_THRESHOLD = int(os.environ.get("CACHE_COMPRESS_THRESHOLD", 16 * 1024))  # 0 desativa
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL", 300))  # 5 minutos
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()  # memory, sqlite ou redis
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "shared_cache.sqlite3")
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+def get_content_type_from_key(cache_key: str) -> str:
+    """Extrai o tipo de conteúdo de uma chave gerada por get_cache_key"""
+    return cache_key.rsplit("_", 1)[0]
+
+def escape_sql_like(value: str) -> str:
+    """Escapa curingas do LIKE do SQLite (usar com ESCAPE '\\')"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+CACHE_BYTES_MARKER = "__bytes__"
+
+def encode_nested_bytes(value: Any) -> Any:
+    """Troca bytes em qualquer nível (ex.: envelope do stale-while-revalidate) por {"__bytes__": base64}"""
+    if isinstance(value, bytes):
+        return {CACHE_BYTES_MARKER: base64.b64encode(value).decode()}
+    if isinstance(value, dict):
+        return {key: encode_nested_bytes(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_nested_bytes(item) for item in value]
+    return value
+
+def decode_nested_bytes(value: Any) -> Any:
+    if isinstance(value, dict):
+        if len(value) == 1 and CACHE_BYTES_MARKER in value:
+            return base64.b64decode(value[CACHE_BYTES_MARKER])
+        return {key: decode_nested_bytes(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_nested_bytes(item) for item in value]
+    return value
+
+def encode_cache_value(content: Any) -> str:
+    """Serializa um valor para backends fora do processo (JSON, com suporte a bytes em qualquer nível)"""
+    if isinstance(content, bytes):
+        return json.dumps({"bytes": base64.b64encode(content).decode()})
+    return json.dumps({"value": encode_nested_bytes(content)})
+
+def decode_cache_value(raw: str) -> Any:
+    data = json.loads(raw)
+    if "bytes" in data:
+        return base64.b64decode(data["bytes"])
+    return decode_nested_bytes(data["value"])
+
+class CacheBackendError(Exception):
+    """Erro retornado pelo servidor de um backend de cache"""
+
+class CacheBackend:
+    """Interface comum dos backends de cache, com contadores por tipo de conteúdo"""
+
+    name = "base"
+    blocking_io = False  # True quando cada operação faz I/O de rede (não pode rodar no event loop)
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+        )
+        self._counters_lock = threading.Lock()
+
+    def _count(self, content_type: str, event: str, count: int = 1):
+        with self._counters_lock:
+            counters = self._counters[content_type]
+            counters[event] = counters.get(event, 0) + count
+
+    def record(self, content_type: str, event: str, count: int = 1):
+        """Registra um evento extra (ex.: acerto no cache em disco) nas estatísticas"""
+        self._count(content_type, event, count)
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, cache_key: str, content: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, cache_key: str) -> bool:
+        raise NotImplementedError
+
+    def purge(self, content_type: Optional[str] = None, key_prefix: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Entradas e bytes armazenados por tipo de conteúdo"""
+        raise NotImplementedError
+
+    def sweep_expired(self) -> int:
+        return 0
+
+    def clear(self):
+        self.purge()
+
+    def __len__(self) -> int:
+        return sum(u["entries"] for u in self.usage().values())
+
+    def _safe_usage(self) -> Tuple[Dict[str, Dict[str, int]], Optional[str]]:
+        """usage() sem propagar falhas do backend (ex.: Redis fora do ar)"""
+        try:
+            return self.usage(), None
+        except Exception as e:
+            print(f"Erro ao consultar uso do cache {self.name}: {e}")
+            return {}, str(e)
+
+    def stats(self, usage_by_type: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Dict[str, Any]]:
+        """Estatísticas por tipo de conteúdo: contadores, entradas e bytes aproximados"""
+        empty = {"hits": 0, "misses": 0, "expirations": 0, "evictions": 0}
+        with self._counters_lock:
+            result = {content_type: {**counters, "entries": 0, "bytes": 0}
+                      for content_type, counters in self._counters.items()}
+        if usage_by_type is None:
+            usage_by_type, _ = self._safe_usage()
+        for content_type, usage in usage_by_type.items():
+            result.setdefault(content_type, {**empty, "entries": 0, "bytes": 0}).update(usage)
+        for type_stats in result.values():
+            lookups = type_stats["hits"] + type_stats["misses"]
+            type_stats["hit_rate"] = round(type_stats["hits"] / lookups, 4) if lookups else 0.0
+        return result
+
+    def summary(self) -> Dict[str, Any]:
+        """Entradas, bytes e estatísticas por tipo a partir de uma única consulta de uso"""
+        usage_by_type, error = self._safe_usage()
+        result = {
+            "entries": sum(u["entries"] for u in usage_by_type.values()),
+            "bytes": sum(u["bytes"] for u in usage_by_type.values()),
+            "content_types": self.stats(usage_by_type)
+        }
+        if error is not None:
+            result["error"] = error
+        return result
+
+async def run_cache_io(cache: CacheBackend, func: Callable[..., Any], *args: Any) -> Any:
+    """Executa func(*args) numa thread quando o backend do cache faz I/O de rede; senão, direto"""
+    if cache.blocking_io:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+class ContentCache(CacheBackend):
+    """Cache LRU em memória do processo com TTL e limites de entradas e de bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int, compress_threshold: int = 0):
+        super().__init__(max_entries, max_bytes, ttl)
+        self.compress_threshold = compress_threshold
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, cache_key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            return entry is not None and not self._is_expired(entry, time.time())
+
+    @staticmethod
+    def _estimate_size(content: Any) -> int:
+        """Estima o tamanho em bytes de um valor armazenado"""
+        if isinstance(content, bytes):
+            return len(content)
+        if isinstance(content, str):
+            return len(content.encode('utf-8'))
+        if isinstance(content, Image.Image):
+            return content.width * content.height * len(content.getbands())
+        try:
+            return len(json.dumps(content, default=str).encode('utf-8'))
+        except Exception:
+            return sys.getsizeof(content)
+
+    @staticmethod
+    def _json_payload_size(content: Any) -> Optional[int]:
+        """
+        Tamanho aproximado do JSON de um valor, sem serializá-lo; None se o valor não voltaria
+        idêntico de json.loads (bytes, tuplas, chaves que não são str, outros objetos)
+        """
+        size, pending = 0, [content]
+        while pending:
+            value = pending.pop()
+            if isinstance(value, str):
+                size += len(value)
+            elif isinstance(value, dict):
+                if not all(isinstance(key, str) for key in value):
+                    return None
+                size += sum(len(key) for key in value)
+                pending.extend(value.values())
+            elif isinstance(value, list):
+                pending.extend(value)
+            elif value is None or isinstance(value, (bool, int, float)):
+                size += 8
+            else:
+                return None
+        return size
+
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now >= entry['expires_at']
+
+    def _remove(self, cache_key: str, reason: Optional[str] = None):
+        entry = self._entries.pop(cache_key)
+        self.total_bytes -= entry['size']
+        if reason:
+            self._count(get_content_type_from_key(cache_key), reason)
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        """Retorna o conteúdo se ainda válido, marcando-o como usado recentemente"""
+        content_type = get_content_type_from_key(cache_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                self._count(content_type, 'misses')
+                return None
+            if self._is_expired(entry, time.time()):
+                self._remove(cache_key, 'expirations')
+                self._count(content_type, 'misses')
+                return None
+            self._entries.move_to_end(cache_key)
+            self._count(content_type, 'hits')
+            content = entry['content']
+        if entry['compressed'] == 'text':
+            return zlib.decompress(content).decode('utf-8')
+        if entry['compressed'] == 'json':
+            return json.loads(zlib.decompress(content))
+        return content
+
+    def set(self, cache_key: str, content: Any, ttl: Optional[float] = None):
+        """
+        Armazena conteúdo, comprimindo strings e valores JSON grandes e aplicando os limites.
+        O tamanho é conferido antes de serializar; valores que o JSON não preserva ficam sem compressão.
+        """
+        compressed = None
+        stored = content
+        if self.compress_threshold:
+            if isinstance(content, str):
+                if len(content) >= self.compress_threshold:
+                    stored, compressed = zlib.compress(content.encode('utf-8')), 'text'
+            elif isinstance(content, (dict, list)):
+                payload_size = self._json_payload_size(content)
+                if payload_size is not None and payload_size >= self.compress_threshold:
+                    stored, compressed = zlib.compress(json.dumps(content).encode('utf-8')), 'json'
+        size = self._estimate_size(stored)
+        if size > self.max_bytes:
+            # Valor maior que o próprio cache: não armazenar
+            return
+
+        with self._lock:
+            if cache_key in self._entries:
+                self._remove(cache_key)
+            now = time.time()
+            self._entries[cache_key] = {
+                'content': stored,
+                'timestamp': now,
+                'expires_at': now + (self.ttl if ttl is None else ttl),
+                'size': size,
+                'compressed': compressed
+            }
+            self.total_bytes += size
+            self._evict()
+
+    def delete(self, cache_key: str) -> bool:
+        with self._lock:
+            if cache_key in self._entries:
+                self._remove(cache_key)
+                return True
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def purge(self, content_type: Optional[str] = None, key_prefix: Optional[str] = None) -> int:
+        """Remove entradas por tipo de conteúdo e/ou prefixo de chave"""
+        with self._lock:
+            keys = [
+                k for k in self._entries
+                if (content_type is None or get_content_type_from_key(k) == content_type)
+                and (key_prefix is None or k.startswith(key_prefix))
+            ]
+            for cache_key in keys:
+                self._remove(cache_key)
+        return len(keys)
+
+    def _evict(self):
+        """Remove expirados e depois os menos usados até respeitar os limites"""
+        if len(self._entries) <= self.max_entries and self.total_bytes <= self.max_bytes:
+            return
+        self.sweep_expired()
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key, 'evictions')
+
+    def sweep_expired(self) -> int:
+        """Remove todas as entradas expiradas e retorna quantas foram removidas"""
+        now = time.time()
+        with self._lock:
+            expired_keys = [k for k, entry in self._entries.items() if self._is_expired(entry, now)]
+            for cache_key in expired_keys:
+                self._remove(cache_key, 'expirations')
+        return len(expired_keys)
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Entradas e bytes armazenados por tipo de conteúdo"""
+        result: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for cache_key, entry in self._entries.items():
+                type_usage = result.setdefault(get_content_type_from_key(cache_key), {"entries": 0, "bytes": 0})
+                type_usage["entries"] += 1
+                type_usage["bytes"] += entry['size']
+        return result
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache compartilhado entre workers do mesmo host via arquivo SQLite (WAL)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, namespace: str, max_entries: int, max_bytes: int, ttl: int):
+        super().__init__(max_entries, max_bytes, ttl)
+        self.path = path
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_cache (
+                namespace TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, cache_key)
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_shared_cache_access ON shared_cache (namespace, last_access)"
+        )
+        self._conn.commit()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(u["bytes"] for u in self.usage().values())
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        content_type = get_content_type_from_key(cache_key)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, expires_at FROM shared_cache WHERE namespace = ? AND cache_key = ?",
+                (self.namespace, cache_key)
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                self._conn.execute(
+                    "DELETE FROM shared_cache WHERE namespace = ? AND cache_key = ?", (self.namespace, cache_key)
+                )
+                self._conn.commit()
+                self._count(content_type, 'expirations')
+                row = None
+            if row is None:
+                self._count(content_type, 'misses')
+                return None
+            self._conn.execute(
+                "UPDATE shared_cache SET last_access = ? WHERE namespace = ? AND cache_key = ?",
+                (now, self.namespace, cache_key)
+            )
+            self._conn.commit()
+        self._count(content_type, 'hits')
+        return decode_cache_value(row[0])
+
+    def set(self, cache_key: str, content: Any, ttl: Optional[float] = None):
+        raw = encode_cache_value(content)
+        size = len(raw.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO shared_cache "
+                "(namespace, cache_key, content_type, content, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, cache_key, get_content_type_from_key(cache_key), raw, size,
+                 now + (self.ttl if ttl is None else ttl), now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Remove expirados e depois os menos acessados até respeitar os limites"""
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for (content_type,) in self._conn.execute(
+            "SELECT content_type FROM shared_cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, now)
+        ).fetchall():
+            self._count(content_type, 'expirations')
+        self._conn.execute("DELETE FROM shared_cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        oldest = self._conn.execute(
+            "SELECT cache_key, content_type, size FROM shared_cache WHERE namespace = ? ORDER BY last_access",
+            (self.namespace,)
+        )
+        victims = []
+        for cache_key, content_type, size in oldest:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((self.namespace, cache_key))
+            self._count(content_type, 'evictions')
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM shared_cache WHERE namespace = ? AND cache_key = ?", victims)
+
+    def delete(self, cache_key: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM shared_cache WHERE namespace = ? AND cache_key = ?", (self.namespace, cache_key)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def purge(self, content_type: Optional[str] = None, key_prefix: Optional[str] = None) -> int:
+        conditions, params = ["namespace = ?"], [self.namespace]
+        if content_type is not None:
+            conditions.append("content_type = ?")
+            params.append(content_type)
+        if key_prefix is not None:
+            conditions.append("cache_key LIKE ? ESCAPE '\\'")
+            params.append(escape_sql_like(key_prefix) + "%")
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM shared_cache WHERE {' AND '.join(conditions)}", params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def sweep_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM shared_cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content_type, COUNT(*), COALESCE(SUM(size), 0) FROM shared_cache "
+                "WHERE namespace = ? AND expires_at > ? GROUP BY content_type",
+                (self.namespace, time.time())
+            ).fetchall()
+        return {row[0]: {"entries": row[1], "bytes": row[2]} for row in rows}
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache compartilhado via protocolo Redis (RESP) sem dependência externa.
+    O limite de memória fica a cargo do maxmemory-policy do servidor; aqui só
+    é aplicado o tamanho máximo por valor. Conexões nunca são abertas no event loop:
+    sem conexão, a chamada é um miss imediato e a reconexão acontece numa thread.
+    """
+
+    name = "redis"
+    blocking_io = True
+    usage_sample_size = 64
+
+    def __init__(self, url: str, namespace: str, max_entries: int, max_bytes: int, ttl: int,
+                 socket_timeout: float = 2.0):
+        super().__init__(max_entries, max_bytes, ttl)
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip("/") or 0)
+        self.password = parsed.password
+        self.prefix = f"mwp:{namespace}:"
+        self.socket_timeout = socket_timeout
+        self.retry_interval = 5.0
+        self._unavailable_until = 0.0
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._reconnecting = False
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(u["bytes"] for u in self.usage().values())
+
+    def _open_connection(self) -> Tuple[socket.socket, Any]:
+        sock = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+        reader = sock.makefile('rb')
+        try:
+            if self.password:
+                self._send(("AUTH", self.password), sock, reader)
+            if self.db:
+                self._send(("SELECT", self.db), sock, reader)
+        except BaseException:
+            reader.close()
+            sock.close()
+            raise
+        return sock, reader
+
+    def _connect(self):
+        """Abre a conexão fora do lock (pode levar até socket_timeout); falha inicia o backoff"""
+        try:
+            sock, reader = self._open_connection()
+        except (OSError, ConnectionError, CacheBackendError):
+            self._unavailable_until = time.time() + self.retry_interval
+            raise
+        with self._lock:
+            if self._sock is None:
+                self._sock, self._reader = sock, reader
+                return
+        # Outra thread conectou antes
+        reader.close()
+        sock.close()
+
+    @staticmethod
+    def _in_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def _reconnect_in_background(self):
+        if self._reconnecting:
+            return
+        self._reconnecting = True
+
+        def reconnect():
+            try:
+                self._connect()
+            except Exception as e:
+                print(f"Redis indisponível, nova tentativa em {self.retry_interval:.0f}s: {e}")
+            finally:
+                self._reconnecting = False
+
+        threading.Thread(target=reconnect, name="redis-cache-reconnect", daemon=True).start()
+
+    def _ensure_connected(self):
+        if self._sock is not None:
+            return
+        if self._in_event_loop():
+            self._reconnect_in_background()
+            raise ConnectionError("Redis desconectado (reconectando em segundo plano)")
+        self._connect()
+
+    def _close(self):
+        for resource in (self._reader, self._sock):
+            try:
+                if resource is not None:
+                    resource.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode_command(args: Tuple[Any, ...]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self, reader: Any = None) -> Any:
+        reader = reader or self._reader
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Conexão com o Redis encerrada")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode('utf-8')
+        if kind == b"-":
+            raise CacheBackendError(body.decode('utf-8'))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply(reader) for _ in range(length)]
+        raise CacheBackendError(f"Resposta RESP inválida: {line!r}")
+
+    def _send(self, args: Tuple[Any, ...], sock: Optional[socket.socket] = None, reader: Any = None) -> Any:
+        (sock or self._sock).sendall(self._encode_command(args))
+        return self._read_reply(reader)
+
+    def _command(self, *args: Any) -> Any:
+        """Envia um comando, reconectando uma vez se a conexão tiver caído"""
+        return self._pipeline([args])[0]
+
+    def _pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """Envia vários comandos numa única ida e volta (respostas na mesma ordem)"""
+        if time.time() < self._unavailable_until:
+            # Evita esperar o timeout de conexão em toda chamada enquanto o servidor está fora
+            raise ConnectionError("Redis indisponível")
+        for attempt in range(2):
+            self._ensure_connected()
+            with self._lock:
+                try:
+                    if self._sock is None:
+                        raise ConnectionError("Conexão com o Redis encerrada")
+                    self._sock.sendall(b"".join(self._encode_command(args) for args in commands))
+                    replies = []
+                    for _ in commands:
+                        # Lê todas as respostas mesmo com erro em alguma, para não dessincronizar a conexão
+                        try:
+                            replies.append(self._read_reply())
+                        except CacheBackendError as e:
+                            replies.append(e)
+                    errors = [reply for reply in replies if isinstance(reply, CacheBackendError)]
+                    if errors:
+                        raise errors[0]
+                    return replies
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt:
+                        self._unavailable_until = time.time() + self.retry_interval
+                        raise
+
+    @staticmethod
+    def _escape_pattern(value: str) -> str:
+        return re.sub(r'([*?\[\]\\])', r'\\\1', value)
+
+    def _scan(self, pattern: str) -> List[bytes]:
+        keys, cursor = [], b"0"
+        while True:
+            cursor, batch = self._command("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            keys.extend(batch)
+            if cursor in (b"0", "0"):
+                return keys
+
+    def get(self, cache_key: str) -> Optional[Any]:
+        content_type = get_content_type_from_key(cache_key)
+        try:
+            raw = self._command("GET", self.prefix + cache_key)
+        except Exception as e:
+            print(f"Erro ao ler cache Redis: {e}")
+            raw = None
+        if raw is None:
+            self._count(content_type, 'misses')
+            return None
+        self._count(content_type, 'hits')
+        return decode_cache_value(raw.decode('utf-8'))
+
+    def set(self, cache_key: str, content: Any, ttl: Optional[float] = None):
+        raw = encode_cache_value(content)
+        ttl_ms = int((self.ttl if ttl is None else ttl) * 1000)
+        if ttl_ms <= 0 or len(raw) > self.max_bytes:
+            return
+        try:
+            self._command("SET", self.prefix + cache_key, raw, "PX", ttl_ms)
+        except Exception as e:
+            print(f"Erro ao gravar cache Redis: {e}")
+
+    def delete(self, cache_key: str) -> bool:
+        try:
+            return bool(self._command("DEL", self.prefix + cache_key))
+        except Exception as e:
+            print(f"Erro ao remover do cache Redis: {e}")
+            return False
+
+    def purge(self, content_type: Optional[str] = None, key_prefix: Optional[str] = None) -> int:
+        pattern_prefix = key_prefix if key_prefix is not None else (f"{content_type}_" if content_type else "")
+        removed = 0
+        try:
+            keys = self._scan(self.prefix + self._escape_pattern(pattern_prefix) + "*")
+            if content_type is not None:
+                keys = [k for k in keys
+                        if get_content_type_from_key(k.decode('utf-8')[len(self.prefix):]) == content_type]
+            for i in range(0, len(keys), 500):
+                removed += self._command("DEL", *keys[i:i + 500])
+        except Exception as e:
+            print(f"Erro ao limpar cache Redis: {e}")
+        return removed
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        """Entradas exatas por tipo (SCAN); bytes estimados por amostra de até usage_sample_size chaves"""
+        keys_by_type: Dict[str, List[bytes]] = defaultdict(list)
+        for key in self._scan(self.prefix + "*"):
+            keys_by_type[get_content_type_from_key(key.decode('utf-8')[len(self.prefix):])].append(key)
+        result: Dict[str, Dict[str, int]] = {}
+        for content_type, keys in keys_by_type.items():
+            sample = keys if len(keys) <= self.usage_sample_size else random.sample(keys, self.usage_sample_size)
+            sizes = self._pipeline([("STRLEN", key) for key in sample])
+            result[content_type] = {"entries": len(keys), "bytes": round(sum(sizes) * len(keys) / len(sample))}
+        return result
+
+def create_cache_backend(namespace: str, max_entries: int, max_bytes: int, ttl: int,
+                         compress_threshold: int = 0, backend: Optional[str] = None) -> CacheBackend:
+    """Cria o backend de cache configurado em CACHE_BACKEND (memory, sqlite ou redis)"""
+    backend = backend or CACHE_BACKEND
+    try:
+        if backend == "sqlite":
+            return SQLiteCacheBackend(CACHE_SQLITE_PATH, namespace, max_entries, max_bytes, ttl)
+        if backend == "redis":
+            return RedisCacheBackend(CACHE_REDIS_URL, namespace, max_entries, max_bytes, ttl)
+        if backend != "memory":
+            print(f"Backend de cache desconhecido '{backend}', usando memória")
+    except Exception as e:
+        print(f"Erro ao criar backend de cache '{backend}', usando memória: {e}")
+    return ContentCache(max_entries, max_bytes, ttl, compress_threshold)
+
+content_cache = create_cache_backend(
+    "content",
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl=CACHE_EXPIRY,
+    compress_threshold=CACHE_COMPRESS_THRESHOLD
+)
+
+# Cache persistente em disco (SQLite) para sobreviver a restarts e deploys
+PERSISTENT_CACHE_PATH = os.environ.get("PERSISTENT_CACHE_PATH", "" if is_testing else "content_cache.sqlite3")
+PERSISTENT_CACHE_TTLS = {
+    "gpt4_text": int(os.environ.get("PERSISTENT_CACHE_TTL_TEXT", 7 * 24 * 3600)),  # 7 dias
+    "dalle_image": int(os.environ.get("PERSISTENT_CACHE_TTL_IMAGE", 3300)),  # URLs do DALL-E expiram em ~1h
+    "dalle_image_bytes": int(os.environ.get("PERSISTENT_CACHE_TTL_IMAGE_BYTES", 7 * 24 * 3600)),  # referências a blobs locais
+}
+CACHE_WARM_START_ENTRIES = int(os.environ.get("CACHE_WARM_START_ENTRIES", 200))
+
+class PersistentCache:
+    """Segundo nível de cache em SQLite com TTL por tipo de conteúdo"""
+
+    def __init__(self, path: str, ttls: Dict[str, int]):
+        self.path = path
+        self.ttls = ttls
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                cache_key TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries (expires_at)")
+        self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[Tuple[Any, float]]:
+        """Retorna (conteúdo, segundos restantes) se a entrada ainda for válida"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, expires_at FROM cache_entries WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache_entries WHERE cache_key = ?", (cache_key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache_entries SET hits = hits + 1 WHERE cache_key = ?", (cache_key,))
+            self._conn.commit()
+        return json.loads(row[0]), row[1] - now
+
+    def set(self, cache_key: str, content_type: str, content: Any):
+        """Persiste conteúdo se o tipo tiver TTL configurado"""
+        ttl = self.ttls.get(content_type)
+        if not ttl:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO cache_entries (cache_key, content_type, content, created_at, expires_at, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    content = excluded.content,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at
+                """,
+                (cache_key, content_type, json.dumps(content), now, now + ttl)
+            )
+            self._conn.commit()
+
+    def hottest(self, limit: int) -> List[Tuple[str, Any, float]]:
+        """Lista as entradas válidas mais acessadas como (chave, conteúdo, segundos restantes)"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cache_key, content, expires_at FROM cache_entries "
+                "WHERE expires_at > ? ORDER BY hits DESC, created_at DESC LIMIT ?",
+                (now, limit)
+            ).fetchall()
+        return [(row[0], json.loads(row[1]), row[2] - now) for row in rows]
+
+    def purge(self, content_type: Optional[str] = None, key_prefix: Optional[str] = None) -> int:
+        """Remove entradas por tipo de conteúdo e/ou prefixo de chave"""
+        conditions, params = [], []
+        if content_type is not None:
+            conditions.append("content_type = ?")
+            params.append(content_type)
+        if key_prefix is not None:
+            conditions.append("cache_key LIKE ? ESCAPE '\\'")
+            params.append(escape_sql_like(key_prefix) + "%")
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM cache_entries{where}", params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Entradas válidas e bytes aproximados por tipo de conteúdo"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content_type, COUNT(*), COALESCE(SUM(LENGTH(content)), 0), COALESCE(SUM(hits), 0) "
+                "FROM cache_entries WHERE expires_at > ? GROUP BY content_type",
+                (time.time(),)
+            ).fetchall()
+        return {row[0]: {"entries": row[1], "bytes": row[2], "hits": row[3]} for row in rows}
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+persistent_cache: Optional[PersistentCache] = None
+if PERSISTENT_CACHE_PATH:
+    try:
+        persistent_cache = PersistentCache(PERSISTENT_CACHE_PATH, PERSISTENT_CACHE_TTLS)
+    except Exception as e:
+        print(f"Erro ao abrir cache persistente: {e}")
 
 def get_cache_key(content_type: str, data: dict) -> str:
     """Gera chave única para cache baseada no conteúdo"""
@@ -113,21 +1160,212 @@ def get_cache_key(content_type: str, data: dict) -> str:
     return f"{content_type}_{hashlib.md5(content_str.encode()).hexdigest()}"
 
 def get_cached_content(cache_key: str) -> Optional[Any]:
-    """Recupera conteúdo do cache se ainda válido"""
-    if cache_key in content_cache:
-        cached_item = content_cache[cache_key]
-        if datetime.now().timestamp() - cached_item['timestamp'] < CACHE_EXPIRY:
-            return cached_item['content']
-        else:
-            del content_cache[cache_key]
-    return None
+    """Recupera conteúdo do cache se ainda válido (memória e depois disco)"""
+    content = content_cache.get(cache_key)
+    if content is not None or persistent_cache is None:
+        return content
+
+    try:
+        persisted = persistent_cache.get(cache_key)
+    except Exception as e:
+        print(f"Erro ao ler cache persistente: {e}")
+        return None
+    if persisted is None:
+        return None
+    content, remaining_ttl = persisted
+    content_cache.record(get_content_type_from_key(cache_key), 'disk_hits')
+    content_cache.set(cache_key, content, ttl=min(CACHE_EXPIRY, remaining_ttl))
+    return content
 
 def set_cached_content(cache_key: str, content: Any):
-    """Salva conteúdo no cache"""
-    content_cache[cache_key] = {
-        'content': content,
-        'timestamp': datetime.now().timestamp()
-    }
+    """Salva conteúdo no cache (memória e disco)"""
+    content_cache.set(cache_key, content)
+    if persistent_cache is not None:
+        try:
+            persistent_cache.set(cache_key, get_content_type_from_key(cache_key), content)
+        except Exception as e:
+            print(f"Erro ao gravar cache persistente: {e}")
+
+def warm_cache_from_disk(limit: int = CACHE_WARM_START_ENTRIES) -> int:
+    """Pré-carrega na memória as entradas persistidas mais acessadas"""
+    if persistent_cache is None or limit <= 0:
+        return 0
+    try:
+        entries = persistent_cache.hottest(limit)
+    except Exception as e:
+        print(f"Erro ao pré-carregar cache: {e}")
+        return 0
+    for cache_key, content, remaining_ttl in entries:
+        content_cache.set(cache_key, content, ttl=min(CACHE_EXPIRY, remaining_ttl))
+    return len(entries)
+
+# Requisições em andamento por chave de cache (single-flight)
+inflight_requests: Dict[str, asyncio.Task] = {}
+
+async def run_single_flight(cache_key: str, request_factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Executa a requisição uma única vez por chave; chamadas concorrentes aguardam o mesmo resultado.
+    A requisição roda numa tarefa própria: cancelar um chamador (inclusive o primeiro) não afeta os demais.
+    """
+    task = inflight_requests.get(cache_key)
+    if task is None:
+        async def run() -> Any:
+            try:
+                return await request_factory()
+            finally:
+                if inflight_requests.get(cache_key) is task:
+                    del inflight_requests[cache_key]
+        
+        task = asyncio.ensure_future(run())
+        inflight_requests[cache_key] = task
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # Evita aviso de exceção não recuperada
+    return await asyncio.shield(task)
+
+# Stale-while-revalidate: entre o TTL suave e o TTL rígido (CACHE_EXPIRY) o valor
+# antigo é servido na hora enquanto uma única tarefa em segundo plano o renova
+CACHE_SOFT_TTL = int(os.environ.get("CACHE_SOFT_TTL", int(CACHE_EXPIRY * 0.75)))
+CACHE_SOFT_TTL_JITTER = 0.1  # Espalha as renovações para chaves populares não vencerem juntas
+
+refresh_tasks: Dict[str, asyncio.Task] = {}
+
+def set_cached_with_refresh(cache_key: str, content: Any):
+    """Salva o valor no cache junto com o instante (com jitter) da próxima renovação"""
+    soft_ttl = CACHE_SOFT_TTL * random.uniform(1 - CACHE_SOFT_TTL_JITTER, 1 + CACHE_SOFT_TTL_JITTER)
+    set_cached_content(cache_key, {"value": content, "refresh_at": time.time() + soft_ttl})
+
+async def compute_and_cache(cache_key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Calcula o valor e o salva no cache junto com o instante da próxima renovação"""
+    content = await compute()
+    await run_cache_io(content_cache, set_cached_with_refresh, cache_key, content)
+    return content
+
+def background_refresh_context() -> contextvars.Context:
+    """
+    Contexto da renovação em segundo plano: sem o prazo nem o endpoint/projeto da requisição que a
+    disparou; o uso da OpenAI continua atribuído ao ponto de chamada (resultado "refresh")
+    """
+    context = contextvars.Context()
+    usage = current_usage.get()
+    if usage is not None:
+        context.run(current_usage.set, {
+            "call_site": usage["call_site"], "endpoint": None, "project_id": None, "closed": True
+        })
+    return context
+
+async def refresh_in_background(cache_key: str, compute: Callable[[], Awaitable[Any]]):
+    try:
+        await run_single_flight(cache_key, lambda: compute_and_cache(cache_key, compute))
+    except Exception as e:
+        print(f"Erro ao renovar cache em segundo plano ({cache_key}): {e}")
+    finally:
+        refresh_tasks.pop(cache_key, None)
+
+async def get_or_compute(cache_key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Busca no cache com TTL suave/rígido. Valor fresco: retorna. Valor velho: retorna e
+    agenda uma única renovação. Sem valor: bloqueia, mas só um chamador recalcula.
+    """
+    entry = await run_cache_io(content_cache, get_cached_content, cache_key)
+    if entry is not None:
+        if not isinstance(entry, dict) or "refresh_at" not in entry:
+            return entry  # Entrada gravada antes do stale-while-revalidate
+        if time.time() >= entry["refresh_at"] and cache_key not in refresh_tasks and cache_key not in inflight_requests:
+            refresh_tasks[cache_key] = asyncio.create_task(
+                refresh_in_background(cache_key, compute), context=background_refresh_context()
+            )
+        return entry["value"]
+    
+    return await run_single_flight(cache_key, lambda: compute_and_cache(cache_key, compute))
+
+# Memoização de respostas de etapas determinísticas (sem chamadas à OpenAI)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))  # 32 MB
+
+response_cache = create_cache_backend(
+    "responses",
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    ttl=CACHE_EXPIRY,
+    compress_threshold=CACHE_COMPRESS_THRESHOLD
+)
+
+async def build_request_cache_key(content_type: str, params: Dict[str, Any]) -> str:
+    """Gera chave de cache a partir dos parâmetros da requisição (corpo JSON ou bytes do arquivo)"""
+    digest = hashlib.sha256()
+    for name in sorted(params):
+        value = params[name]
+        digest.update(name.encode('utf-8'))
+        if isinstance(value, StarletteUploadFile):
+            content = await value.read()
+            await value.seek(0)
+            digest.update(hashlib.sha256(content).digest())
+            digest.update(json.dumps([value.filename, value.content_type]).encode('utf-8'))
+        else:
+            digest.update(json.dumps(jsonable_encoder(value), sort_keys=True).encode('utf-8'))
+    return f"{content_type}_{digest.hexdigest()}"
+
+def memoize_endpoint(content_type: str):
+    """
+    Memoriza respostas de endpoints determinísticos. Em um acerto o endpoint não é
+    executado (nem seus efeitos no banco); o header X-Cache indica HIT ou MISS.
+    """
+    def decorator(endpoint: Callable[..., Awaitable[Any]]):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            cache_key = await build_request_cache_key(content_type, kwargs)
+            cached_response = await run_cache_io(response_cache, response_cache.get, cache_key)
+            if cached_response is not None:
+                return JSONResponse(content=cached_response, headers={"X-Cache": "HIT"})
+            
+            result = await endpoint(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+            encoded = jsonable_encoder(result)
+            await run_cache_io(response_cache, response_cache.set, cache_key, encoded)
+            return JSONResponse(content=encoded, headers={"X-Cache": "MISS"})
+        return wrapper
+    return decorator
+
+def memoize_result(content_type: str):
+    """Memoriza o resultado de funções puras cujos argumentos são serializáveis em JSON"""
+    def decorator(func: Callable[..., Any]):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                cache_key = get_cache_key(content_type, {"args": args, "kwargs": kwargs})
+            except (TypeError, ValueError):
+                return func(*args, **kwargs)
+            cached_result = response_cache.get(cache_key)
+            if cached_result is None:
+                cached_result = func(*args, **kwargs)
+                response_cache.set(cache_key, cached_result)
+            # Cópia para que o chamador possa alterar o resultado sem afetar o cache
+            return copy.deepcopy(cached_result)
+        return wrapper
+    return decorator
+
+async def sweep_cache_periodically():
+    """Remove entradas expiradas do cache em segundo plano"""
+    while True:
+        await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+        try:
+            removed = sum(cache.sweep_expired() for cache in (
+                content_cache, response_cache, image_bytes_cache, decoded_image_cache
+            ))
+            if persistent_cache is not None:
+                removed += persistent_cache.purge_expired()
+            if removed:
+                print(f"Cache: {removed} entradas expiradas removidas")
+            purged_blobs = await asyncio.to_thread(purge_image_blobs, PERSISTENT_CACHE_TTLS["dalle_image_bytes"])
+            if purged_blobs:
+                print(f"Cache: {purged_blobs} blobs de imagem antigos removidos")
+            purged_jobs = job_store.purge_finished(JOB_RESULT_TTL)
+            if purged_jobs:
+                print(f"Jobs: {purged_jobs} resultados antigos removidos")
+        except Exception as e:
+            print(f"Erro ao limpar cache: {e}")
+
+background_tasks: List[asyncio.Task] = []
 
 # URLs de fallback para casos de erro na API
 FALLBACK_METAPHOR_IMAGES = [
@@ -279,7 +1517,911 @@ def calculate_overall_confidence(sections: List[Dict[str, Any]]) -> float:
     return min(weighted_confidence / total_weight, 1.0)
 
 # Funções OpenAI para geração de conteúdo
-async def generate_image_with_dalle(prompt: str, size: str = "1024x1024", quality: str = "standard") -> str:
+
+# Circuit breaker por modelo e cache negativo de falhas recentes
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("OPENAI_CIRCUIT_FAILURE_THRESHOLD", 5))
+OPENAI_CIRCUIT_RECOVERY_TIMEOUT = float(os.environ.get("OPENAI_CIRCUIT_RECOVERY_TIMEOUT", 30))
+OPENAI_NEGATIVE_CACHE_TTL = int(os.environ.get("OPENAI_NEGATIVE_CACHE_TTL", 30))
+
+class CircuitOpenError(Exception):
+    """Chamada recusada porque o circuito do modelo está aberto ou falhou há pouco"""
+
+class CircuitBreaker:
+    """Abre após N falhas consecutivas; depois do tempo de recuperação libera uma chamada de teste"""
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.time() - self.opened_at >= self.recovery_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"Circuit breaker {self.name}: fechado novamente")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Libera a chamada de teste sem resultado (ex.: cliente desconectou no meio do stream)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit breaker {self.name}: aberto após {self.consecutive_failures} falhas")
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened_at": datetime.fromtimestamp(self.opened_at).isoformat() if self.opened_at else None
+            }
+
+circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_circuit_breaker(model: str) -> CircuitBreaker:
+    """Retorna o circuit breaker do modelo, criando-o se necessário"""
+    if model not in circuit_breakers:
+        circuit_breakers[model] = CircuitBreaker(model, OPENAI_CIRCUIT_FAILURE_THRESHOLD, OPENAI_CIRCUIT_RECOVERY_TIMEOUT)
+    return circuit_breakers[model]
+
+# Limite global de chamadas simultâneas à OpenAI (compartilhado por todos os endpoints)
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 8))
+_openai_semaphore: Optional[asyncio.Semaphore] = None
+_openai_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_openai_semaphore() -> asyncio.Semaphore:
+    """Retorna o semáforo global da OpenAI, recriando-o se o event loop mudou"""
+    global _openai_semaphore, _openai_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _openai_semaphore is None or _openai_semaphore_loop is not loop:
+        _openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+        _openai_semaphore_loop = loop
+    return _openai_semaphore
+
+# Rate limiter adaptativo por modelo: buckets de requisições e tokens + concorrência AIMD
+OPENAI_RATE_LIMIT_RETRIES = int(os.environ.get("OPENAI_RATE_LIMIT_RETRIES", 1))
+OPENAI_RATE_LIMIT_BURST_SECONDS = float(os.environ.get("OPENAI_RATE_LIMIT_BURST_SECONDS", 10))
+OPENAI_RATE_LIMIT_DEFAULT_BACKOFF = float(os.environ.get("OPENAI_RATE_LIMIT_DEFAULT_BACKOFF", 1))
+OPENAI_RATE_LIMITS = {
+    # modelo: (requisições/min, tokens/min (0 = sem limite), concorrência máxima)
+    "gpt-4-turbo-preview": (
+        int(os.environ.get("OPENAI_GPT4_RPM", 500)),
+        int(os.environ.get("OPENAI_GPT4_TPM", 300000)),
+        int(os.environ.get("OPENAI_GPT4_MAX_CONCURRENCY", 8))
+    ),
+    "dall-e-3": (
+        int(os.environ.get("OPENAI_DALLE_RPM", 50)),
+        0,
+        int(os.environ.get("OPENAI_DALLE_MAX_CONCURRENCY", 4))
+    )
+}
+OPENAI_RATE_LIMIT_FALLBACK = (500, 0, 8)
+
+class TokenBucket:
+    """Bucket reabastecido continuamente a rate_per_minute, com rajada de burst_seconds"""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = OPENAI_RATE_LIMIT_BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """Segundos até haver `amount` disponível (pedidos maiores que a capacidade esperam o bucket cheio)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+class ModelRateLimiter:
+    """
+    Limita as chamadas de um modelo por requisições/min, tokens/min e concorrência.
+    A concorrência se adapta (AIMD): cresce 1/limite a cada sucesso e cai pela metade em 429 ou erro do
+    serviço. Um Retry-After bloqueia novas aquisições até expirar.
+    """
+
+    def __init__(self, model: str, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int):
+        self.model = model
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.recent_waits = deque(maxlen=200)
+        self._waiters: List[asyncio.Future] = []
+        self._lock = threading.Lock()
+
+    def _try_reserve(self, tokens: int) -> Optional[float]:
+        """Reserva uma vaga; retorna 0 se conseguiu, segundos de espera, ou None se limitado por concorrência"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.concurrency_limit):
+                return None
+            delay = self.request_bucket.time_until(1, now)
+            if self.token_bucket is not None and tokens:
+                delay = max(delay, self.token_bucket.time_until(tokens, now))
+            if delay > 0:
+                return delay
+            self.request_bucket.consume(1)
+            if self.token_bucket is not None and tokens:
+                self.token_bucket.consume(tokens)
+            self.in_flight += 1
+            return 0.0
+
+    async def acquire(self, tokens: int = 0):
+        """Aguarda até haver capacidade para uma chamada estimada em `tokens` tokens"""
+        started = time.monotonic()
+        self.queue_depth += 1
+        try:
+            while True:
+                delay = self._try_reserve(tokens)
+                if delay == 0:
+                    break
+                if delay is None:
+                    waiter = asyncio.get_running_loop().create_future()
+                    self._waiters.append(waiter)
+                    try:
+                        await waiter
+                    finally:
+                        if waiter in self._waiters:
+                            self._waiters.remove(waiter)
+                else:
+                    await asyncio.sleep(delay)
+        finally:
+            self.queue_depth -= 1
+        
+        waited = time.monotonic() - started
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += waited
+            self.recent_waits.append(waited)
+
+    def release(self, outcome: str = "success", retry_after: Optional[float] = None):
+        """Libera a vaga e ajusta a concorrência conforme o resultado (success, throttled, error ou neutral)"""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if outcome == "success":
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+            elif outcome in ("throttled", "error"):
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            if outcome == "throttled":
+                self.throttled += 1
+                backoff = retry_after if retry_after is not None else OPENAI_RATE_LIMIT_DEFAULT_BACKOFF
+                self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+            waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            waits = list(self.recent_waits)
+            return {
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "throttled": self.throttled,
+                "blocked_for_seconds": round(max(0.0, self.blocked_until - now), 3),
+                "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 1) if self.acquired else 0.0,
+                "p95_wait_ms": round(percentile(waits, 0.95) * 1000, 1)
+            }
+
+rate_limiters: Dict[str, ModelRateLimiter] = {}
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Retorna o rate limiter do modelo, criando-o se necessário"""
+    if model not in rate_limiters:
+        rpm, tpm, concurrency = OPENAI_RATE_LIMITS.get(model, OPENAI_RATE_LIMIT_FALLBACK)
+        rate_limiters[model] = ModelRateLimiter(model, rpm, tpm, concurrency)
+    return rate_limiters[model]
+
+def estimate_prompt_tokens(prompt: str) -> int:
+    """Estimativa rápida de tokens (~4 caracteres por token)"""
+    return len(prompt) // 4 + 1
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Extrai o Retry-After (segundos) de um erro da OpenAI, se houver"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+# Prazo por requisição: cada endpoint abre um deadline_scope e as etapas abaixo dele (tarefas
+# herdam o contexto) só fazem chamadas remotas se ainda houver orçamento; senão usam o fallback local
+REQUEST_DEADLINES = {
+    # endpoint: segundos (0 = sem prazo)
+    "generate_visual_concepts": float(os.environ.get("DEADLINE_VISUAL_CONCEPTS", 30)),
+    "generate_galaxy": float(os.environ.get("DEADLINE_GALAXY", 30)),
+    "generate_brand_kit": float(os.environ.get("DEADLINE_BRAND_KIT", 60)),
+    "strategic_analysis": float(os.environ.get("DEADLINE_STRATEGIC_ANALYSIS", 30))
+}
+DEADLINE_MIN_REMAINING = {
+    # tipo de chamada: orçamento mínimo (segundos) para valer a pena tentar a chamada remota
+    "text": float(os.environ.get("DEADLINE_MIN_REMAINING_TEXT", 3)),
+    "image": float(os.environ.get("DEADLINE_MIN_REMAINING_IMAGE", 12))
+}
+
+class DeadlineExceededError(Exception):
+    """Orçamento de tempo da requisição insuficiente para a chamada remota"""
+
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Define o prazo (time.monotonic) da requisição atual; um escopo interno nunca estende o externo"""
+    if seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = request_deadline.get()
+    token = request_deadline.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def remaining_budget() -> Optional[float]:
+    """Segundos restantes do prazo atual (None se não houver prazo)"""
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def ensure_budget(min_remaining: float):
+    remaining = remaining_budget()
+    if remaining is not None and remaining < min_remaining:
+        raise DeadlineExceededError(f"Orçamento restante de {max(remaining, 0):.1f}s (mínimo {min_remaining:.1f}s)")
+
+def openai_request_timeout() -> float:
+    """Timeout da chamada à OpenAI limitado ao que resta do prazo"""
+    remaining = remaining_budget()
+    return OPENAI_TIMEOUT if remaining is None else max(0.1, min(OPENAI_TIMEOUT, remaining))
+
+# Atribuição das chamadas: endpoint e projeto da requisição atual (herdados pelas tarefas filhas)
+request_endpoint: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_endpoint", default=None)
+request_project_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_project_id", default=None)
+
+@contextmanager
+def request_scope(endpoint: str, project_id: Optional[str] = None):
+    """
+    Prazo do endpoint e atribuição (endpoint, projeto) das chamadas à OpenAI feitas dentro do bloco;
+    produz o conjunto das etapas atendidas localmente pelo modo degradado
+    """
+    endpoint_token = request_endpoint.set(endpoint)
+    project_token = request_project_id.set(project_id)
+    degraded_stages = set()
+    stages_token = request_degraded_stages.set(degraded_stages)
+    try:
+        with deadline_scope(REQUEST_DEADLINES.get(endpoint, 0)):
+            yield degraded_stages
+    finally:
+        request_degraded_stages.reset(stages_token)
+        request_project_id.reset(project_token)
+        request_endpoint.reset(endpoint_token)
+
+# Telemetria de uso da OpenAI: cada chamada de geração registra ponto de chamada, modelo, tokens,
+# imagens, latência e resultado do cache; agregado em memória e gravado periodicamente em SQLite
+USAGE_DB_PATH = os.environ.get("USAGE_DB_PATH", ":memory:" if is_testing else "openai_usage.sqlite3")
+USAGE_FLUSH_INTERVAL = int(os.environ.get("USAGE_FLUSH_INTERVAL", 60))
+USAGE_RETENTION_DAYS = int(os.environ.get("USAGE_RETENTION_DAYS", 30))
+USAGE_BUCKET_SECONDS = 60
+USAGE_MAX_LATENCY_SAMPLES = 500  # por balde agregado
+
+OPENAI_TEXT_PRICES = {
+    # modelo: (USD por 1K tokens de entrada, USD por 1K tokens de saída)
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+OPENAI_IMAGE_PRICES = {
+    # (qualidade, tamanho): USD por imagem do DALL-E 3
+    ("standard", "1024x1024"): 0.04,
+    ("standard", "1024x1792"): 0.08,
+    ("standard", "1792x1024"): 0.08,
+    ("hd", "1024x1024"): 0.08,
+    ("hd", "1024x1792"): 0.12,
+    ("hd", "1792x1024"): 0.12
+}
+
+def estimate_openai_cost(
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    images: int = 0,
+    quality: str = "standard",
+    size: str = "1024x1024"
+) -> float:
+    """Custo estimado em USD pela tabela de preços (modelos desconhecidos usam o preço do modelo padrão)"""
+    if images:
+        return images * OPENAI_IMAGE_PRICES.get((quality, size), OPENAI_IMAGE_PRICES[("standard", "1024x1024")])
+    input_price, output_price = OPENAI_TEXT_PRICES.get(model, OPENAI_TEXT_PRICES[DEFAULT_TEXT_MODEL])
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1000
+
+class UsageTelemetry:
+    """Agrega eventos de uso por (balde de tempo, endpoint, ponto de chamada, modelo, projeto, resultado)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[float, str, str, str, str, str], Dict[str, Any]] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS openai_usage (
+                bucket_start REAL NOT NULL,
+                endpoint TEXT NOT NULL,
+                call_site TEXT NOT NULL,
+                model TEXT NOT NULL,
+                project_id TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                calls INTEGER NOT NULL,
+                api_calls INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                images INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                latencies TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_bucket ON openai_usage (bucket_start)")
+        self._conn.commit()
+
+    def record(self, event: Dict[str, Any]):
+        now = event.get("timestamp", time.time())
+        key = (
+            now - now % USAGE_BUCKET_SECONDS,
+            event.get("endpoint") or "",
+            event["call_site"],
+            event.get("model") or "",
+            event.get("project_id") or "",
+            event["outcome"]
+        )
+        with self._lock:
+            entry = self._pending.setdefault(key, {
+                "calls": 0, "api_calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "images": 0, "cost_usd": 0.0, "latencies": []
+            })
+            entry["calls"] += 1
+            for field in ("api_calls", "prompt_tokens", "completion_tokens", "images", "cost_usd"):
+                entry[field] += event.get(field, 0)
+            if len(entry["latencies"]) < USAGE_MAX_LATENCY_SAMPLES:
+                entry["latencies"].append(round(event.get("latency_ms", 0.0), 1))
+
+    def flush(self) -> int:
+        """Grava os agregados pendentes; retorna quantas linhas foram gravadas"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            self._conn.executemany(
+                "INSERT INTO openai_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    key + (entry["calls"], entry["api_calls"], entry["prompt_tokens"], entry["completion_tokens"],
+                           entry["images"], entry["cost_usd"], json.dumps(entry["latencies"]))
+                    for key, entry in pending.items()
+                ]
+            )
+            self._conn.commit()
+        return len(pending)
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM openai_usage WHERE bucket_start < ?", (time.time() - older_than,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def top_call_sites(
+        self,
+        since: float,
+        order_by: str = "cost",
+        limit: int = 10,
+        project_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Pontos de chamada ordenados por custo ou p95 de latência desde `since`"""
+        self.flush()
+        query = "SELECT * FROM openai_usage WHERE bucket_start >= ?"
+        params: List[Any] = [since - since % USAGE_BUCKET_SECONDS]
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        sites: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for (_, endpoint, call_site, model, _, outcome, calls, api_calls, prompt_tokens,
+             completion_tokens, images, cost_usd, latencies) in rows:
+            site = sites.setdefault((endpoint, call_site), {
+                "endpoint": endpoint or None, "call_site": call_site, "calls": 0, "api_calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "images": 0, "cost_usd": 0.0,
+                "outcomes": defaultdict(int), "models": defaultdict(int), "latencies": [], "remote_latencies": []
+            })
+            site["calls"] += calls
+            site["api_calls"] += api_calls
+            site["prompt_tokens"] += prompt_tokens
+            site["completion_tokens"] += completion_tokens
+            site["images"] += images
+            site["cost_usd"] += cost_usd
+            site["outcomes"][outcome] += calls
+            if model:
+                site["models"][model] += calls
+            samples = json.loads(latencies)
+            site["latencies"].extend(samples)
+            if outcome == "miss":
+                site["remote_latencies"].extend(samples)
+
+        results = []
+        for site in sites.values():
+            latencies, remote_latencies = site.pop("latencies"), site.pop("remote_latencies")
+            site["cost_usd"] = round(site["cost_usd"], 6)
+            site["p95_ms"] = percentile(latencies, 0.95)
+            site["remote_p95_ms"] = percentile(remote_latencies, 0.95)
+            site["outcomes"] = dict(site["outcomes"])
+            site["models"] = dict(site["models"])
+            results.append(site)
+        sort_key = "p95_ms" if order_by == "p95" else "cost_usd"
+        results.sort(key=lambda site: site[sort_key], reverse=True)
+        return results[:limit]
+
+usage_telemetry = UsageTelemetry(USAGE_DB_PATH)
+
+current_usage: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_usage", default=None)
+
+@contextmanager
+def track_openai_usage(call_site: str):
+    """Registra uma chamada de geração; record_api_usage soma nela os tokens/imagens das requisições feitas"""
+    usage = {
+        "call_site": call_site,
+        "endpoint": request_endpoint.get(),
+        "project_id": request_project_id.get(),
+        "model": None,
+        "api_calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "images": 0,
+        "cost_usd": 0.0,
+        "outcome": None,
+        "closed": False
+    }
+    token = current_usage.set(usage)
+    started = time.monotonic()
+    try:
+        yield usage
+    except BaseException as e:
+        if isinstance(e, DeadlineExceededError):
+            usage["outcome"] = "deadline"
+        elif isinstance(e, StageDegradedError):
+            usage["outcome"] = "degraded"
+        elif isinstance(e, asyncio.CancelledError):
+            usage["outcome"] = "cancelled"
+        else:
+            usage["outcome"] = "error"
+        raise
+    finally:
+        current_usage.reset(token)
+        usage["closed"] = True
+        usage["latency_ms"] = (time.monotonic() - started) * 1000
+        if usage["outcome"] is None:
+            # Sem requisição própria: cache, cache negativo ou carona numa requisição idêntica em andamento
+            usage["outcome"] = "miss" if usage["api_calls"] else "hit"
+        usage_telemetry.record(usage)
+
+def record_api_usage(
+    model: str,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    images: int = 0,
+    quality: str = "standard",
+    size: str = "1024x1024"
+):
+    """Soma uma requisição feita à OpenAI na chamada rastreada atual (ou registra à parte, ex.: renovação em segundo plano)"""
+    cost = estimate_openai_cost(model, prompt_tokens, completion_tokens, images, quality, size)
+    usage = current_usage.get()
+    if usage is None or usage["closed"]:
+        usage_telemetry.record({
+            "call_site": usage["call_site"] if usage else "untracked",
+            "endpoint": usage["endpoint"] if usage else request_endpoint.get(),
+            "project_id": usage["project_id"] if usage else request_project_id.get(),
+            "model": model,
+            "outcome": "refresh" if usage else "miss",
+            "api_calls": 1,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "images": images,
+            "cost_usd": cost,
+            "latency_ms": 0.0
+        })
+        return
+    usage["model"] = model
+    usage["api_calls"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["completion_tokens"] += completion_tokens
+    usage["images"] += images
+    usage["cost_usd"] += cost
+
+async def flush_usage_periodically():
+    """Grava a telemetria agregada e remove dados além da retenção"""
+    while True:
+        await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(usage_telemetry.flush)
+            await asyncio.to_thread(usage_telemetry.purge, USAGE_RETENTION_DAYS * 86400)
+        except Exception as e:
+            print(f"Erro ao gravar telemetria de uso: {e}")
+
+async def call_with_rate_limit(
+    model: str,
+    tokens: int,
+    request: Callable[[], Awaitable[Any]],
+    min_remaining: float = 0.0
+) -> Any:
+    """Executa a chamada respeitando o rate limiter do modelo; 429 é retentado após o Retry-After"""
+    limiter = get_rate_limiter(model)
+    attempt = 0
+    while True:
+        remaining = remaining_budget()
+        if remaining is None:
+            await limiter.acquire(tokens)
+        else:
+            # A espera na fila também consome o prazo
+            try:
+                await asyncio.wait_for(limiter.acquire(tokens), max(0.0, remaining - min_remaining))
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(f"Prazo esgotado aguardando o rate limiter de {model}")
+        try:
+            async with get_openai_semaphore():
+                result = await degradation_controller.observe(model, request)
+        except Exception as e:
+            if isinstance(e, openai.RateLimitError):
+                limiter.release("throttled", get_retry_after(e))
+                if attempt < OPENAI_RATE_LIMIT_RETRIES:
+                    attempt += 1
+                    continue
+            else:
+                limiter.release("error" if is_upstream_failure(e) else "neutral")
+            raise
+        except BaseException:
+            # Cancelamento (cliente desconectou, wait_for, stream fechado): devolve o slot sem penalizar o modelo
+            limiter.release("neutral")
+            raise
+        limiter.release("success")
+        return result
+
+# Roteamento de modelos de texto por tier de latência/qualidade de cada ponto de chamada.
+# Cada tier tem uma lista ordenada de modelos (o primeiro é o preferido) e um orçamento de p95;
+# se o p95 recente estoura o orçamento, o tier passa para o próximo modelo da lista e, após
+# OPENAI_ROUTER_RECOVERY_SECONDS, volta a testar o anterior.
+DEFAULT_TEXT_MODEL = "gpt-4-turbo-preview"
+OPENAI_ROUTER_WINDOW = int(os.environ.get("OPENAI_ROUTER_WINDOW", 50))
+OPENAI_ROUTER_MIN_SAMPLES = int(os.environ.get("OPENAI_ROUTER_MIN_SAMPLES", 10))
+OPENAI_ROUTER_RECOVERY_SECONDS = float(os.environ.get("OPENAI_ROUTER_RECOVERY_SECONDS", 300))
+
+def parse_model_list(value: str) -> List[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+TEXT_MODEL_TIERS = {
+    # tier: (modelos em ordem de preferência, orçamento de p95 em ms)
+    "rationale": (
+        parse_model_list(os.environ.get("OPENAI_MODELS_RATIONALE", "gpt-4o-mini,gpt-3.5-turbo")),
+        float(os.environ.get("OPENAI_P95_BUDGET_RATIONALE_MS", 4000))
+    ),
+    "strategic_analysis": (
+        parse_model_list(os.environ.get("OPENAI_MODELS_STRATEGIC_ANALYSIS", "gpt-4-turbo-preview,gpt-4o-mini")),
+        float(os.environ.get("OPENAI_P95_BUDGET_STRATEGIC_ANALYSIS_MS", 20000))
+    ),
+    "guidelines": (
+        parse_model_list(os.environ.get("OPENAI_MODELS_GUIDELINES", "gpt-4-turbo-preview,gpt-4o-mini")),
+        float(os.environ.get("OPENAI_P95_BUDGET_GUIDELINES_MS", 45000))
+    )
+}
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentil pelo método nearest-rank (q entre 0 e 1)"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)] if ordered else 0.0
+
+class ModelRouter:
+    """Escolhe o modelo de cada tier e o rebaixa automaticamente quando o p95 estoura o orçamento"""
+
+    def __init__(self, tiers: Dict[str, Tuple[List[str], float]]):
+        self.tiers = tiers
+        self.active: Dict[str, int] = {tier: 0 for tier in tiers}
+        self.downgraded_at: Dict[str, float] = {}
+        self.latencies: Dict[str, deque] = {tier: deque(maxlen=OPENAI_ROUTER_WINDOW) for tier in tiers}
+        self.calls: Dict[str, Dict[str, int]] = {tier: defaultdict(int) for tier in tiers}
+        self._lock = threading.Lock()
+
+    def select(self, tier: Optional[str]) -> str:
+        """Modelo a usar no tier (DEFAULT_TEXT_MODEL para tiers não configurados)"""
+        if tier not in self.tiers or not self.tiers[tier][0]:
+            return DEFAULT_TEXT_MODEL
+        with self._lock:
+            downgraded_at = self.downgraded_at.get(tier)
+            if downgraded_at is not None and time.monotonic() - downgraded_at >= OPENAI_ROUTER_RECOVERY_SECONDS:
+                # Tentar de novo o modelo anterior
+                self._move(tier, self.active[tier] - 1)
+            return self.tiers[tier][0][self.active[tier]]
+
+    def _move(self, tier: str, index: int):
+        models = self.tiers[tier][0]
+        if index != self.active[tier]:
+            print(f"Roteamento: tier {tier} passa de {models[self.active[tier]]} para {models[index]}")
+        self.active[tier] = index
+        self.latencies[tier].clear()
+        if index > 0:
+            self.downgraded_at[tier] = time.monotonic()
+        else:
+            self.downgraded_at.pop(tier, None)
+
+    def record(self, tier: Optional[str], model: str, elapsed: float):
+        """Registra a latência (segundos) de uma chamada e rebaixa o tier se necessário"""
+        if tier not in self.tiers:
+            return
+        models, budget_ms = self.tiers[tier]
+        with self._lock:
+            self.calls[tier][model] += 1
+            if model != models[self.active[tier]]:
+                return  # Chamada iniciada antes de uma troca de modelo
+            self.latencies[tier].append(elapsed * 1000)
+            samples = list(self.latencies[tier])
+            if (len(samples) >= OPENAI_ROUTER_MIN_SAMPLES and percentile(samples, 0.95) > budget_ms
+                    and self.active[tier] + 1 < len(models)):
+                self._move(tier, self.active[tier] + 1)
+
+    async def observe(self, tier: Optional[str], model: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa a chamada medindo sua latência (falhas e timeouts também contam)"""
+        started = time.monotonic()
+        try:
+            return await request()
+        finally:
+            self.record(tier, model, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                tier: {
+                    "model": models[self.active[tier]],
+                    "models": models,
+                    "p95_budget_ms": budget_ms,
+                    "p95_ms": round(percentile(list(self.latencies[tier]), 0.95), 1),
+                    "samples": len(self.latencies[tier]),
+                    "calls_by_model": dict(self.calls[tier])
+                }
+                for tier, (models, budget_ms) in self.tiers.items()
+            }
+
+model_router = ModelRouter(TEXT_MODEL_TIERS)
+
+# Modo degradado: quando o p95 recente das chamadas à OpenAI (texto ou imagem) passa do limiar de
+# uma etapa do pipeline, ela passa a usar a implementação local (análise heurística, logo
+# geométrico, rationale por template, imagens de fallback). Uma chamada de sondagem passa a cada
+# DEGRADED_PROBE_INTERVAL para medir a recuperação; a etapa volta ao normal quando o p95 cai abaixo
+# de DEGRADED_RECOVERY_FACTOR × limiar (histerese para não oscilar).
+DEGRADED_MODE_ENABLED = os.environ.get("DEGRADED_MODE_ENABLED", "true").lower() not in ("0", "false", "no")
+DEGRADED_WINDOW_SECONDS = float(os.environ.get("DEGRADED_WINDOW_SECONDS", 120))
+DEGRADED_MIN_SAMPLES = int(os.environ.get("DEGRADED_MIN_SAMPLES", 10))
+DEGRADED_RECOVERY_MIN_SAMPLES = int(os.environ.get("DEGRADED_RECOVERY_MIN_SAMPLES", 3))
+DEGRADED_RECOVERY_FACTOR = float(os.environ.get("DEGRADED_RECOVERY_FACTOR", 0.7))
+DEGRADED_PROBE_INTERVAL = float(os.environ.get("DEGRADED_PROBE_INTERVAL", 15))
+DEGRADED_MAX_SAMPLES = 500  # por sinal
+
+DEGRADATION_STAGES = {
+    # etapa (ponto de chamada): (sinal de latência, limiar de p95 em ms)
+    "brief_analysis": ("text", float(os.environ.get("DEGRADED_P95_BRIEF_ANALYSIS_MS", 20000))),
+    "concept_rationale": ("text", float(os.environ.get("DEGRADED_P95_CONCEPT_RATIONALE_MS", 8000))),
+    "brand_guidelines": ("text", float(os.environ.get("DEGRADED_P95_BRAND_GUIDELINES_MS", 45000))),
+    "concept_logo": ("image", float(os.environ.get("DEGRADED_P95_CONCEPT_LOGO_MS", 30000))),
+    "galaxy_metaphor": ("image", float(os.environ.get("DEGRADED_P95_GALAXY_METAPHOR_MS", 30000)))
+}
+
+class StageDegradedError(Exception):
+    """Etapa em modo degradado: o chamador deve usar a implementação local"""
+
+# Etapas atendidas localmente na requisição atual (conjunto compartilhado com as tarefas filhas)
+request_degraded_stages: contextvars.ContextVar[Optional[set]] = contextvars.ContextVar("request_degraded_stages", default=None)
+
+def latency_signal(model: str) -> str:
+    return "image" if model.startswith("dall-e") else "text"
+
+class DegradationController:
+    """Liga e desliga o modo degradado de cada etapa conforme o p95 recente do seu sinal de latência"""
+
+    def __init__(self, stages: Dict[str, Tuple[str, float]], enabled: bool = True):
+        self.stages = stages
+        self.enabled = enabled
+        self.samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=DEGRADED_MAX_SAMPLES))
+        self.degraded_at: Dict[str, float] = {}
+        self.changed_at: Dict[str, float] = {}
+        self.last_probe: Dict[str, float] = {}
+        self.served_locally: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _recent(self, signal: str, now: float, since: Optional[float] = None) -> List[float]:
+        """Latências (ms) dentro da janela; com since, só as registradas depois desse instante"""
+        window = self.samples[signal]
+        while window and now - window[0][0] >= DEGRADED_WINDOW_SECONDS:
+            window.popleft()
+        return [latency_ms for recorded_at, latency_ms in window if since is None or recorded_at > since]
+
+    def record(self, model: str, elapsed: float):
+        """Registra a latência (segundos) de uma chamada e reavalia as etapas do mesmo sinal"""
+        signal = latency_signal(model)
+        now = time.monotonic()
+        with self._lock:
+            self.samples[signal].append((now, elapsed * 1000))
+            for stage, (stage_signal, threshold_ms) in self.stages.items():
+                if stage_signal != signal:
+                    continue
+                # Cada decisão usa só as chamadas feitas depois da última troca de modo da etapa:
+                # as lentas que causaram a degradação não atrasam a recuperação e vice-versa
+                recent = self._recent(signal, now, since=self.changed_at.get(stage))
+                p95 = percentile(recent, 0.95)
+                if stage not in self.degraded_at:
+                    if len(recent) >= DEGRADED_MIN_SAMPLES and p95 > threshold_ms:
+                        print(f"Modo degradado: etapa {stage} passa a usar a versão local (p95 {p95:.0f}ms > {threshold_ms:.0f}ms)")
+                        self.degraded_at[stage] = self.changed_at[stage] = self.last_probe[stage] = now
+                elif len(recent) >= DEGRADED_RECOVERY_MIN_SAMPLES and p95 <= threshold_ms * DEGRADED_RECOVERY_FACTOR:
+                    print(f"Modo degradado: etapa {stage} volta à OpenAI (p95 {p95:.0f}ms)")
+                    self.changed_at[stage] = now
+                    del self.degraded_at[stage]
+                    self.last_probe.pop(stage, None)
+
+    async def observe(self, model: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa a chamada medindo sua latência (falhas e timeouts também contam)"""
+        started = time.monotonic()
+        try:
+            return await request()
+        finally:
+            self.record(model, time.monotonic() - started)
+
+    def should_degrade(self, stage: Optional[str]) -> bool:
+        """True se a etapa deve usar a versão local agora (periodicamente deixa passar uma sondagem)"""
+        if not self.enabled or stage not in self.stages:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if stage not in self.degraded_at:
+                return False
+            if now - self.last_probe.get(stage, 0.0) >= DEGRADED_PROBE_INTERVAL:
+                self.last_probe[stage] = now
+                return False
+            self.served_locally[stage] += 1
+        served = request_degraded_stages.get()
+        if served is not None:
+            served.add(stage)
+        return True
+
+    def check(self, stage: Optional[str]):
+        if self.should_degrade(stage):
+            raise StageDegradedError(f"Etapa {stage} em modo degradado")
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            signals = {}
+            for signal in sorted({signal for signal, _ in self.stages.values()}):
+                recent = self._recent(signal, now)
+                signals[signal] = {"p95_ms": round(percentile(recent, 0.95), 1), "samples": len(recent)}
+            return {
+                "enabled": self.enabled,
+                "mode": "degraded" if self.degraded_at else "normal",
+                "signals": signals,
+                "stages": {
+                    stage: {
+                        "signal": signal,
+                        "p95_threshold_ms": threshold_ms,
+                        "recovery_p95_ms": threshold_ms * DEGRADED_RECOVERY_FACTOR,
+                        "degraded": stage in self.degraded_at,
+                        "degraded_for_s": round(now - self.degraded_at[stage], 1) if stage in self.degraded_at else None,
+                        "served_locally": self.served_locally[stage]
+                    }
+                    for stage, (signal, threshold_ms) in self.stages.items()
+                }
+            }
+
+degradation_controller = DegradationController(DEGRADATION_STAGES, DEGRADED_MODE_ENABLED)
+
+def service_mode_report(degraded_stages: Optional[set]) -> Dict[str, Any]:
+    """Modo em que a resposta foi gerada e quais etapas usaram a versão local"""
+    stages = sorted(degraded_stages or ())
+    return {"mode": "degraded" if stages else "normal", "degraded_stages": stages}
+
+# Falhas recentes por prompt: o mesmo prompt vai direto para o fallback por alguns segundos
+failure_cache = ContentCache(max_entries=1000, max_bytes=1024 * 1024, ttl=OPENAI_NEGATIVE_CACHE_TTL)
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Erros 4xx (exceto 429) indicam problema do prompt, não do serviço"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+async def call_with_circuit_breaker(
+    model: str,
+    cache_key: str,
+    request: Callable[[], Awaitable[Any]],
+    tokens: int = 0,
+    min_remaining: float = 0.0
+) -> Any:
+    """Executa a chamada à OpenAI respeitando o prazo da requisição, o circuit breaker, o cache negativo e o rate limiter"""
+    ensure_budget(min_remaining)
+    recent_failure = failure_cache.get(cache_key)
+    if recent_failure is not None:
+        raise CircuitOpenError(f"Falha recente para o mesmo prompt: {recent_failure}")
+    
+    breaker = get_circuit_breaker(model)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"Circuito aberto para {model}")
+    
+    try:
+        result = await call_with_rate_limit(model, tokens, request, min_remaining)
+    except (DeadlineExceededError, asyncio.CancelledError):
+        # Falta de prazo ou cancelamento não dizem nada sobre o modelo nem sobre o prompt
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        if is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        failure_cache.set(cache_key, str(e))
+        raise
+    breaker.record_success()
+    return result
+
+async def generate_image_with_dalle(
+    prompt: str,
+    size: str = "1024x1024",
+    quality: str = "standard",
+    call_site: str = "image"
+) -> str:
     """Gera imagem usando DALL-E 3"""
     try:
         if is_testing:
@@ -287,56 +2429,591 @@ async def generate_image_with_dalle(prompt: str, size: str = "1024x1024", qualit
             return FALLBACK_METAPHOR_IMAGES[0]
         
         cache_key = get_cache_key("dalle_image", {"prompt": prompt, "size": size, "quality": quality})
-        cached_result = get_cached_content(cache_key)
-        if cached_result:
-            return cached_result
-        
-        response = await openai_client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size=size,
-            quality=quality,
-            n=1
-        )
         
-        image_url = response.data[0].url
-        set_cached_content(cache_key, image_url)
-        return image_url
+        async def compute() -> str:
+            degradation_controller.check(call_site)
+            return await call_with_circuit_breaker(
+                "dall-e-3", cache_key, lambda: request_dalle_image(prompt, size, quality),
+                min_remaining=DEADLINE_MIN_REMAINING["image"]
+            )
+        
+        with track_openai_usage(call_site):
+            return await get_or_compute(cache_key, compute)
         
+    except StageDegradedError:
+        return random.choice(FALLBACK_METAPHOR_IMAGES)
     except Exception as e:
         print(f"Erro ao gerar imagem com DALL-E: {e}")
         # Fallback para URL do Unsplash
         return random.choice(FALLBACK_METAPHOR_IMAGES)
 
-async def generate_text_with_gpt4(prompt: str, max_tokens: int = 1000, temperature: float = 0.7) -> str:
-    """Gera texto usando GPT-4"""
+async def request_dalle_image(prompt: str, size: str, quality: str) -> str:
+    """Chama a API do DALL-E 3"""
+    response = await openai_client.images.generate(
+        model="dall-e-3",
+        prompt=prompt,
+        size=size,
+        quality=quality,
+        n=1,
+        timeout=openai_request_timeout()
+    )
+    
+    record_api_usage("dall-e-3", images=1, quality=quality, size=size)
+    return response.data[0].url
+
+# Blobs locais de imagens geradas: o cache guarda só a referência, que não expira como as URLs do DALL-E
+IMAGE_BLOB_DIR = os.environ.get("IMAGE_BLOB_DIR", "" if is_testing else "image_blobs")
+IMAGE_BLOB_PREFIX = "blob:"
+
+def store_image_blob(content: bytes) -> Any:
+    """Grava os bytes em IMAGE_BLOB_DIR (endereçado por conteúdo) e retorna a referência; sem diretório, os próprios bytes"""
+    if not IMAGE_BLOB_DIR:
+        return content
+    digest = hashlib.sha256(content).hexdigest()
+    path = os.path.join(IMAGE_BLOB_DIR, f"{digest}.png")
+    if os.path.exists(path):
+        os.utime(path)  # Renova a idade usada por purge_image_blobs
+    else:
+        os.makedirs(IMAGE_BLOB_DIR, exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as blob_file:
+            blob_file.write(content)
+        os.replace(temp_path, path)
+    return f"{IMAGE_BLOB_PREFIX}{digest}"
+
+def load_image_blob(reference: Any) -> Optional[bytes]:
+    """Resolve uma referência de store_image_blob; None se o blob não existir mais"""
+    if isinstance(reference, bytes):
+        return reference
+    if not isinstance(reference, str) or not reference.startswith(IMAGE_BLOB_PREFIX) or not IMAGE_BLOB_DIR:
+        return None
+    digest = reference[len(IMAGE_BLOB_PREFIX):]
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        return None
+    try:
+        with open(os.path.join(IMAGE_BLOB_DIR, f"{digest}.png"), "rb") as blob_file:
+            return blob_file.read()
+    except FileNotFoundError:
+        return None
+
+def purge_image_blobs(older_than: float) -> int:
+    """Remove blobs não modificados há mais de older_than segundos"""
+    if not IMAGE_BLOB_DIR or not os.path.isdir(IMAGE_BLOB_DIR):
+        return 0
+    cutoff = time.time() - older_than
+    removed = 0
+    for name in os.listdir(IMAGE_BLOB_DIR):
+        path = os.path.join(IMAGE_BLOB_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+async def generate_image_bytes_with_dalle(
+    prompt: str,
+    size: str = "1024x1024",
+    quality: str = "standard",
+    call_site: str = "image"
+) -> Optional[bytes]:
+    """Gera imagem com DALL-E 3 recebendo os bytes na própria resposta (sem segundo download); None em caso de falha"""
+    try:
+        if is_testing:
+            return None
+        
+        cache_key = get_cache_key("dalle_image_bytes", {"prompt": prompt, "size": size, "quality": quality})
+        
+        async def compute() -> Any:
+            degradation_controller.check(call_site)
+            content = await call_with_circuit_breaker(
+                "dall-e-3", cache_key, lambda: request_dalle_image_bytes(prompt, size, quality),
+                min_remaining=DEADLINE_MIN_REMAINING["image"]
+            )
+            return await asyncio.to_thread(store_image_blob, content)
+        
+        with track_openai_usage(call_site):
+            content = load_image_blob(await get_or_compute(cache_key, compute))
+            if content is None:
+                # Blob removido do disco: descarta a referência e gera novamente
+                await run_cache_io(content_cache, content_cache.delete, cache_key)
+                if persistent_cache is not None:
+                    persistent_cache.purge(key_prefix=cache_key)
+                content = load_image_blob(await get_or_compute(cache_key, compute))
+        return content
+        
+    except StageDegradedError:
+        return None
+    except Exception as e:
+        print(f"Erro ao gerar imagem com DALL-E: {e}")
+        return None
+
+async def request_dalle_image_bytes(prompt: str, size: str, quality: str) -> bytes:
+    """Chama a API do DALL-E 3 pedindo a imagem em base64"""
+    response = await openai_client.images.generate(
+        model="dall-e-3",
+        prompt=prompt,
+        size=size,
+        quality=quality,
+        response_format="b64_json",
+        n=1,
+        timeout=openai_request_timeout()
+    )
+    
+    record_api_usage("dall-e-3", images=1, quality=quality, size=size)
+    return base64.b64decode(response.data[0].b64_json)
+
+async def generate_text_with_gpt4(
+    prompt: str,
+    max_tokens: int = 1000,
+    temperature: float = 0.7,
+    tier: Optional[str] = None,
+    call_site: Optional[str] = None
+) -> str:
+    """Gera texto usando GPT-4 (ou o modelo que o roteador escolher para o tier)"""
     try:
         if is_testing:
             return f"Texto gerado para: {prompt[:50]}..."
         
         cache_key = get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature})
-        cached_result = get_cached_content(cache_key)
-        if cached_result:
-            return cached_result
-        
-        response = await openai_client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "Você é um especialista em branding e marketing que cria conteúdo profissional e criativo."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
         
-        generated_text = response.choices[0].message.content
-        set_cached_content(cache_key, generated_text)
-        return generated_text
+        async def compute() -> str:
+            degradation_controller.check(call_site)
+            model = model_router.select(tier)
+            return await call_with_circuit_breaker(
+                model, cache_key,
+                lambda: model_router.observe(tier, model, lambda: request_gpt4_text(prompt, max_tokens, temperature, model)),
+                tokens=estimate_prompt_tokens(prompt) + max_tokens,
+                min_remaining=DEADLINE_MIN_REMAINING["text"]
+            )
+        
+        with track_openai_usage(call_site or tier or "text"):
+            return await get_or_compute(cache_key, compute)
         
+    except (StageDegradedError, DeadlineExceededError):
+        # O chamador decide qual versão local usar
+        raise
     except Exception as e:
         print(f"Erro ao gerar texto com GPT-4: {e}")
         return f"Conteúdo baseado em: {prompt[:100]}..."
 
+GPT4_SYSTEM_PROMPT = "Você é um especialista em branding e marketing que cria conteúdo profissional e criativo."
+
+async def request_gpt4_text(prompt: str, max_tokens: int, temperature: float, model: str = DEFAULT_TEXT_MODEL) -> str:
+    """Chama a API de chat (GPT-4 por padrão)"""
+    response = await openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": GPT4_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=openai_request_timeout()
+    )
+    
+    content = response.choices[0].message.content
+    usage = getattr(response, "usage", None)
+    record_api_usage(
+        model,
+        prompt_tokens=getattr(usage, "prompt_tokens", None) or estimate_prompt_tokens(GPT4_SYSTEM_PROMPT + prompt),
+        completion_tokens=getattr(usage, "completion_tokens", None) or estimate_prompt_tokens(content or "")
+    )
+    return content
+
+async def stream_text_with_gpt4(
+    prompt: str,
+    max_tokens: int = 1000,
+    temperature: float = 0.7,
+    tier: Optional[str] = None,
+    call_site: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Versão em streaming de generate_text_with_gpt4: produz os trechos de texto à medida que chegam.
+    Usa o mesmo cache (entrada inteira de uma vez), circuit breaker e rate limiter; o texto completo
+    é salvo no cache ao final. Erros antes ou durante o stream são propagados ao chamador.
+    """
+    if is_testing:
+        yield f"Texto gerado para: {prompt[:50]}..."
+        return
+    
+    model = model_router.select(tier)
+    cache_key = get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature})
+    entry = await run_cache_io(content_cache, get_cached_content, cache_key)
+    if entry is not None:
+        yield entry["value"] if isinstance(entry, dict) and "refresh_at" in entry else entry
+        return
+    
+    degradation_controller.check(call_site)
+    ensure_budget(DEADLINE_MIN_REMAINING["text"])
+    recent_failure = failure_cache.get(cache_key)
+    if recent_failure is not None:
+        raise CircuitOpenError(f"Falha recente para o mesmo prompt: {recent_failure}")
+    breaker = get_circuit_breaker(model)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"Circuito aberto para {model}")
+    
+    limiter = get_rate_limiter(model)
+    tokens = estimate_prompt_tokens(prompt) + max_tokens
+    remaining = remaining_budget()
+    try:
+        if remaining is None:
+            await limiter.acquire(tokens)
+        else:
+            # A espera na fila também consome o prazo
+            await asyncio.wait_for(limiter.acquire(tokens), max(0.0, remaining - DEADLINE_MIN_REMAINING["text"]))
+    except asyncio.TimeoutError:
+        breaker.release_probe()
+        raise DeadlineExceededError(f"Prazo esgotado aguardando o rate limiter de {model}")
+    except BaseException:
+        breaker.release_probe()
+        raise
+    outcome, retry_after = "success", None
+    chunks = []
+    started = time.monotonic()
+    try:
+        async with get_openai_semaphore():
+            stream = await openai_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": GPT4_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                timeout=openai_request_timeout()
+            )
+            async for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    chunks.append(text)
+                    yield text
+    except Exception as e:
+        if isinstance(e, openai.RateLimitError):
+            outcome, retry_after = "throttled", get_retry_after(e)
+        else:
+            outcome = "error" if is_upstream_failure(e) else "neutral"
+        if outcome == "neutral":
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        failure_cache.set(cache_key, str(e))
+        raise
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "neutral"
+        breaker.release_probe()
+        raise
+    finally:
+        limiter.release(outcome, retry_after)
+        model_router.record(tier, model, time.monotonic() - started)
+        degradation_controller.record(model, time.monotonic() - started)
+    
+    breaker.record_success()
+    await run_cache_io(content_cache, set_cached_with_refresh, cache_key, "".join(chunks))
+
+# Agrupamento de prompts curtos com o mesmo contexto numa única chamada que retorna um array JSON.
+# Cada item continua com sua própria entrada de cache (a mesma chave que a chamada individual usaria).
+TEXT_BATCH_WINDOW = float(os.environ.get("TEXT_BATCH_WINDOW_MS", 20)) / 1000
+TEXT_BATCH_MAX_ITEMS = int(os.environ.get("TEXT_BATCH_MAX_ITEMS", 8))
+
+def build_batch_prompt(shared_context: str, instructions: List[str]) -> str:
+    """Prompt único para N solicitações que compartilham o mesmo contexto"""
+    items = "\n".join(f"{i+1}. {instruction}" for i, instruction in enumerate(instructions))
+    return (
+        f"{shared_context}\n\n"
+        f"Responda a cada uma das {len(instructions)} solicitações abaixo considerando o contexto acima.\n"
+        f"Retorne APENAS um array JSON com {len(instructions)} strings, na mesma ordem, sem texto adicional.\n\n"
+        f"{items}"
+    )
+
+def parse_batch_response(text: str, expected: int) -> List[str]:
+    """Extrai o array JSON de strings da resposta (aceita bloco ```json)"""
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else ""
+        cleaned = cleaned.rsplit("```", 1)[0]
+    items = json.loads(cleaned)
+    if not isinstance(items, list) or len(items) != expected or not all(isinstance(item, str) for item in items):
+        raise ValueError(f"Resposta em lote inválida: esperado array com {expected} strings")
+    return items
+
+class TextBatcher:
+    """
+    Junta chamadas concorrentes de generate() com o mesmo contexto, max_tokens, temperature e tier
+    (dentro de TEXT_BATCH_WINDOW) numa única requisição e devolve a cada chamador o seu item.
+    O lote roda fora do contexto de qualquer requisição, com o maior prazo entre os itens.
+    """
+
+    def __init__(self, window: float, max_items: int):
+        self.window = window
+        self.max_items = max_items
+        self._groups: Dict[Tuple[str, int, float, Optional[str], Optional[str]], List[Dict[str, Any]]] = {}
+        self._timers: Dict[Tuple[str, int, float, Optional[str], Optional[str]], asyncio.Task] = {}
+        self._tasks: set = set()
+
+    @staticmethod
+    def individual_prompt(shared_context: str, instruction: str) -> str:
+        """Prompt equivalente de uma chamada individual (define a chave de cache do item)"""
+        return f"{instruction}\n{shared_context}"
+
+    async def generate(
+        self,
+        shared_context: str,
+        instruction: str,
+        max_tokens: int = 150,
+        temperature: float = 0.7,
+        tier: Optional[str] = None,
+        call_site: Optional[str] = None
+    ) -> str:
+        prompt = self.individual_prompt(shared_context, instruction)
+        if is_testing:
+            return await generate_text_with_gpt4(
+                prompt, max_tokens=max_tokens, temperature=temperature, tier=tier, call_site=call_site
+            )
+        
+        entry = await run_cache_io(content_cache, get_cached_content,
+                                   get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}))
+        if entry is not None:
+            # Acerto: a chamada individual serve o valor e, se ele estiver velho, agenda a renovação
+            return await generate_text_with_gpt4(
+                prompt, max_tokens=max_tokens, temperature=temperature, tier=tier, call_site=call_site
+            )
+        
+        ensure_budget(DEADLINE_MIN_REMAINING["text"])
+        key = (shared_context, max_tokens, temperature, tier, call_site)
+        future = asyncio.get_running_loop().create_future()
+        group = self._groups.setdefault(key, [])
+        group.append({
+            "instruction": instruction,
+            "future": future,
+            "deadline": request_deadline.get(),
+            "endpoint": request_endpoint.get(),
+            "project_id": request_project_id.get()
+        })
+        if len(group) == 1:
+            self._timers[key] = self._schedule(self._flush_after(key))
+        elif len(group) >= self.max_items:
+            self._schedule(self._flush(key))
+        remaining = remaining_budget()
+        try:
+            if remaining is None:
+                return await future
+            # shield: o lote continua e ainda grava o item no cache para as próximas requisições
+            return await asyncio.wait_for(asyncio.shield(future), max(0.0, remaining))
+        except asyncio.TimeoutError:
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())  # Evita aviso de exceção não lida
+            raise DeadlineExceededError("Prazo esgotado aguardando o lote")
+        except StageDegradedError:
+            # A etapa foi degradada no contexto do lote: registra na requisição deste chamador
+            served = request_degraded_stages.get()
+            if served is not None and call_site is not None:
+                served.add(call_site)
+            raise
+
+    def _schedule(self, coroutine) -> asyncio.Task:
+        # Contexto vazio: o lote não herda prazo nem atribuição da requisição que o disparou
+        task = asyncio.create_task(coroutine, context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_after(self, key):
+        await asyncio.sleep(self.window)
+        await self._flush(key)
+
+    async def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        group = self._groups.pop(key, None)
+        if not group:
+            return
+        shared_context, max_tokens, temperature, tier, call_site = key
+        instructions = [item["instruction"] for item in group]
+        deadlines = [item["deadline"] for item in group]
+        # Maior prazo entre os itens (sem prazo se algum item não tiver); atribuição só se for comum a todos
+        request_deadline.set(None if None in deadlines else max(deadlines))
+        for var, field in ((request_endpoint, "endpoint"), (request_project_id, "project_id")):
+            values = {item[field] for item in group}
+            var.set(values.pop() if len(values) == 1 else None)
+        try:
+            results = await self._run_batch(shared_context, instructions, max_tokens, temperature, tier, call_site)
+        except (StageDegradedError, DeadlineExceededError) as e:
+            # Sem prazo (ou etapa degradada) não adianta repetir item a item: cada chamador usa a versão local
+            results = [e] * len(group)
+        except Exception as e:
+            print(f"Erro na geração em lote ({len(group)} itens), gerando individualmente: {e}")
+            results = await asyncio.gather(*[
+                generate_text_with_gpt4(self.individual_prompt(shared_context, instruction),
+                                        max_tokens=max_tokens, temperature=temperature, tier=tier, call_site=call_site)
+                for instruction in instructions
+            ], return_exceptions=True)
+        for item, result in zip(group, results):
+            future = item["future"]
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _run_batch(
+        self,
+        shared_context: str,
+        instructions: List[str],
+        max_tokens: int,
+        temperature: float,
+        tier: Optional[str],
+        call_site: Optional[str] = None
+    ) -> List[str]:
+        if len(instructions) == 1:
+            prompt = self.individual_prompt(shared_context, instructions[0])
+            return [await generate_text_with_gpt4(
+                prompt, max_tokens=max_tokens, temperature=temperature, tier=tier, call_site=call_site
+            )]
+        
+        degradation_controller.check(call_site)
+        batch_prompt = build_batch_prompt(shared_context, instructions)
+        batch_max_tokens = max_tokens * len(instructions) + 50
+        model = model_router.select(tier)
+        with track_openai_usage(f"{call_site or tier or 'text'}_batch"):
+            response_text = await call_with_circuit_breaker(
+            model,
+                get_cache_key("gpt4_batch", {"prompt": batch_prompt, "max_tokens": batch_max_tokens, "temperature": temperature}),
+                lambda: model_router.observe(
+                    tier, model, lambda: request_gpt4_text(batch_prompt, batch_max_tokens, temperature, model)
+                ),
+                tokens=estimate_prompt_tokens(batch_prompt) + batch_max_tokens,
+                min_remaining=DEADLINE_MIN_REMAINING["text"]
+            )
+        results = parse_batch_response(response_text, len(instructions))
+        for instruction, result in zip(instructions, results):
+            prompt = self.individual_prompt(shared_context, instruction)
+            await run_cache_io(
+                content_cache, set_cached_with_refresh,
+                get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": max_tokens, "temperature": temperature}),
+                result
+            )
+        return results
+
+text_batcher = TextBatcher(TEXT_BATCH_WINDOW, TEXT_BATCH_MAX_ITEMS)
+
+# Cache aproximado de análises de briefing (MinHash + LSH)
+BRIEF_SIMILARITY_THRESHOLD = float(os.environ.get("BRIEF_SIMILARITY_THRESHOLD", 0.85))
+BRIEF_INDEX_MAX_ENTRIES = int(os.environ.get("BRIEF_INDEX_MAX_ENTRIES", 500))
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 16
+MINHASH_SHINGLE_SIZE = 5
+MINHASH_PRIME = np.uint64((1 << 61) - 1)
+MINHASH_MAX_HASH = np.uint64((1 << 32) - 1)
+
+def normalize_brief_text(text: str) -> str:
+    """Normaliza o texto do briefing (minúsculas, sem acentos nem pontuação)"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^a-z0-9\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+class BriefSimilarityIndex:
+    """Índice MinHash/LSH para encontrar briefings quase idênticos já analisados"""
+
+    def __init__(self, threshold: float, max_entries: int, ttl: int,
+                 num_perm: int = MINHASH_PERMUTATIONS, bands: int = MINHASH_BANDS,
+                 shingle_size: int = MINHASH_SHINGLE_SIZE, seed: int = 1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._buckets: List[Dict[bytes, set]] = [{} for _ in range(bands)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Calcula a assinatura MinHash dos shingles de caracteres do texto"""
+        normalized = normalize_brief_text(text)
+        k = self.shingle_size
+        if len(normalized) <= k:
+            shingles = {normalized}
+        else:
+            shingles = {normalized[i:i + k] for i in range(len(normalized) - k + 1)}
+        hashes = np.array([zlib.crc32(sh.encode('utf-8')) for sh in shingles], dtype=np.uint64)
+        # Overflow em uint64 é intencional: faz parte da família de hashes
+        permuted = (np.outer(hashes, self._a) + self._b) % MINHASH_PRIME & MINHASH_MAX_HASH
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band, band_key in enumerate(entry['band_keys']):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def add(self, text: str, attributes: List[str], analysis: Dict[str, Any]):
+        """Indexa a análise de um briefing (uma cópia: o chamador pode alterar a sua)"""
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                'signature': signature,
+                'band_keys': band_keys,
+                'attributes': frozenset(a.lower() for a in attributes),
+                'analysis': copy.deepcopy(analysis),
+                'timestamp': time.time()
+            }
+            for band, band_key in enumerate(band_keys):
+                self._buckets[band].setdefault(band_key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def lookup(self, text: str, attributes: List[str]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Retorna (análise, similaridade estimada) do briefing mais parecido acima do limiar"""
+        signature = self.signature(text)
+        wanted_attributes = frozenset(a.lower() for a in attributes)
+        now = time.time()
+        best: Optional[Tuple[Dict[str, Any], float]] = None
+        with self._lock:
+            candidates = set()
+            for band, band_key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(band_key, ()))
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry['timestamp'] >= self.ttl:
+                    self._remove(entry_id)
+                    continue
+                if entry['attributes'] != wanted_attributes:
+                    continue
+                similarity = float(np.mean(entry['signature'] == signature))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (entry['analysis'], similarity)
+        # Cópia: quem recebe a análise pode acrescentar campos sem alterar a entrada indexada
+        return (copy.deepcopy(best[0]), best[1]) if best else None
+
+brief_similarity_index = BriefSimilarityIndex(
+    threshold=BRIEF_SIMILARITY_THRESHOLD,
+    max_entries=BRIEF_INDEX_MAX_ENTRIES,
+    ttl=CACHE_EXPIRY
+)
+
 async def analyze_brief_with_gpt4(text: str, keywords: List[str], attributes: List[str]) -> Dict[str, Any]:
     """Análise estratégica avançada usando GPT-4"""
     prompt = f"""
@@ -361,18 +3038,33 @@ async def analyze_brief_with_gpt4(text: str, keywords: List[str], attributes: Li
     """
     
     try:
-        response_text = await generate_text_with_gpt4(prompt, max_tokens=1500, temperature=0.3)
+        # Briefing quase idêntico já analisado: evitar nova chamada ao GPT-4
+        exact_key = get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": 1500, "temperature": 0.3})
+        if await run_cache_io(content_cache, get_cached_content, exact_key) is None:
+            approximate = brief_similarity_index.lookup(text, attributes)
+            if approximate:
+                analysis, similarity = approximate
+                return {**analysis, "approximate_cache_hit": True, "cache_similarity": round(similarity, 3)}
+        
+        response_text = await generate_text_with_gpt4(
+            prompt, max_tokens=1500, temperature=0.3, tier="strategic_analysis", call_site="brief_analysis"
+        )
         
         # Tentar fazer parse do JSON
         try:
-            return json.loads(response_text)
+            analysis = json.loads(response_text)
+            if isinstance(analysis, dict):
+                brief_similarity_index.add(text, attributes, analysis)
+            return analysis
         except json.JSONDecodeError:
             # Se não conseguir fazer parse, extrair manualmente os dados
             return extract_analysis_from_text(response_text, keywords, attributes)
             
+    except StageDegradedError:
+        return await run_cache_io(response_cache, analyze_strategic_elements, text, keywords, attributes)
     except Exception as e:
         print(f"Erro na análise com GPT-4: {e}")
-        return analyze_strategic_elements(text, keywords, attributes)
+        return await run_cache_io(response_cache, analyze_strategic_elements, text, keywords, attributes)
 
 def extract_analysis_from_text(text: str, keywords: List[str], attributes: List[str]) -> Dict[str, Any]:
     """Extrai dados de análise de texto não-estruturado"""
@@ -387,10 +3079,10 @@ def extract_analysis_from_text(text: str, keywords: List[str], attributes: List[
     }
 
 # Funções para geração da galáxia de conceitos
+METAPHOR_CONCURRENCY = int(os.environ.get("METAPHOR_CONCURRENCY", 6))
+
 async def generate_visual_metaphors(keywords: List[str], attributes: List[str], demo_mode: bool = False) -> List[Dict[str, str]]:
     """Gera metáforas visuais usando DALL-E 3"""
-    metaphors = []
-    
     # Gerar prompts criativos baseados nas palavras-chave e atributos
     metaphor_prompts = []
     
@@ -422,23 +3114,27 @@ async def generate_visual_metaphors(keywords: List[str], attributes: List[str],
     # Limitar a 6 metáforas para controlar custos
     selected_prompts = metaphor_prompts[:6]
     
-    # Gerar imagens usando DALL-E 3
-    for prompt in selected_prompts:
-        try:
-            image_url = await generate_image_with_dalle(prompt, size="1024x1024", quality="standard")
-            metaphors.append({
-                "prompt": prompt,
-                "image_url": image_url
-            })
-        except Exception as e:
-            print(f"Erro ao gerar metáfora visual: {e}")
-            # Fallback para URL do Unsplash
-            metaphors.append({
-                "prompt": prompt,
-                "image_url": random.choice(FALLBACK_METAPHOR_IMAGES)
-            })
+    # Gerar imagens usando DALL-E 3 em paralelo, limitado por METAPHOR_CONCURRENCY
+    semaphore = asyncio.Semaphore(METAPHOR_CONCURRENCY)
+    
+    async def generate_metaphor(prompt: str) -> Dict[str, str]:
+        async with semaphore:
+            try:
+                image_url = await generate_image_with_dalle(
+                    prompt, size="1024x1024", quality="standard", call_site="galaxy_metaphor"
+                )
+            except Exception as e:
+                print(f"Erro ao gerar metáfora visual: {e}")
+                # Fallback para URL do Unsplash
+                image_url = random.choice(FALLBACK_METAPHOR_IMAGES)
+        return {
+            "prompt": prompt,
+            "image_url": image_url
+        }
     
-    return metaphors
+    # gather preserva a ordem dos prompts
+    metaphors = await asyncio.gather(*[generate_metaphor(prompt) for prompt in selected_prompts])
+    return list(metaphors)
 
 def generate_color_palettes(attributes: List[str]) -> List[Dict[str, Any]]:
     """Gera paletas de cores baseadas nos atributos"""
@@ -584,12 +3280,72 @@ async def save_generated_assets(project_id: str, brief_id: str, assets_data: Dic
         return False
 
 # Funções para processamento de imagens (Fase 3)
+
+# Caches de imagens de origem: bytes por URL e imagens decodificadas por hash do conteúdo
+IMAGE_BYTES_CACHE_MAX_ENTRIES = int(os.environ.get("IMAGE_BYTES_CACHE_MAX_ENTRIES", 128))
+IMAGE_BYTES_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_BYTES_CACHE_MAX_BYTES", 64 * 1024 * 1024))  # 64 MB
+DECODED_IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get("DECODED_IMAGE_CACHE_MAX_ENTRIES", 32))
+DECODED_IMAGE_CACHE_MAX_BYTES = int(os.environ.get("DECODED_IMAGE_CACHE_MAX_BYTES", 128 * 1024 * 1024))  # 128 MB
+
+image_bytes_cache = create_cache_backend(
+    "images",
+    max_entries=IMAGE_BYTES_CACHE_MAX_ENTRIES,
+    max_bytes=IMAGE_BYTES_CACHE_MAX_BYTES,
+    ttl=CACHE_EXPIRY
+)
+# Imagens decodificadas (objetos PIL) ficam sempre na memória do processo
+decoded_image_cache = ContentCache(
+    max_entries=DECODED_IMAGE_CACHE_MAX_ENTRIES,
+    max_bytes=DECODED_IMAGE_CACHE_MAX_BYTES,
+    ttl=CACHE_EXPIRY
+)
+
+def image_bytes_cache_key(url: str) -> str:
+    return f"image_bytes_{hashlib.sha256(url.encode('utf-8')).hexdigest()}"
+
+def fetch_image_bytes(url: str) -> bytes:
+    """Baixa os bytes de uma imagem, reaproveitando downloads anteriores da mesma URL"""
+    cache_key = image_bytes_cache_key(url)
+    content = image_bytes_cache.get(cache_key)
+    if content is None:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        content = response.content
+        image_bytes_cache.set(cache_key, content)
+    return content
+
+def decode_image_bytes(content: bytes) -> Image.Image:
+    """Decodifica bytes em imagem RGBA, reaproveitando decodificações do mesmo conteúdo"""
+    cache_key = f"decoded_image_{hashlib.sha256(content).hexdigest()}"
+    image = decoded_image_cache.get(cache_key)
+    if image is None:
+        image = Image.open(BytesIO(content)).convert('RGBA')
+        decoded_image_cache.set(cache_key, image)
+    # Cópia para que o chamador possa alterar a imagem sem afetar o cache
+    return image.copy()
+
 def download_image_from_url(url: str) -> Image.Image:
     """Baixa uma imagem de uma URL"""
     try:
-        response = requests.get(url, timeout=10)
+        return decode_image_bytes(fetch_image_bytes(url))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao baixar imagem: {str(e)}")
+
+async def fetch_image_bytes_async(url: str) -> bytes:
+    """Versão assíncrona de fetch_image_bytes, usando o pool HTTP compartilhado"""
+    cache_key = image_bytes_cache_key(url)
+    content = await run_cache_io(image_bytes_cache, image_bytes_cache.get, cache_key)
+    if content is None:
+        response = await http_pool.get(url, timeout=10)
         response.raise_for_status()
-        return Image.open(BytesIO(response.content)).convert('RGBA')
+        content = response.content
+        await run_cache_io(image_bytes_cache, image_bytes_cache.set, cache_key, content)
+    return content
+
+async def download_image_from_url_async(url: str) -> Image.Image:
+    """Baixa uma imagem sem bloquear o event loop (decodificação em thread)"""
+    try:
+        return await asyncio.to_thread(decode_image_bytes, await fetch_image_bytes_async(url))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao baixar imagem: {str(e)}")
 
@@ -649,6 +3405,82 @@ def apply_color_palette_to_image(image: Image.Image, palette: List[str]) -> Imag
         print(f"Erro ao aplicar paleta: {e}")
         return image
 
+# Recoloração perceptual em CIELAB (iluminante D65)
+LAB_WHITE_POINT = np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+], dtype=np.float32)
+XYZ_TO_RGB = np.linalg.inv(RGB_TO_XYZ).astype(np.float32)
+RECOLOR_SAMPLE_PIXELS = 20000
+RECOLOR_KMEANS_ITERATIONS = 10
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Converte cores sRGB (0-255, última dimensão = 3) para CIELAB"""
+    rgb = rgb.astype(np.float32) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = linear @ RGB_TO_XYZ.T / LAB_WHITE_POINT
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2])
+    ], axis=-1)
+
+def lab_to_rgb(lab: np.ndarray) -> np.ndarray:
+    """Converte cores CIELAB para sRGB (0-255, uint8)"""
+    fy = (lab[..., 0] + 16) / 116
+    f = np.stack([fy + lab[..., 1] / 500, fy, fy - lab[..., 2] / 200], axis=-1)
+    xyz = np.where(f > 6 / 29, f ** 3, 3 * (6 / 29) ** 2 * (f - 4 / 29)) * LAB_WHITE_POINT
+    linear = np.clip(xyz @ XYZ_TO_RGB.T, 0.0, 1.0)
+    rgb = np.where(linear > 0.0031308, 1.055 * linear ** (1 / 2.4) - 0.055, linear * 12.92)
+    return np.clip(rgb * 255 + 0.5, 0, 255).astype(np.uint8)
+
+def cluster_lab_colors(lab: np.ndarray, k: int) -> np.ndarray:
+    """K-means determinístico em CIELAB; centros iniciais nos quantis de luminância"""
+    order = np.argsort(lab[:, 0], kind='stable')
+    centers = lab[order[((np.arange(k) + 0.5) * len(lab) / k).astype(int)]].copy()
+    for _ in range(RECOLOR_KMEANS_ITERATIONS):
+        labels = ((lab[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1).argmin(axis=1)
+        for cluster in range(k):
+            members = lab[labels == cluster]
+            if len(members):
+                centers[cluster] = members.mean(axis=0)
+    return centers[np.argsort(centers[:, 0], kind='stable')]
+
+def recolor_image_to_palette(image: Image.Image, palette: List[str], softness: float = 10.0) -> Image.Image:
+    """
+    Recolore a imagem para a paleta alvo mapeando os clusters de cor, ordenados por luminância,
+    para as cores da paleta em CIELAB. Cada pixel é deslocado pela média ponderada dos deslocamentos
+    dos clusters, o que preserva o sombreamento e as bordas com anti-aliasing.
+    """
+    if not palette:
+        return image
+    
+    rgba = np.asarray(image.convert('RGBA'))
+    lab = rgb_to_lab(rgba[..., :3]).reshape(-1, 3)
+    
+    visible = lab[rgba[..., 3].reshape(-1) > 0]
+    if len(visible) == 0:
+        return image.copy()
+    step = max(1, len(visible) // RECOLOR_SAMPLE_PIXELS)
+    
+    targets = rgb_to_lab(np.array([hex_to_rgb(color) for color in palette]))
+    targets = targets[np.argsort(targets[:, 0], kind='stable')]
+    k = min(len(targets), len(np.unique(visible[::step].round(), axis=0)))
+    centers = cluster_lab_colors(visible[::step], k)
+    # Com menos clusters do que cores, usar cores da paleta espalhadas pela luminância
+    targets = targets[np.linspace(0, len(targets) - 1, k).round().astype(int)]
+    shifts = targets - centers
+    
+    distances = ((lab[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+    weights = np.exp(-(distances - distances.min(axis=1, keepdims=True)) / (2 * softness ** 2))
+    weights /= weights.sum(axis=1, keepdims=True)
+    recolored = lab_to_rgb(lab + weights @ shifts).reshape(rgba.shape[:2] + (3,))
+    
+    return Image.fromarray(np.dstack([recolored, rgba[..., 3]]), 'RGBA')
+
 def apply_artistic_filter(image: Image.Image, filter_type: str) -> Image.Image:
     """Aplica filtros artísticos à imagem"""
     try:
@@ -713,26 +3545,23 @@ async def generate_logo_with_dalle(text: str, palette: list, style_attributes: L
         simple and memorable, suitable for business use, white background, high contrast
         """
         
-        # Gerar logo usando DALL-E
-        logo_url = await generate_image_with_dalle(logo_prompt.strip(), size="1024x1024", quality="standard")
+        # Gerar logo usando DALL-E, recebendo os bytes direto na resposta
+        logo_bytes = await generate_image_bytes_with_dalle(
+            logo_prompt.strip(), size="1024x1024", quality="standard", call_site="concept_logo"
+        )
+        if logo_bytes is None:
+            return create_fallback_logo(text, palette)
         
-        # Se conseguiu gerar, converter para base64 para consistência com o sistema atual
-        try:
-            response = requests.get(logo_url, timeout=10)
-            if response.status_code == 200:
-                img_base64 = base64.b64encode(response.content).decode()
-                return f"data:image/png;base64,{img_base64}"
-            else:
-                return logo_url  # Retorna URL se não conseguir baixar
-        except Exception as e:
-            print(f"Erro ao converter logo para base64: {e}")
-            return logo_url  # Retorna URL se não conseguir converter
+        # Data URL para consistência com o sistema atual
+        return f"data:image/png;base64,{base64.b64encode(logo_bytes).decode()}"
             
     except Exception as e:
         print(f"Erro ao gerar logo com DALL-E: {e}")
         # Fallback para versão geométrica simples
         return create_fallback_logo(text, palette)
 
+FALLBACK_LOGO_URL = "https://via.placeholder.com/512x512/000000/FFFFFF?text=LOGO"
+
 def create_fallback_logo(text: str, palette: list) -> str:
     """
     Cria um logo fallback simples quando DALL-E falha
@@ -775,7 +3604,169 @@ def create_fallback_logo(text: str, palette: list) -> str:
     except Exception as e:
         print(f"Erro no fallback logo: {e}")
         # Último recurso - retorna URL de placeholder
-        return "https://via.placeholder.com/512x512/000000/FFFFFF?text=LOGO"
+        return FALLBACK_LOGO_URL
+
+# Motor local de derivações de logo: uma geração mestre por conceito, variações via PIL/NumPy
+LOGO_VARIATION_TYPES = ["master", "monochrome", "inverted", "transparent", "icon", "horizontal"]
+LOGO_DERIVATIVE_SIZE = 512
+
+def hex_to_rgb(color: str) -> Tuple[int, int, int]:
+    """Converte uma cor hexadecimal (#RRGGBB) para RGB"""
+    color = color.lstrip('#')
+    return tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+
+def load_logo_font(size: int) -> ImageFont.ImageFont:
+    """Carrega a fonte usada nos logos, com fallback para a fonte padrão do PIL"""
+    try:
+        return ImageFont.truetype("arial.ttf", size=size)
+    except IOError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            return ImageFont.load_default()
+
+def load_logo_image(logo: str) -> Image.Image:
+    """Carrega um logo (data URL em base64 ou URL remota) como imagem RGBA"""
+    if logo.startswith("data:image"):
+        return decode_image_bytes(base64.b64decode(logo.split(",", 1)[1]))
+    return download_image_from_url(logo)
+
+async def load_logo_image_async(logo: str) -> Image.Image:
+    """Versão assíncrona de load_logo_image"""
+    if logo.startswith("data:image"):
+        return await asyncio.to_thread(load_logo_image, logo)
+    return await download_image_from_url_async(logo)
+
+def logo_to_data_url(image: Image.Image) -> str:
+    """Converte uma imagem PIL para data URL PNG"""
+    return f"data:image/png;base64,{image_to_base64(image)}"
+
+def remove_logo_background(image: Image.Image, low: float = 12.0, high: float = 48.0) -> Image.Image:
+    """
+    Torna transparente o fundo do logo, estimado pela cor mediana das bordas.
+    A opacidade cresce gradualmente entre as distâncias low e high para preservar o anti-aliasing.
+    """
+    rgba = np.asarray(image.convert('RGBA'), dtype=np.float32)
+    rgb = rgba[..., :3]
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    background = np.median(border, axis=0)
+    distance = np.sqrt(((rgb - background) ** 2).sum(axis=-1))
+    alpha = np.clip((distance - low) / (high - low), 0.0, 1.0) * rgba[..., 3]
+    result = np.dstack([rgb, alpha]).round().astype(np.uint8)
+    return Image.fromarray(result, 'RGBA')
+
+def create_monochrome_logo(transparent: Image.Image, color: str, background: str = "#FFFFFF") -> Image.Image:
+    """Logo em uma única cor da paleta, usando a máscara do logo transparente"""
+    mask = transparent.getchannel('A')
+    result = Image.new('RGB', transparent.size, hex_to_rgb(background))
+    result.paste(Image.new('RGB', transparent.size, hex_to_rgb(color)), mask=mask)
+    return result
+
+def create_inverted_logo(transparent: Image.Image, background: str) -> Image.Image:
+    """Versão negativa do logo (branca) para uso sobre fundo escuro da paleta"""
+    mask = transparent.getchannel('A')
+    result = Image.new('RGB', transparent.size, hex_to_rgb(background))
+    result.paste(Image.new('RGB', transparent.size, (255, 255, 255)), mask=mask)
+    return result
+
+def crop_logo_icon(transparent: Image.Image, size: int = LOGO_DERIVATIVE_SIZE, margin: float = 0.1) -> Image.Image:
+    """Recorta o símbolo do logo e o centraliza em um quadrado com margem"""
+    bbox = transparent.getchannel('A').point(lambda value: 255 if value > 16 else 0).getbbox()
+    symbol = transparent.crop(bbox) if bbox else transparent
+    scale = size * (1 - 2 * margin) / max(symbol.size)
+    symbol = symbol.resize(
+        (max(1, round(symbol.width * scale)), max(1, round(symbol.height * scale))), Image.Resampling.LANCZOS
+    )
+    icon = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    icon.paste(symbol, ((size - symbol.width) // 2, (size - symbol.height) // 2), symbol)
+    return icon
+
+def create_horizontal_lockup(icon: Image.Image, brand_text: str, color: str, height: int = 256) -> Image.Image:
+    """Composição horizontal: símbolo à esquerda e nome da marca à direita"""
+    symbol = icon.resize((height, height), Image.Resampling.LANCZOS)
+    font = load_logo_font(int(height * 0.4))
+    text_width = int(ImageDraw.Draw(symbol).textlength(brand_text, font=font))
+    padding = height // 4
+    lockup = Image.new('RGBA', (height + padding * 2 + text_width, height), (0, 0, 0, 0))
+    lockup.paste(symbol, (0, 0), symbol)
+    ImageDraw.Draw(lockup).text(
+        (height + padding, height // 2), brand_text, font=font, anchor="lm", fill=hex_to_rgb(color) + (255,)
+    )
+    return lockup
+
+def create_logo_derivatives(master: Image.Image, brand_text: str, palette: List[str]) -> Dict[str, Image.Image]:
+    """Gera as variações locais do logo mestre: monocromática, invertida, transparente, ícone e horizontal"""
+    dark_color = palette[-1] if palette else "#000000"
+    primary_color = palette[0] if palette else "#000000"
+    
+    master = master.resize((LOGO_DERIVATIVE_SIZE, LOGO_DERIVATIVE_SIZE), Image.Resampling.LANCZOS)
+    transparent = remove_logo_background(master)
+    icon = crop_logo_icon(transparent)
+    return {
+        "monochrome": create_monochrome_logo(transparent, dark_color),
+        "inverted": create_inverted_logo(transparent, dark_color),
+        "transparent": transparent,
+        "icon": icon,
+        "horizontal": create_horizontal_lockup(icon, brand_text, primary_color)
+    }
+
+async def generate_concept_logos(
+    master_task: Awaitable[str],
+    source_palette: List[str],
+    logo_text: str,
+    brand_text: str,
+    palette: List[str]
+) -> List[str]:
+    """
+    Usa o logo mestre (gerado uma vez com DALL-E na source_palette), recolore-o para a
+    paleta do conceito e deriva as demais variações localmente.
+    Retorna as variações na ordem de LOGO_VARIATION_TYPES; se até o fallback local falhar,
+    o conceito recebe o placeholder em todas as variações (sem derrubar os demais).
+    """
+    try:
+        return await build_concept_logos(master_task, source_palette, logo_text, brand_text, palette)
+    except Exception as e:
+        print(f"Erro ao gerar logos do conceito, usando placeholder: {e}")
+        return [FALLBACK_LOGO_URL] * len(LOGO_VARIATION_TYPES)
+
+async def build_concept_logos(
+    master_task: Awaitable[str],
+    source_palette: List[str],
+    logo_text: str,
+    brand_text: str,
+    palette: List[str]
+) -> List[str]:
+    master = await master_task
+    try:
+        master_image = await load_logo_image_async(master)
+    except Exception as e:
+        print(f"Erro ao carregar logo mestre: {e}")
+        master = create_fallback_logo(logo_text, source_palette)
+        master_image = await load_logo_image_async(master)
+    
+    if palette != source_palette:
+        try:
+            master_image = await asyncio.to_thread(recolor_image_to_palette, master_image, palette)
+            master = logo_to_data_url(master_image)
+        except Exception as e:
+            print(f"Erro ao recolorir logo mestre: {e}")
+            master = create_fallback_logo(logo_text, palette)
+            master_image = await load_logo_image_async(master)
+    
+    try:
+        derivatives = await asyncio.to_thread(create_logo_derivatives, master_image, brand_text, palette)
+    except Exception as e:
+        print(f"Erro ao gerar variações do logo: {e}")
+        derivatives = {}
+    
+    variations = [master]
+    for variation_type in LOGO_VARIATION_TYPES[1:]:
+        if variation_type in derivatives:
+            variations.append(logo_to_data_url(derivatives[variation_type]))
+        else:
+            # Fallback para logo simples apenas nesta variação
+            variations.append(create_fallback_logo(logo_text, palette))
+    return variations
 
 async def save_curated_asset(project_id: str, brief_id: str, asset_data: Dict[str, Any], asset_type: str) -> str:
     """Salva um asset curado no banco de dados"""
@@ -857,6 +3848,7 @@ def generate_brand_kit_components(curated_assets: List[Dict[str, Any]], brand_na
     
     return kit_components
 
+@memoize_result("local_strategic_analysis")
 def analyze_strategic_elements(text: str, keywords: List[str], attributes: List[str]) -> Dict[str, Any]:
     """Analisa elementos estratégicos do briefing"""
     
@@ -1051,6 +4043,9 @@ async def generate_visual_concept_data(
     """Gera dados dos conceitos visuais baseados na análise estratégica"""
     
     concepts = []
+    concept_tasks = []
+    # Um logo mestre por texto, compartilhado (e recolorido) entre os conceitos
+    master_logos: Dict[str, Tuple[asyncio.Task, List[str]]] = {}
     
     # Base de fontes por estilo
     font_combinations = {
@@ -1116,21 +4111,9 @@ async def generate_visual_concept_data(
         
         color_palette = color_palettes[i % len(color_palettes)]
         
-        # Gerar logótipos usando mock logo generation
-        logo_variations = []
         # Usar iniciais dos keywords para o texto do logótipo
         logo_text = "".join(word[0] for word in keywords[:2]) if keywords else f"C{i+1}"
-
-        # Gerar 4 variações para cada conceito usando DALL-E
-        for variation in range(4):
-            try:
-                logo_b64 = await generate_logo_with_dalle(logo_text, color_palette, attributes)
-                logo_variations.append(logo_b64)
-            except Exception as e:
-                print(f"Erro ao gerar variação {variation} do logo: {e}")
-                # Fallback para logo simples
-                logo_b64 = create_fallback_logo(logo_text, color_palette)
-                logo_variations.append(logo_b64)
+        brand_text = " ".join(keywords[:2]).title() if keywords else f"Conceito {i+1}"
         
         # Gerar elementos gráficos (placeholders)
         graphic_elements = [
@@ -1138,66 +4121,100 @@ async def generate_visual_concept_data(
             f"https://via.placeholder.com/100x100/{''.join(color_palette[1].split('#'))}/FFFFFF?text=Element+2"
         ]
         
-        # Gerar rationale estratégico usando GPT-4
-        try:
-            personality_str = ', '.join(strategic_analysis.get('personality_traits', [])[:2])
-            values_str = ', '.join(strategic_analysis.get('values', [])[:2])
-            
-            rationale_prompt = f"""
-            Crie um rationale estratégico profissional (máximo 100 palavras) para o Conceito {i+1} de uma marca que:
-            - Possui traços de personalidade: {personality_str}
-            - Reflete os valores: {values_str}
-            - Estilo: {'contemporâneo' if style_preferences['traditional_contemporary'] > 50 else 'clássico'}
-            - Abordagem: {'criativa' if style_preferences['corporate_creative'] > 60 else 'corporativa'}
-            
-            O rationale deve explicar como o conceito visual conecta com a estratégia da marca.
-            """
-            
-            rationale = await generate_text_with_gpt4(rationale_prompt, max_tokens=150, temperature=0.6)
-        except Exception as e:
-            print(f"Erro ao gerar rationale com GPT-4: {e}")
-            # Fallback para versão simples
-            personality_str = ', '.join(strategic_analysis.get('personality_traits', [])[:2])
-            values_str = ', '.join(strategic_analysis.get('values', [])[:2])
-            
-            rationale = f"Conceito {i+1} combina {personality_str} com elementos visuais que refletem {values_str}. "
-            if style_preferences['traditional_contemporary'] > 50:
-                rationale += "Design contemporâneo com linhas limpas e tipografia moderna. "
-            else:
-                rationale += "Abordagem clássica com elementos tradicionais refinados. "
-            
-            if style_preferences['corporate_creative'] > 60:
-                rationale += "Expressão criativa balanceada com profissionalismo."
-            else:
-                rationale += "Foco em credibilidade e confiança institucional."
-        
         # Gerar prompt para Stable Diffusion (simulado)
         style_prompt = f"logo design, {style_base} style, {', '.join(keywords[:3])}, "
         style_prompt += f"color palette {' '.join(color_palette[:3])}, minimalist, professional, vector art"
         
         concept = {
             'id': concept_id,
-            'logo_variations': logo_variations,
+            'logo_variations': [],
+            'logo_variation_types': LOGO_VARIATION_TYPES,
             'color_palette': color_palette,
             'typography': typography,
             'graphic_elements': graphic_elements,
-            'rationale': rationale,
+            'rationale': '',
             'style_prompt': style_prompt
         }
         
         concepts.append(concept)
+        if logo_text not in master_logos:
+            master_logos[logo_text] = (
+                asyncio.ensure_future(generate_logo_variation(logo_text, color_palette, attributes, 0)),
+                color_palette
+            )
+        master_task, source_palette = master_logos[logo_text]
+        
+        # Logos do conceito dependem apenas do mestre; o rationale é independente
+        concept_tasks.append(asyncio.gather(
+            generate_concept_logos(master_task, source_palette, logo_text, brand_text, color_palette),
+            generate_concept_rationale(i, strategic_analysis, style_preferences)
+        ))
+    
+    # Executar todos os conceitos em paralelo; o semáforo global limita as chamadas à OpenAI
+    results = await asyncio.gather(*concept_tasks)
+    for concept, (logo_variations, rationale) in zip(concepts, results):
+        concept['logo_variations'] = logo_variations
+        concept['rationale'] = rationale
     
     return concepts
 
-async def generate_brand_kit_data(
-    brand_name: str,
-    selected_concept: Dict[str, Any],
-    strategic_analysis: Dict[str, Any]
-) -> Dict[str, Any]:
-    """Gera dados completos do kit de marca profissional"""
+async def generate_logo_variation(logo_text: str, color_palette: List[str], attributes: List[str], variation: int) -> str:
+    """Gera uma variação de logo, com fallback local apenas para esta variação"""
+    try:
+        return await generate_logo_with_dalle(logo_text, color_palette, attributes)
+    except Exception as e:
+        print(f"Erro ao gerar variação {variation} do logo: {e}")
+        # Fallback para logo simples
+        return create_fallback_logo(logo_text, color_palette)
+
+async def generate_concept_rationale(
+    index: int,
+    strategic_analysis: Dict[str, Any],
+    style_preferences: Dict[str, int]
+) -> str:
+    """Gera o rationale estratégico de um conceito usando GPT-4"""
+    try:
+        personality_str = ', '.join(strategic_analysis.get('personality_traits', [])[:2])
+        values_str = ', '.join(strategic_analysis.get('values', [])[:2])
+        
+        # Contexto comum aos 3 conceitos: as chamadas concorrentes são agrupadas numa só requisição
+        rationale_context = f"""Marca:
+        - Possui traços de personalidade: {personality_str}
+        - Reflete os valores: {values_str}
+        - Estilo: {'contemporâneo' if style_preferences['traditional_contemporary'] > 50 else 'clássico'}
+        - Abordagem: {'criativa' if style_preferences['corporate_creative'] > 60 else 'corporativa'}
+        
+        O rationale deve explicar como o conceito visual conecta com a estratégia da marca."""
+        rationale_instruction = f"Crie um rationale estratégico profissional (máximo 100 palavras) para o Conceito {index+1} da marca."
+        
+        rationale = await text_batcher.generate(
+            rationale_context, rationale_instruction, max_tokens=150, temperature=0.6,
+            tier="rationale", call_site="concept_rationale"
+        )
+    except Exception as e:
+        if not isinstance(e, StageDegradedError):
+            print(f"Erro ao gerar rationale com GPT-4: {e}")
+        # Fallback para versão simples
+        personality_str = ', '.join(strategic_analysis.get('personality_traits', [])[:2])
+        values_str = ', '.join(strategic_analysis.get('values', [])[:2])
+        
+        rationale = f"Conceito {index+1} combina {personality_str} com elementos visuais que refletem {values_str}. "
+        if style_preferences['traditional_contemporary'] > 50:
+            rationale += "Design contemporâneo com linhas limpas e tipografia moderna. "
+        else:
+            rationale += "Abordagem clássica com elementos tradicionais refinados. "
+        
+        if style_preferences['corporate_creative'] > 60:
+            rationale += "Expressão criativa balanceada com profissionalismo."
+        else:
+            rationale += "Foco em credibilidade e confiança institucional."
     
+    return rationale
+
+def build_brand_kit_assets(selected_concept: Dict[str, Any]) -> Dict[str, Any]:
+    """Monta o pacote de assets (logos, cores, fontes, mockups) do conceito selecionado"""
     # Substituir por dados reais do conceito selecionado
-    assets_package = {
+    return {
         "logos": [
             {"format": "PNG", "url": selected_concept['logo_variations'][0]},
             {"format": "PNG", "url": selected_concept['logo_variations'][1]},
@@ -1221,9 +4238,9 @@ async def generate_brand_kit_data(
         ]
     }
 
-    # Gerar conteúdo das diretrizes usando GPT-4
-    try:
-        guidelines_prompt = f"""
+def build_guidelines_prompt(brand_name: str, assets_package: Dict[str, Any], strategic_analysis: Dict[str, Any]) -> str:
+    """Monta o prompt do GPT-4 para as brand guidelines"""
+    return f"""
         Crie um brand guidelines profissional para a marca "{brand_name}" baseado nos seguintes elementos:
 
         PALETA DE CORES:
@@ -1247,37 +4264,45 @@ async def generate_brand_kit_data(
 
         Mantenha tom profissional e informativo.
         """
-        
-        guidelines_content = await generate_text_with_gpt4(guidelines_prompt, max_tokens=2000, temperature=0.3)
-    except Exception as e:
-        print(f"Erro ao gerar guidelines com GPT-4: {e}")
-        # Fallback para versão simples
-        guidelines_content = f"Brand Guidelines for {brand_name}\n\n"
-        guidelines_content += "--- Color Palette ---\n"
-        for color in assets_package['colors']:
-            guidelines_content += f"- {color['name']}: {color['hex']}\n"
-        guidelines_content += "\n--- Typography ---\n"
-        guidelines_content += f"- Title Font: {assets_package['fonts'][0]['name']}\n"
-        guidelines_content += f"- Body Font: {assets_package['fonts'][1]['name']}\n"
 
-    guidelines_b64 = base64.b64encode(guidelines_content.encode('utf-8')).decode()
-    guidelines_data_url = f"data:text/plain;charset=utf-8;base64,{guidelines_b64}"
+def build_fallback_guidelines(brand_name: str, assets_package: Dict[str, Any]) -> str:
+    """Guidelines simples usadas quando o GPT-4 falha"""
+    guidelines_content = f"Brand Guidelines for {brand_name}\n\n"
+    guidelines_content += "--- Color Palette ---\n"
+    for color in assets_package['colors']:
+        guidelines_content += f"- {color['name']}: {color['hex']}\n"
+    guidelines_content += "\n--- Typography ---\n"
+    guidelines_content += f"- Title Font: {assets_package['fonts'][0]['name']}\n"
+    guidelines_content += f"- Body Font: {assets_package['fonts'][1]['name']}\n"
+    return guidelines_content
 
-    # Gerar páginas das guidelines usando os logótipos gerados como previews
-    guidelines_pages = {
+def build_guidelines_pages(selected_concept: Dict[str, Any]) -> Dict[str, str]:
+    """Páginas das guidelines usando os logótipos gerados como previews"""
+    return {
         "cover": selected_concept['logo_variations'][0],
         "logo_usage": selected_concept['logo_variations'][1],
         "color_palette": "https://via.placeholder.com/150x200/?text=Colors",
         "typography": "https://via.placeholder.com/150x200/?text=Fonts",
         "applications": "https://via.placeholder.com/150x200/?text=Apps"
     }
+
+def assemble_brand_kit(
+    brand_name: str,
+    selected_concept: Dict[str, Any],
+    strategic_analysis: Dict[str, Any],
+    assets_package: Dict[str, Any],
+    guidelines_content: str
+) -> Dict[str, Any]:
+    """Monta o kit de marca final a partir dos assets e do texto das guidelines"""
+    guidelines_b64 = base64.b64encode(guidelines_content.encode('utf-8')).decode()
+    guidelines_data_url = f"data:text/plain;charset=utf-8;base64,{guidelines_b64}"
     
-    brand_kit = {
+    return {
         "brand_name": brand_name,
         "guidelines_pdf": guidelines_data_url,
         "assets_package": assets_package,
         "presentation_deck": "#",
-        "guidelines_pages": guidelines_pages,
+        "guidelines_pages": build_guidelines_pages(selected_concept),
         "generation_metadata": {
             "generated_at": datetime.now().isoformat(),
             "concept_used": selected_concept['id'],
@@ -1295,8 +4320,95 @@ async def generate_brand_kit_data(
             }
         }
     }
+
+async def generate_brand_kit_data(
+    brand_name: str,
+    selected_concept: Dict[str, Any],
+    strategic_analysis: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Gera dados completos do kit de marca profissional"""
+    assets_package = build_brand_kit_assets(selected_concept)
+
+    # Gerar conteúdo das diretrizes usando GPT-4
+    try:
+        guidelines_prompt = build_guidelines_prompt(brand_name, assets_package, strategic_analysis)
+        guidelines_content = await generate_text_with_gpt4(
+            guidelines_prompt, max_tokens=2000, temperature=0.3, tier="guidelines", call_site="brand_guidelines"
+        )
+    except Exception as e:
+        if not isinstance(e, StageDegradedError):
+            print(f"Erro ao gerar guidelines com GPT-4: {e}")
+        # Fallback para versão simples
+        guidelines_content = build_fallback_guidelines(brand_name, assets_package)
+
+    return assemble_brand_kit(brand_name, selected_concept, strategic_analysis, assets_package, guidelines_content)
+
+async def stream_brand_kit_events(request: "BrandKitRequest") -> AsyncIterator[str]:
+    """
+    Gera o kit de marca como Server-Sent Events: primeiro os assets, depois os trechos das
+    guidelines à medida que o GPT-4 os produz e, por fim, o kit completo (já salvo no banco)
+    """
+    def sse(event: str, data: Any) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    
+    try:
+        assets_package = build_brand_kit_assets(request.selected_concept)
+    except Exception as e:
+        yield sse("error", {"detail": f"Erro na geração do kit de marca: {str(e)}"})
+        return
+    
+    yield sse("assets", {
+        "brand_name": request.brand_name,
+        "assets_package": assets_package,
+        "guidelines_pages": build_guidelines_pages(request.selected_concept)
+    })
+    
+    guidelines_prompt = build_guidelines_prompt(request.brand_name, assets_package, request.strategic_analysis)
+    chunks = []
+    # O stream segue o mesmo prazo de /generate-brand-kit
+    with request_scope("generate_brand_kit", request.project_id) as degraded_stages:
+        try:
+            async for text in stream_text_with_gpt4(
+                guidelines_prompt, max_tokens=2000, temperature=0.3, tier="guidelines", call_site="brand_guidelines"
+            ):
+                chunks.append(text)
+                yield sse("token", {"text": text})
+        except Exception as e:
+            if not isinstance(e, StageDegradedError):
+                print(f"Erro ao gerar guidelines com GPT-4 (stream): {e}")
+            # Descartar o texto parcial e enviar a versão simples
+            if chunks:
+                yield sse("reset", {})
+            chunks = [build_fallback_guidelines(request.brand_name, assets_package)]
+            yield sse("token", {"text": chunks[0]})
     
-    return brand_kit
+    brand_kit = assemble_brand_kit(
+        request.brand_name, request.selected_concept, request.strategic_analysis, assets_package, "".join(chunks)
+    )
+    brand_kit["generation_metadata"]["service_mode"] = service_mode_report(degraded_stages)
+    save_final_brand_kit(request, brand_kit)
+    yield sse("complete", brand_kit)
+
+def save_final_brand_kit(request: "BrandKitRequest", brand_kit: Dict[str, Any]):
+    """Salva o kit de marca em final_brand_kits se houver project_id"""
+    if not request.project_id:
+        return
+    try:
+        final_kit_data = {
+            "brief_id": request.brief_id,
+            "project_id": request.project_id,
+            "brand_name": request.brand_name,
+            "final_brand_kit": brand_kit,
+            "concept_used": request.selected_concept,
+            "strategic_analysis": request.strategic_analysis,
+            "kit_preferences": request.kit_preferences,
+            "created_at": datetime.now().isoformat()
+        }
+        
+        supabase.table("final_brand_kits").insert(final_kit_data).execute()
+        
+    except Exception as db_error:
+        print(f"Erro ao salvar kit de marca final: {db_error}")
 
 # Modelos de dados
 class BrandKitRequest(BaseModel):
@@ -1370,8 +4482,14 @@ class FinalizeBrandKitRequest(BaseModel):
     brand_name: str
     kit_preferences: Dict[str, Any]
 
+class CachePurgeRequest(BaseModel):
+    content_type: Optional[str] = None  # "dalle_image", "gpt4_text", ...
+    key_prefix: Optional[str] = None
+    include_persistent: Optional[bool] = True
+
 # Endpoint para parsing de documentos
 @app.post("/parse-document")
+@memoize_endpoint("endpoint_parse_document")
 async def parse_document(
     file: UploadFile = File(...),
     project_id: Optional[str] = Form(None)
@@ -1483,36 +4601,37 @@ async def generate_brand_kit(request: BrandKitRequest):
     """
     try:
         # Gerar kit de marca completo
-        brand_kit = await generate_brand_kit_data(
-            request.brand_name,
-            request.selected_concept,
-            request.strategic_analysis
-        )
+        report_job_progress("brand_kit")
+        with request_scope("generate_brand_kit", request.project_id) as degraded_stages:
+            brand_kit = await generate_brand_kit_data(
+                request.brand_name,
+                request.selected_concept,
+                request.strategic_analysis
+            )
+        brand_kit["generation_metadata"]["service_mode"] = service_mode_report(degraded_stages)
         
         # Salvar no banco de dados se project_id fornecido
-        if request.project_id:
-            try:
-                final_kit_data = {
-                    "brief_id": request.brief_id,
-                    "project_id": request.project_id,
-                    "brand_name": request.brand_name,
-                    "final_brand_kit": brand_kit,
-                    "concept_used": request.selected_concept,
-                    "strategic_analysis": request.strategic_analysis,
-                    "kit_preferences": request.kit_preferences,
-                    "created_at": datetime.now().isoformat()
-                }
-                
-                supabase.table("final_brand_kits").insert(final_kit_data).execute()
-                
-            except Exception as db_error:
-                print(f"Erro ao salvar kit de marca final: {db_error}")
+        report_job_progress("saving")
+        save_final_brand_kit(request, brand_kit)
         
         return brand_kit
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro na geração do kit de marca: {str(e)}")
 
+@app.post("/generate-brand-kit/stream")
+async def generate_brand_kit_stream(request: BrandKitRequest):
+    """
+    Versão em streaming (SSE) de /generate-brand-kit. Eventos: "assets" (imediato),
+    "token" (trechos das guidelines), "reset" (descartar trechos após falha), "complete" (kit final)
+    e "error".
+    """
+    return StreamingResponse(
+        stream_brand_kit_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Endpoint para geração de conceitos visuais
 @app.post("/generate-visual-concepts")
 async def generate_visual_concepts(request: VisualConceptRequest):
@@ -1521,12 +4640,14 @@ async def generate_visual_concepts(request: VisualConceptRequest):
     """
     try:
         # Gerar conceitos visuais
-        concepts = await generate_visual_concept_data(
-            request.strategic_analysis,
-            request.keywords,
-            request.attributes,
-            request.style_preferences
-        )
+        report_job_progress("concepts")
+        with request_scope("generate_visual_concepts", request.project_id) as degraded_stages:
+            concepts = await generate_visual_concept_data(
+                request.strategic_analysis,
+                request.keywords,
+                request.attributes,
+                request.style_preferences
+            )
         
         # Preparar resultado
         visual_data = {
@@ -1539,11 +4660,13 @@ async def generate_visual_concepts(request: VisualConceptRequest):
                     'keywords_used': request.keywords,
                     'attributes_used': request.attributes,
                     'concepts_generated': len(concepts)
-                }
+                },
+                'service_mode': service_mode_report(degraded_stages)
             }
         }
         
         # Salvar no banco de dados se project_id fornecido
+        report_job_progress("saving")
         if request.project_id:
             try:
                 visual_concepts_data = {
@@ -1592,15 +4715,18 @@ async def strategic_analysis(request: StrategicAnalysisRequest):
         print(f"Attributes: {request.attributes}")
         
         # Realizar análise estratégica com GPT-4
+        degraded_stages = set()
         try:
-            strategic_data = await analyze_brief_with_gpt4(
-                request.text, 
-                request.keywords, 
-                request.attributes
-            )
+            with request_scope("strategic_analysis", request.project_id) as degraded_stages:
+                strategic_data = await analyze_brief_with_gpt4(
+                    request.text, 
+                    request.keywords, 
+                    request.attributes
+                )
         except Exception as e:
             print(f"Erro ao usar GPT-4, usando análise local: {e}")
-            strategic_data = analyze_strategic_elements(
+            strategic_data = await run_cache_io(
+                response_cache, analyze_strategic_elements,
                 request.text, 
                 request.keywords, 
                 request.attributes
@@ -1632,7 +4758,8 @@ async def strategic_analysis(request: StrategicAnalysisRequest):
                 print(f"Erro ao salvar análise estratégica: {db_error}")
                 # Não falhar se não conseguir salvar, apenas logar
         
-        return strategic_data
+        # Cópia: a análise pode ser a mesma instância guardada no índice de briefings similares
+        return {**strategic_data, "service_mode": service_mode_report(degraded_stages)}
         
     except HTTPException:
         raise
@@ -1647,6 +4774,7 @@ async def strategic_analysis(request: StrategicAnalysisRequest):
 
 # Endpoint aprimorado para análise de briefing
 @app.post("/analyze-brief")
+@memoize_endpoint("endpoint_analyze_brief")
 async def analyze_brief(request: BriefRequest):
     """
     Analisa um briefing de texto e extrai palavras-chave e atributos de marca.
@@ -1778,9 +4906,12 @@ async def generate_galaxy(request: GalaxyGenerationRequest):
             raise HTTPException(status_code=400, detail="Keywords ou attributes são necessários")
         
         # 1. Gerar metáforas visuais usando DALL-E 3
-        metaphors = await generate_visual_metaphors(request.keywords, request.attributes, request.demo_mode)
+        report_job_progress("metaphors")
+        with request_scope("generate_galaxy", request.project_id) as degraded_stages:
+            metaphors = await generate_visual_metaphors(request.keywords, request.attributes, request.demo_mode)
         
         # 2. Gerar paletas de cores
+        report_job_progress("palettes_and_fonts")
         color_palettes = generate_color_palettes(request.attributes)
         
         # 3. Gerar pares tipográficos
@@ -1795,11 +4926,13 @@ async def generate_galaxy(request: GalaxyGenerationRequest):
                 "keywords_used": request.keywords,
                 "attributes_used": request.attributes,
                 "generated_at": datetime.now().isoformat(),
-                "total_assets": len(metaphors) + len(color_palettes) + len(font_pairs)
+                "total_assets": len(metaphors) + len(color_palettes) + len(font_pairs),
+                "service_mode": service_mode_report(degraded_stages)
             }
         }
         
         # 5. Salvar no banco de dados se project_id e brief_id fornecidos
+        report_job_progress("saving")
         saved_successfully = False
         if request.project_id and request.brief_id:
             saved_successfully = await save_generated_assets(
@@ -1847,7 +4980,7 @@ async def blend_concepts(request: BlendConceptsRequest):
         images = []
         for url in request.image_urls:
             try:
-                img = download_image_from_url(url)
+                img = await download_image_from_url_async(url)
                 images.append(img)
             except Exception as e:
                 # Para esta implementação, vamos criar uma imagem placeholder se o download falhar
@@ -1899,9 +5032,9 @@ async def apply_style(request: ApplyStyleRequest):
     Fase 3: Aplica estilos (cores, filtros) a uma imagem
     """
     try:
-        # Baixar imagem
+        # Baixar imagem (ou decodificar data URL de um logo já gerado)
         try:
-            image = download_image_from_url(request.image_url)
+            image = await load_logo_image_async(request.image_url)
         except:
             # Criar placeholder se download falhar
             image = Image.new('RGB', (512, 512), (200, 200, 200))
@@ -1916,6 +5049,13 @@ async def apply_style(request: ApplyStyleRequest):
                 processed_image = apply_color_palette_to_image(processed_image, colors)
                 style_description = f"Paleta de cores aplicada: {', '.join(colors[:3])}"
         
+        elif request.style_type == "recolor":
+            # Troca de paleta sem nova geração: recoloração perceptual da imagem existente
+            colors = request.style_data.get("colors", [])
+            if colors:
+                processed_image = await asyncio.to_thread(recolor_image_to_palette, processed_image, colors)
+                style_description = f"Imagem recolorida para a paleta: {', '.join(colors[:3])}"
+        
         elif request.style_type == "filter":
             filter_type = request.style_data.get("filter", "modern")
             processed_image = apply_artistic_filter(processed_image, filter_type)
@@ -2038,6 +5178,497 @@ async def get_brand_kit(kit_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Fila de jobs em segundo plano para endpoints de geração longa (sem broker externo):
+# o pedido retorna um job_id na hora, workers do próprio processo executam a geração e o
+# estado/resultado fica numa fila persistente em SQLite
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", 100))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 24 * 3600))
+JOB_LONG_POLL_MAX = float(os.environ.get("JOB_LONG_POLL_MAX", 30))
+JOB_EVENTS_HEARTBEAT = float(os.environ.get("JOB_EVENTS_HEARTBEAT", 15))
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", ":memory:" if is_testing else "jobs.sqlite3")
+JOB_TERMINAL_STATUSES = ("succeeded", "failed")
+# Jobs em execução renovam updated_at a cada JOB_LEASE_SECONDS / 3; sem renovação por JOB_LEASE_SECONDS
+# o worker é considerado morto e o job volta à fila (até JOB_MAX_ATTEMPTS execuções)
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+class JobQueueFullError(Exception):
+    """Fila de jobs cheia"""
+
+class JobStore:
+    """Persistência dos jobs (fila, progresso e resultados) em SQLite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status)")
+        self._conn.commit()
+
+    def _row_to_job(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in ("payload", "progress", "result"):
+            job[field] = json.loads(job[field]) if job[field] is not None else None
+        return job
+
+    def create(self, kind: str, payload: Dict[str, Any], dedupe_key: str) -> Dict[str, Any]:
+        now = time.time()
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (job_id, kind, payload, dedupe_key, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?)
+                """,
+                (job_id, kind, json.dumps(payload), dedupe_key, now, now)
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row)
+
+    def find_active(self, dedupe_key: str) -> Optional[Dict[str, Any]]:
+        """Job ainda na fila ou em execução com o mesmo conteúdo"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                (dedupe_key,)
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def pending(self) -> List[str]:
+        """IDs dos jobs na fila, na ordem de chegada (usado na retomada após reinício)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_pending(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        for field in ("progress", "result"):
+            if field in fields:
+                fields[field] = json.dumps(fields[field])
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def mark_running(self, job_id: str):
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, updated_at = ? WHERE job_id = ?",
+                (now, now, job_id)
+            )
+            self._conn.commit()
+
+    def claim(self, job_id: str) -> bool:
+        """Marca o job como em execução só se ainda estiver na fila (atômico entre workers e processos)"""
+        with self._lock:
+            now = time.time()
+            cursor = self._conn.execute(
+                """
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, updated_at = ?
+                WHERE job_id = ? AND status = 'queued'
+                """,
+                (now, now, job_id)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def release(self, job_id: str):
+        """Devolve à fila um job interrompido pelo encerramento do worker (a tentativa não conta)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), updated_at = ? WHERE job_id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def heartbeat(self, job_ids: List[str]):
+        """Renova o lease dos jobs em execução neste worker"""
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status = 'running' AND job_id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+            self._conn.commit()
+
+    def requeue_stale(self, lease: float, max_attempts: int) -> List[str]:
+        """
+        Devolve à fila os jobs em execução sem heartbeat há mais de `lease` segundos (worker morto);
+        os que já esgotaram `max_attempts` são marcados como falha. Retorna os IDs devolvidos à fila.
+        """
+        with self._lock:
+            now = time.time()
+            cutoff = now - lease
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ?
+                WHERE status = 'running' AND updated_at < ? AND attempts >= ?
+                """,
+                (f"Job interrompido {max_attempts} vezes; não será retomado", now, now, cutoff, max_attempts)
+            )
+            rows = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'running' AND updated_at < ? ORDER BY created_at", (cutoff,)
+            ).fetchall()
+            job_ids = [row[0] for row in rows]
+            if job_ids:
+                self._conn.execute(
+                    f"UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running' AND job_id IN ({', '.join('?' * len(job_ids))})",
+                    (now, *job_ids)
+                )
+            self._conn.commit()
+        return job_ids
+
+    def purge_finished(self, older_than: float) -> int:
+        """Remove jobs concluídos há mais de `older_than` segundos"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+                (time.time() - older_than,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+# Job em execução na tarefa atual (fila e id), para report_job_progress
+current_job: contextvars.ContextVar[Optional[Tuple["JobQueue", str]]] = contextvars.ContextVar("current_job", default=None)
+
+class JobQueue:
+    """Pool limitado de workers asyncio consumindo a fila persistente"""
+
+    def __init__(self, store: JobStore, workers: int, max_pending: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._running: set = set()
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        self.handlers[kind] = handler
+
+    def ensure_started(self):
+        """
+        Inicia os workers no event loop atual, retomando os jobs da fila persistente. Jobs em execução
+        só são retomados quando o lease expira: podem pertencer a outro processo ainda vivo.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker_tasks:
+            return
+        self.stop()
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._changed = {}
+        self.store.requeue_stale(JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS)
+        for job_id in self.store.pending():
+            self._queue.put_nowait(job_id)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._worker_tasks.append(asyncio.create_task(self._keep_leases()))
+
+    def stop(self) -> List[asyncio.Task]:
+        """Cancela os workers; retorna as tarefas canceladas para quem quiser aguardá-las"""
+        tasks, self._worker_tasks = self._worker_tasks, []
+        for task in tasks:
+            task.cancel()
+        return tasks
+
+    async def close(self):
+        """Cancela os workers e aguarda o encerramento (jobs interrompidos são retomados no próximo início)"""
+        await asyncio.gather(*self.stop(), return_exceptions=True)
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Enfileira o job; pedidos idênticos ainda pendentes reaproveitam o job existente"""
+        if kind not in self.handlers:
+            raise ValueError(f"Tipo de job desconhecido: {kind}")
+        self.ensure_started()
+        dedupe_key = hashlib.sha256(f"{kind}:{json.dumps(payload, sort_keys=True)}".encode('utf-8')).hexdigest()
+        existing = self.store.find_active(dedupe_key)
+        if existing is not None:
+            return existing, False
+        if self.store.count_pending() >= self.max_pending:
+            raise JobQueueFullError(f"Fila de jobs cheia ({self.max_pending} pendentes)")
+        job = self.store.create(kind, payload, dedupe_key)
+        self._queue.put_nowait(job["job_id"])
+        return job, True
+
+    def _notify(self, job_id: str):
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def report_progress(self, job_id: str, stage: str, **data):
+        self.store.update(job_id, progress={"stage": stage, **data})
+        self._notify(job_id)
+
+    async def wait_for_change(self, job_id: str, timeout: float):
+        """Aguarda a próxima atualização do job (ou o timeout)"""
+        event = self._changed.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _keep_leases(self):
+        """Renova o lease dos jobs deste worker e retoma os abandonados por workers mortos"""
+        while True:
+            await asyncio.sleep(max(JOB_LEASE_SECONDS / 3, 1))
+            try:
+                self.store.heartbeat(list(self._running))
+                for job_id in self.store.requeue_stale(JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS):
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                print(f"Erro ao renovar leases dos jobs: {e}")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        # Outro worker (deste ou de outro processo) pode já ter pego o job
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        self._running.add(job_id)
+        self._notify(job_id)
+        token = current_job.set((self, job_id))
+        try:
+            result = await self.handlers[job["kind"]](job["payload"])
+            self.store.update(job_id, status="succeeded", result=jsonable_encoder(result), finished_at=time.time())
+        except asyncio.CancelledError:
+            # Encerramento do worker: o job volta à fila para o próximo início
+            self.store.release(job_id)
+            raise
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"Erro no job {job_id} ({job['kind']}): {detail}")
+            self.store.update(job_id, status="failed", error=str(detail), finished_at=time.time())
+        finally:
+            self._running.discard(job_id)
+            current_job.reset(token)
+            self._notify(job_id)
+
+def report_job_progress(stage: str, **data):
+    """Registra o progresso do job em execução (não faz nada fora de um job)"""
+    job = current_job.get()
+    if job is not None:
+        queue, job_id = job
+        queue.report_progress(job_id, stage, **data)
+
+job_store = JobStore(JOB_DB_PATH)
+job_queue = JobQueue(job_store, JOB_WORKERS, JOB_MAX_PENDING)
+job_queue.register("generate_galaxy", lambda payload: generate_galaxy(GalaxyGenerationRequest(**payload)))
+job_queue.register("generate_visual_concepts", lambda payload: generate_visual_concepts(VisualConceptRequest(**payload)))
+job_queue.register("generate_brand_kit", lambda payload: generate_brand_kit(BrandKitRequest(**payload)))
+
+def job_summary(job: Dict[str, Any], include_result: bool = True) -> Dict[str, Any]:
+    """Representação pública de um job"""
+    summary = {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "created_at": datetime.fromtimestamp(job["created_at"]).isoformat(),
+        "started_at": datetime.fromtimestamp(job["started_at"]).isoformat() if job["started_at"] else None,
+        "finished_at": datetime.fromtimestamp(job["finished_at"]).isoformat() if job["finished_at"] else None,
+        "status_url": f"/jobs/{job['job_id']}",
+        "events_url": f"/jobs/{job['job_id']}/events"
+    }
+    if include_result:
+        summary["result"] = job["result"]
+    return summary
+
+def submit_job(kind: str, request: BaseModel) -> JSONResponse:
+    """Enfileira o job e responde 202 com o job_id"""
+    try:
+        job, created = job_queue.submit(kind, jsonable_encoder(request))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content={**job_summary(job, include_result=False), "deduplicated": not created}
+    )
+
+@app.post("/jobs/generate-galaxy", status_code=202)
+async def submit_generate_galaxy_job(request: GalaxyGenerationRequest):
+    """Versão assíncrona de /generate-galaxy: retorna um job_id imediatamente"""
+    return submit_job("generate_galaxy", request)
+
+@app.post("/jobs/generate-visual-concepts", status_code=202)
+async def submit_generate_visual_concepts_job(request: VisualConceptRequest):
+    """Versão assíncrona de /generate-visual-concepts: retorna um job_id imediatamente"""
+    return submit_job("generate_visual_concepts", request)
+
+@app.post("/jobs/generate-brand-kit", status_code=202)
+async def submit_generate_brand_kit_job(request: BrandKitRequest):
+    """Versão assíncrona de /generate-brand-kit: retorna um job_id imediatamente"""
+    return submit_job("generate_brand_kit", request)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Estado e resultado do job. Com wait > 0 (segundos, até JOB_LONG_POLL_MAX) faz long-poll:
+    responde assim que o job terminar ou quando o tempo acabar.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    deadline = time.monotonic() + min(max(wait, 0), JOB_LONG_POLL_MAX)
+    while job["status"] not in JOB_TERMINAL_STATUSES and time.monotonic() < deadline:
+        await job_queue.wait_for_change(job_id, deadline - time.monotonic())
+        job = job_store.get(job_id)
+    return job_summary(job)
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    """Progresso do job como Server-Sent Events: "status" a cada mudança e "complete" ao final"""
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    async def events() -> AsyncIterator[str]:
+        last_sent = None
+        while True:
+            job = job_store.get(job_id)
+            if job["status"] in JOB_TERMINAL_STATUSES:
+                yield f"event: complete\ndata: {json.dumps(job_summary(job), ensure_ascii=False)}\n\n"
+                return
+            state = (job["status"], json.dumps(job["progress"]))
+            if state != last_sent:
+                last_sent = state
+                yield f"event: status\ndata: {json.dumps(job_summary(job, include_result=False), ensure_ascii=False)}\n\n"
+            else:
+                yield ": keepalive\n\n"
+            await job_queue.wait_for_change(job_id, JOB_EVENTS_HEARTBEAT)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Endpoints de observabilidade e administração do cache
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Estatísticas do cache por tipo de conteúdo"""
+    persistent_stats = None
+    if persistent_cache is not None:
+        try:
+            persistent_stats = persistent_cache.stats()
+        except Exception as e:
+            persistent_stats = {"error": str(e)}
+    
+    return {
+        "memory": {
+            "backend": content_cache.name,
+            **content_cache.summary(),
+            "limits": {
+                "max_entries": content_cache.max_entries,
+                "max_bytes": content_cache.max_bytes,
+                "ttl_seconds": content_cache.ttl
+            }
+        },
+        "persistent": persistent_stats,
+        "responses": response_cache.summary(),
+        "images": {
+            "source_bytes": image_bytes_cache.summary(),
+            "decoded": decoded_image_cache.summary()
+        },
+        "brief_similarity_index": {"entries": len(brief_similarity_index)},
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.post("/cache/purge")
+def purge_cache(request: CachePurgeRequest):
+    """Remove entradas do cache por tipo de conteúdo ou prefixo de chave"""
+    if not request.content_type and not request.key_prefix:
+        raise HTTPException(status_code=400, detail="Informe content_type ou key_prefix para limpar o cache")
+    
+    removed_memory = (content_cache.purge(request.content_type, request.key_prefix)
+                      + response_cache.purge(request.content_type, request.key_prefix))
+    removed_persistent = 0
+    if request.include_persistent and persistent_cache is not None:
+        try:
+            removed_persistent = persistent_cache.purge(request.content_type, request.key_prefix)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao limpar cache persistente: {str(e)}")
+    
+    return {
+        "success": True,
+        "removed": {
+            "memory": removed_memory,
+            "persistent": removed_persistent
+        }
+    }
+
+@app.get("/usage/openai")
+def get_openai_usage(
+    hours: float = 24,
+    order_by: str = "cost",
+    limit: int = 10,
+    project_id: Optional[str] = None
+):
+    """Pontos de chamada da OpenAI com maior custo estimado ou maior p95 de latência na janela"""
+    if order_by not in ("cost", "p95"):
+        raise HTTPException(status_code=400, detail="order_by deve ser 'cost' ou 'p95'")
+    
+    call_sites = usage_telemetry.top_call_sites(time.time() - hours * 3600, order_by, max(1, limit), project_id)
+    return {
+        "window_hours": hours,
+        "order_by": order_by,
+        "project_id": project_id,
+        "call_sites": call_sites,
+        "total_cost_usd": round(sum(site["cost_usd"] for site in call_sites), 6)
+    }
+
 @app.get("/")
 def read_root():
     return {
@@ -2080,7 +5711,12 @@ def health_check():
             "services": {
                 "api": "ok",
                 "supabase": supabase_status,
-                "yake": "ok" if keyword_extractor else "unavailable"
+                "yake": "ok" if keyword_extractor else "unavailable",
+                "openai_circuits": {model: breaker.snapshot() for model, breaker in circuit_breakers.items()},
+                "openai_rate_limits": {model: limiter.snapshot() for model, limiter in rate_limiters.items()},
+                "openai_routing": model_router.snapshot(),
+                "degraded_mode": degradation_controller.snapshot(),
+                "http_pool": http_pool.snapshot()
             },
             "endpoints": [
                 "/analyze-brief",
@@ -2089,7 +5725,8 @@ def health_check():
                 "/generate-galaxy",
                 "/blend-concepts",
                 "/apply-style",
-                "/generate-brand-kit"
+                "/generate-brand-kit",
+                "/generate-brand-kit/stream"
             ]
         }
     except Exception as e:
@@ -0,0 +1,323 @@
+"""
+Servidor local compatível com a API da OpenAI (chat completions e imagens) para testes de carga.
+
+Devolve respostas prontas com latência, taxa de erros e rajadas de 429 configuráveis, para que
+benchmarks exercitem o caminho real do AsyncOpenAI (rate limiter, circuit breaker, retries e pool HTTP)
+sem custo e sem depender da API real.
+
+Uso:
+    python openai_stub_server.py --port 8100 --profile realistic --error-rate 0.02 \\
+        --burst-interval 60 --burst-duration 5
+
+    # Em outro terminal, apontar a aplicação para o stub
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+A configuração também pode vir de variáveis OPENAI_STUB_* e ser alterada em execução com
+POST /stub/config; GET /stub/stats mostra contadores por endpoint e status.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from PIL import Image
+
+LATENCY_PROFILES = {
+    # perfil: {endpoint: (mediana em ms, p95 em ms)} de uma distribuição log-normal
+    "instant": {"chat": (0, 0), "images": (0, 0)},
+    "fast": {"chat": (300, 900), "images": (1500, 4000)},
+    "realistic": {"chat": (2500, 9000), "images": (9000, 18000)},
+    "slow": {"chat": (8000, 30000), "images": (20000, 45000)}
+}
+
+DEFAULT_CONFIG = {
+    "profile": "realistic",
+    "latency": {},            # sobrescreve o perfil: {"chat": [mediana, p95], "images": [mediana, p95]}
+    "error_rate": 0.0,        # fração de respostas 500
+    "rate_limit_rate": 0.0,   # fração de respostas 429 fora das rajadas
+    "burst_interval": 0.0,    # a cada N segundos...
+    "burst_duration": 0.0,    # ...todas as requisições recebem 429 durante M segundos
+    "retry_after": 1.0,       # valor do cabeçalho Retry-After nas respostas 429
+    "stream_chunks": 20,      # trechos por resposta em streaming
+    "seed": None
+}
+
+STUB_IMAGE_COLORS = ["#276749", "#2B6CB0", "#C05621", "#6B46C1", "#B83280", "#2D3748", "#D69E2E", "#319795"]
+STUB_IMAGE_SIZE = 256  # Imagens prontas pequenas: o custo medido deve ser o da rede, não o do PNG
+
+ANALYSIS_RESPONSE = {
+    "purpose": "Conectar pessoas a experiências autênticas e sustentáveis",
+    "values": ["Autenticidade", "Sustentabilidade", "Inovação"],
+    "personality_traits": ["Ousada", "Acolhedora", "Criativa", "Confiável"],
+    "target_audience": "Adultos urbanos de 25 a 40 anos que valorizam propósito e qualidade",
+    "competitive_advantage": "Combinação de design contemporâneo com impacto social mensurável",
+    "brand_voice": "Próxima, inspiradora e direta",
+    "creative_direction": "Formas orgânicas, paleta terrosa e tipografia geométrica"
+}
+
+def load_config_from_env() -> Dict[str, Any]:
+    """Configuração a partir das variáveis OPENAI_STUB_*"""
+    config = dict(DEFAULT_CONFIG)
+    config["profile"] = os.environ.get("OPENAI_STUB_PROFILE", config["profile"])
+    if os.environ.get("OPENAI_STUB_LATENCY"):
+        config["latency"] = json.loads(os.environ["OPENAI_STUB_LATENCY"])
+    for field in ("error_rate", "rate_limit_rate", "burst_interval", "burst_duration", "retry_after"):
+        value = os.environ.get(f"OPENAI_STUB_{field.upper()}")
+        if value:
+            config[field] = float(value)
+    if os.environ.get("OPENAI_STUB_STREAM_CHUNKS"):
+        config["stream_chunks"] = int(os.environ["OPENAI_STUB_STREAM_CHUNKS"])
+    if os.environ.get("OPENAI_STUB_SEED"):
+        config["seed"] = int(os.environ["OPENAI_STUB_SEED"])
+    return config
+
+def validate_config(changes: Any) -> Dict[str, Any]:
+    """Confere perfil, latências e campos numéricos antes de aplicar; ValueError descreve o problema"""
+    if not isinstance(changes, dict):
+        raise ValueError("A configuração deve ser um objeto JSON")
+    if "profile" in changes and changes["profile"] not in LATENCY_PROFILES:
+        raise ValueError(f"Perfil desconhecido '{changes['profile']}' (opções: {', '.join(sorted(LATENCY_PROFILES))})")
+    latency = changes.get("latency", {})
+    if not isinstance(latency, dict):
+        raise ValueError('latency deve ser {"chat": [mediana, p95], "images": [mediana, p95]}')
+    for endpoint, pair in latency.items():
+        if endpoint not in ("chat", "images"):
+            raise ValueError(f"Endpoint de latência desconhecido '{endpoint}' (opções: chat, images)")
+        if (not isinstance(pair, (list, tuple)) or len(pair) != 2
+                or not all(isinstance(ms, (int, float)) and not isinstance(ms, bool) and ms >= 0 for ms in pair)):
+            raise ValueError(f"latency.{endpoint} deve ser [mediana, p95] em ms, números não negativos")
+    for field in ("error_rate", "rate_limit_rate", "burst_interval", "burst_duration", "retry_after", "stream_chunks"):
+        value = changes.get(field, 0)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{field} deve ser um número não negativo")
+    if changes.get("seed") is not None and (not isinstance(changes["seed"], int) or isinstance(changes["seed"], bool)):
+        raise ValueError("seed deve ser um inteiro")
+    return changes
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def canned_chat_content(messages: List[Dict[str, Any]]) -> str:
+    """Resposta pronta no formato que cada ponto de chamada da aplicação espera"""
+    prompt = str(messages[-1].get("content", "")) if messages else ""
+    batch = re.search(r"array JSON com (\d+) strings", prompt)
+    if batch:
+        count = int(batch.group(1))
+        return json.dumps([f"Rationale simulado {i + 1}: o conceito traduz a estratégia da marca." for i in range(count)],
+                          ensure_ascii=False)
+    if "JSON" in prompt and '"purpose"' in prompt:
+        return json.dumps(ANALYSIS_RESPONSE, ensure_ascii=False)
+    return ("Conteúdo simulado pelo servidor local da OpenAI. " * 8).strip()
+
+class StubServer:
+    """Estado do servidor: configuração, sorteios, contadores e imagens prontas"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = {**DEFAULT_CONFIG, **validate_config(config)}
+        self.random = random.Random(self.config["seed"])
+        self.started_at = time.monotonic()
+        self.stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.images: Dict[str, bytes] = {}
+
+    def update(self, changes: Dict[str, Any]):
+        validate_config(changes)
+        self.config.update({key: value for key, value in changes.items() if key in DEFAULT_CONFIG})
+        if "seed" in changes:
+            self.random.seed(self.config["seed"])
+        if "burst_interval" in changes or "burst_duration" in changes:
+            self.started_at = time.monotonic()
+
+    def latency_seconds(self, endpoint: str) -> float:
+        """Sorteia a latência da distribuição log-normal definida por mediana e p95"""
+        median, p95 = self.config["latency"].get(endpoint) or LATENCY_PROFILES[self.config["profile"]][endpoint]
+        if median <= 0:
+            return 0.0
+        sigma = max(0.0, math.log(max(p95, median) / median) / 1.645)
+        return self.random.lognormvariate(math.log(median), sigma) / 1000
+
+    def in_burst(self) -> bool:
+        interval, duration = self.config["burst_interval"], self.config["burst_duration"]
+        return interval > 0 and duration > 0 and (time.monotonic() - self.started_at) % interval < duration
+
+    def failure_response(self, endpoint: str) -> Optional[JSONResponse]:
+        """Resposta de erro sorteada para esta requisição (None se ela deve ter sucesso)"""
+        if self.in_burst() or self.random.random() < self.config["rate_limit_rate"]:
+            self.stats[endpoint]["429"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": str(self.config["retry_after"])},
+                content={"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                   "param": None, "code": "rate_limit_exceeded"}}
+            )
+        if self.random.random() < self.config["error_rate"]:
+            self.stats[endpoint]["500"] += 1
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "The server had an error (stub)", "type": "server_error",
+                                   "param": None, "code": None}}
+            )
+        return None
+
+    def image_bytes(self, prompt: str) -> Tuple[str, bytes]:
+        """PNG pronto (cor escolhida pelo hash do prompt) e seu identificador"""
+        color = STUB_IMAGE_COLORS[int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(STUB_IMAGE_COLORS)]
+        image_id = color.lstrip("#").lower()
+        if image_id not in self.images:
+            buffer = BytesIO()
+            Image.new("RGB", (STUB_IMAGE_SIZE, STUB_IMAGE_SIZE), color).save(buffer, format="PNG")
+            self.images[image_id] = buffer.getvalue()
+        return image_id, self.images[image_id]
+
+def create_stub_app(config: Optional[Dict[str, Any]] = None) -> FastAPI:
+    """Cria o app do servidor local; cada instância tem estado próprio"""
+    stub = StubServer(config or {})
+    stub_app = FastAPI(title="OpenAI Stub Server", version="1.0.0")
+    stub_app.state.stub = stub
+
+    @stub_app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = stub.failure_response("chat")
+        latency = stub.latency_seconds("chat")
+        if failure is not None:
+            await asyncio.sleep(min(latency, 0.05))  # Erros voltam rápido, como na API real
+            return failure
+
+        model = body.get("model", "gpt-4-turbo-preview")
+        content = canned_chat_content(body.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in body.get("messages", []))
+        stub.stats["chat"]["200"] += 1
+
+        if body.get("stream"):
+            async def events():
+                # ~30% da latência até o primeiro token; o restante distribuído entre os trechos
+                chunks = max(1, stub.config["stream_chunks"])
+                await asyncio.sleep(latency * 0.3)
+                step = math.ceil(len(content) / chunks)
+                for start in range(0, len(content), step):
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(latency * 0.7 / chunks)
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        completion_tokens = estimate_tokens(content)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    @stub_app.post("/v1/images/generations")
+    async def image_generations(request: Request):
+        body = await request.json()
+        failure = stub.failure_response("images")
+        latency = stub.latency_seconds("images")
+        if failure is not None:
+            await asyncio.sleep(min(latency, 0.05))
+            return failure
+
+        await asyncio.sleep(latency)
+        prompt = body.get("prompt", "")
+        image_id, content = stub.image_bytes(prompt)
+        stub.stats["images"]["200"] += 1
+        if body.get("response_format") == "b64_json":
+            item = {"b64_json": base64.b64encode(content).decode()}
+        else:
+            item = {"url": str(request.url_for("stub_image", image_id=image_id))}
+        item["revised_prompt"] = prompt
+        return {"created": int(time.time()), "data": [item] * int(body.get("n", 1))}
+
+    @stub_app.get("/v1/stub-images/{image_id}.png", name="stub_image")
+    async def stub_image(image_id: str):
+        content = stub.images.get(image_id)
+        if content is None:
+            return JSONResponse(status_code=404, content={"error": {"message": "Imagem não encontrada"}})
+        return Response(content=content, media_type="image/png")
+
+    @stub_app.api_route("/v1/models", methods=["GET", "HEAD"])
+    async def list_models():
+        # Usado pelo pré-aquecimento de conexões da aplicação
+        models = sorted({"gpt-4-turbo-preview", "gpt-4o-mini", "gpt-3.5-turbo", "dall-e-3"})
+        return {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "stub"} for model in models]}
+
+    @stub_app.get("/stub/stats")
+    async def stub_stats():
+        return {
+            "config": stub.config,
+            "in_burst": stub.in_burst(),
+            "responses": {endpoint: dict(statuses) for endpoint, statuses in stub.stats.items()}
+        }
+
+    @stub_app.post("/stub/config")
+    async def update_stub_config(request: Request):
+        try:
+            stub.update(await request.json())
+        except ValueError as e:
+            # Configuração inválida não é aplicada (as requisições seguintes continuam com a anterior)
+            return JSONResponse(status_code=400, content={"error": {"message": str(e)}})
+        return {"config": stub.config}
+
+    return stub_app
+
+app = create_stub_app(load_config_from_env())
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a API da OpenAI para testes de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default=None)
+    parser.add_argument("--error-rate", type=float, default=None)
+    parser.add_argument("--rate-limit-rate", type=float, default=None)
+    parser.add_argument("--burst-interval", type=float, default=None)
+    parser.add_argument("--burst-duration", type=float, default=None)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    args = parse_args()
+    config = load_config_from_env()
+    for field in ("profile", "error_rate", "rate_limit_rate", "burst_interval", "burst_duration", "retry_after", "seed"):
+        if getattr(args, field) is not None:
+            config[field] = getattr(args, field)
+    print(f"Servidor OpenAI local em http://{args.host}:{args.port}/v1 com {config}")
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,429 @@
+import pytest
+import json
+from conftest import client
+from unittest.mock import patch, AsyncMock
+
+import main
+from main import (
+    ContentCache,
+    PersistentCache,
+    BriefSimilarityIndex,
+    normalize_brief_text,
+    analyze_brief_with_gpt4,
+    warm_cache_from_disk,
+    memoize_result,
+    response_cache,
+    get_cache_key,
+    get_cached_content,
+    set_cached_content,
+    content_cache
+)
+
+
+def test_cache_get_and_set():
+    """Test basic cache storage and retrieval"""
+    cache = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    cache.set("key1", "value1")
+
+    assert cache.get("key1") == "value1"
+    assert cache.get("missing") is None
+    assert len(cache) == 1
+
+
+def test_cache_expired_entry_is_dropped():
+    """Test that expired entries are not returned"""
+    cache = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    with patch('main.time.time', return_value=1000.0):
+        cache.set("key1", "value1")
+    with patch('main.time.time', return_value=1061.0):
+        assert cache.get("key1") is None
+    assert len(cache) == 0
+    assert cache.total_bytes == 0
+
+
+def test_cache_evicts_least_recently_used():
+    """Test LRU eviction when entry limit is exceeded"""
+    cache = ContentCache(max_entries=2, max_bytes=1024, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")  # "a" passa a ser o mais recente
+    cache.set("c", "3")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert cache.get("c") == "3"
+
+
+def test_cache_respects_byte_limit():
+    """Test eviction when total byte size is exceeded"""
+    cache = ContentCache(max_entries=100, max_bytes=100, ttl=60)
+    cache.set("a", "x" * 60)
+    cache.set("b", "y" * 60)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 60
+    assert cache.total_bytes <= 100
+
+
+def test_cache_skips_values_larger_than_limit():
+    """Test that oversized values are not stored"""
+    cache = ContentCache(max_entries=100, max_bytes=10, ttl=60)
+    cache.set("big", "z" * 50)
+
+    assert cache.get("big") is None
+    assert cache.total_bytes == 0
+
+
+def test_cache_compresses_large_strings():
+    """Test transparent compression of large string values"""
+    cache = ContentCache(max_entries=10, max_bytes=1024 * 1024, ttl=60, compress_threshold=100)
+    payload = "data:image/png;base64," + "A" * 10000
+    cache.set("img", payload)
+
+    assert cache.total_bytes < len(payload)
+    assert cache.get("img") == payload
+
+
+def test_cache_compresses_large_json_values():
+    """Test transparent compression of large dict values"""
+    cache = ContentCache(max_entries=10, max_bytes=1024 * 1024, ttl=60, compress_threshold=100)
+    payload = {"value": "texto " * 1000, "refresh_at": 123.0}
+    cache.set("gpt4_text_big", payload)
+
+    assert cache.total_bytes < len(json.dumps(payload))
+    assert cache.get("gpt4_text_big") == payload
+
+
+def test_cache_compression_keeps_values_json_cannot_round_trip():
+    """Test values with bytes, tuples or non-str keys are stored uncompressed and come back unchanged"""
+    cache = ContentCache(max_entries=10, max_bytes=1024 * 1024, ttl=60, compress_threshold=16)
+    envelope = {"value": b"x" * 100, "refresh_at": 1.0}
+    cache.set("dalle_image_bytes_abc", envelope)
+    cache.set("gpt4_text_tuple", {"items": ("a" * 20, "b" * 20)})
+    cache.set("gpt4_text_keys", {1: "c" * 20})
+
+    assert cache.get("dalle_image_bytes_abc") == envelope
+    assert cache.get("gpt4_text_tuple") == {"items": ("a" * 20, "b" * 20)}
+    assert cache.get("gpt4_text_keys") == {1: "c" * 20}
+
+
+def test_cache_sweep_expired():
+    """Test background sweep removes only expired entries"""
+    cache = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    with patch('main.time.time', return_value=1000.0):
+        cache.set("old", "1")
+    with patch('main.time.time', return_value=1050.0):
+        cache.set("new", "2")
+    with patch('main.time.time', return_value=1070.0):
+        removed = cache.sweep_expired()
+
+    assert removed == 1
+    assert len(cache) == 1
+
+
+def test_cache_overwrite_updates_size():
+    """Test that overwriting a key keeps byte accounting consistent"""
+    cache = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    cache.set("key", "x" * 100)
+    cache.set("key", "y" * 10)
+
+    assert cache.total_bytes == 10
+    assert cache.get("key") == "y" * 10
+
+
+def test_module_level_cache_helpers():
+    """Test get_cache_key / get_cached_content / set_cached_content"""
+    key = get_cache_key("gpt4_text", {"prompt": "olá", "max_tokens": 10})
+    assert key == get_cache_key("gpt4_text", {"max_tokens": 10, "prompt": "olá"})
+    assert key.startswith("gpt4_text_")
+
+    set_cached_content(key, "resultado")
+    assert get_cached_content(key) == "resultado"
+    content_cache.delete(key)
+    assert get_cached_content(key) is None
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    """Persistent cache backed by a temporary SQLite file"""
+    cache = PersistentCache(str(tmp_path / "cache.sqlite3"), {"gpt4_text": 60, "dalle_image": 30})
+    yield cache
+    cache.close()
+
+
+def test_persistent_cache_roundtrip(disk_cache):
+    """Test storing and loading JSON values from disk"""
+    disk_cache.set("gpt4_text_abc", "gpt4_text", {"purpose": "teste"})
+    content, remaining = disk_cache.get("gpt4_text_abc")
+
+    assert content == {"purpose": "teste"}
+    assert 0 < remaining <= 60
+
+
+def test_persistent_cache_ttl_per_content_type(disk_cache):
+    """Test per-type TTLs and that unknown types are not persisted"""
+    with patch('main.time.time', return_value=1000.0):
+        disk_cache.set("dalle_image_abc", "dalle_image", "https://example.com/a.png")
+        disk_cache.set("gpt4_text_abc", "gpt4_text", "texto")
+        disk_cache.set("other_abc", "other", "ignorado")
+    with patch('main.time.time', return_value=1040.0):
+        assert disk_cache.get("dalle_image_abc") is None
+        assert disk_cache.get("gpt4_text_abc")[0] == "texto"
+        assert disk_cache.get("other_abc") is None
+
+
+def test_persistent_cache_survives_reopen(tmp_path):
+    """Test that entries survive closing and reopening the database"""
+    path = str(tmp_path / "cache.sqlite3")
+    cache = PersistentCache(path, {"gpt4_text": 60})
+    cache.set("gpt4_text_abc", "gpt4_text", "texto")
+    cache.close()
+
+    reopened = PersistentCache(path, {"gpt4_text": 60})
+    assert reopened.get("gpt4_text_abc")[0] == "texto"
+    reopened.close()
+
+
+def test_read_through_from_disk_tier(disk_cache):
+    """Test that a memory miss is served from disk and promoted to memory"""
+    memory = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    disk_cache.set("gpt4_text_abc", "gpt4_text", "texto")
+
+    with patch.object(main, 'content_cache', memory), patch.object(main, 'persistent_cache', disk_cache):
+        assert get_cached_content("gpt4_text_abc") == "texto"
+        assert memory.get("gpt4_text_abc") == "texto"
+
+        set_cached_content("gpt4_text_def", "novo")
+        assert disk_cache.get("gpt4_text_def")[0] == "novo"
+
+
+def test_warm_start_loads_hottest_entries(disk_cache):
+    """Test warm start preloads the most accessed entries"""
+    memory = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    disk_cache.set("gpt4_text_cold", "gpt4_text", "frio")
+    disk_cache.set("gpt4_text_hot", "gpt4_text", "quente")
+    disk_cache.get("gpt4_text_hot")
+    disk_cache.get("gpt4_text_hot")
+
+    with patch.object(main, 'content_cache', memory), patch.object(main, 'persistent_cache', disk_cache):
+        assert warm_cache_from_disk(limit=1) == 1
+
+    assert memory.get("gpt4_text_hot") == "quente"
+    assert memory.get("gpt4_text_cold") is None
+
+
+BRIEF = (
+    "Estamos lançando uma marca de café sustentável para a geração Z. "
+    "Nosso produto é orgânico, premium e focado em sustentabilidade. "
+    "Queremos transmitir modernidade, inovação e consciência ambiental."
+)
+
+
+def test_normalize_brief_text():
+    """Test brief normalization strips case, accents and punctuation"""
+    assert normalize_brief_text("  Café,   SUSTENTÁVEL!\n") == "cafe sustentavel"
+
+
+def test_similarity_index_matches_typo_fix():
+    """Test a brief with a typo fixed is found as a near duplicate"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=10, ttl=60)
+    index.add(BRIEF, ["premium"], {"purpose": "café"})
+
+    result = index.lookup(BRIEF.replace("sustentabilidade", "sustentabilidde"), ["premium"])
+    assert result is not None
+    analysis, similarity = result
+    assert analysis == {"purpose": "café"}
+    assert 0.8 <= similarity < 1.0
+
+
+def test_similarity_index_matches_reordered_sentences():
+    """Test a brief with reordered sentences is found as a near duplicate"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=10, ttl=60)
+    index.add(BRIEF, [], {"purpose": "café"})
+    sentences = BRIEF.split(". ")
+    reordered = ". ".join([sentences[1], sentences[0], sentences[2]])
+
+    assert index.lookup(reordered, []) is not None
+
+
+def test_similarity_index_rejects_different_brief():
+    """Test unrelated briefs and different attributes do not match"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=10, ttl=60)
+    index.add(BRIEF, ["premium"], {"purpose": "café"})
+
+    assert index.lookup("Escritório de advocacia tradicional focado em clientes corporativos.", ["premium"]) is None
+    assert index.lookup(BRIEF, ["jovem"]) is None
+
+
+def test_similarity_index_isolates_stored_analysis():
+    """Test mutating the indexed or returned analysis does not corrupt later hits"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=10, ttl=60)
+    analysis = {"purpose": "café", "values": ["Qualidade"]}
+    index.add(BRIEF, [], analysis)
+    analysis["values"].append("alterado pelo chamador")
+
+    first, _ = index.lookup(BRIEF, [])
+    first["service_mode"] = {"mode": "normal"}
+    first["values"].append("alterado pelo endpoint")
+
+    assert index.lookup(BRIEF, [])[0] == {"purpose": "café", "values": ["Qualidade"]}
+
+
+def test_similarity_index_is_bounded():
+    """Test the index evicts the oldest entries beyond its limit"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=2, ttl=60)
+    index.add(BRIEF, [], {"n": 1})
+    index.add("Loja de roupas infantis com estilo divertido e colorido.", [], {"n": 2})
+    index.add("Clínica médica com atendimento humanizado e tecnológico.", [], {"n": 3})
+
+    assert len(index) == 2
+    assert index.lookup(BRIEF, []) is None
+
+
+@pytest.mark.asyncio
+async def test_analyze_brief_serves_approximate_hit():
+    """Test analyze_brief_with_gpt4 returns a flagged near-duplicate analysis"""
+    index = BriefSimilarityIndex(threshold=0.8, max_entries=10, ttl=60)
+    analysis = {"purpose": "Café sustentável", "values": ["Sustentabilidade"]}
+    mock_gpt = AsyncMock(return_value=json.dumps(analysis))
+
+    with patch('main.brief_similarity_index', index), patch('main.generate_text_with_gpt4', mock_gpt):
+        first = await analyze_brief_with_gpt4(BRIEF, ["café"], ["premium"])
+        second = await analyze_brief_with_gpt4(BRIEF.replace("geração", "geraçao"), ["café"], ["premium"])
+
+    assert first == analysis
+    assert mock_gpt.await_count == 1
+    assert second["approximate_cache_hit"] is True
+    assert second["purpose"] == "Café sustentável"
+    assert "approximate_cache_hit" not in analysis
+
+
+def test_cache_stats_per_content_type():
+    """Test hit/miss/expiration/eviction counters per content type"""
+    cache = ContentCache(max_entries=2, max_bytes=1024, ttl=60)
+    with patch('main.time.time', return_value=1000.0):
+        cache.set("gpt4_text_a", "texto")
+        cache.get("gpt4_text_a")
+        cache.get("gpt4_text_missing")
+        cache.set("dalle_image_a", "https://example.com/a.png")
+        cache.set("dalle_image_b", "https://example.com/b.png")  # remove gpt4_text_a (LRU)
+    with patch('main.time.time', return_value=1100.0):
+        cache.get("dalle_image_a")
+
+    stats = cache.stats()
+    assert stats["gpt4_text"]["hits"] == 1
+    assert stats["gpt4_text"]["misses"] == 1
+    assert stats["gpt4_text"]["evictions"] == 1
+    assert stats["gpt4_text"]["hit_rate"] == 0.5
+    assert stats["dalle_image"]["expirations"] == 1
+    assert stats["dalle_image"]["entries"] == 1
+    assert stats["dalle_image"]["bytes"] == len("https://example.com/b.png")
+
+
+def test_cache_purge_by_type_and_prefix():
+    """Test purging memory entries by content type or key prefix"""
+    cache = ContentCache(max_entries=10, max_bytes=1024, ttl=60)
+    cache.set("gpt4_text_aa", "1")
+    cache.set("gpt4_text_ab", "2")
+    cache.set("dalle_image_aa", "3")
+
+    assert cache.purge(key_prefix="gpt4_text_aa") == 1
+    assert cache.purge(content_type="dalle_image") == 1
+    assert len(cache) == 1
+    assert cache.total_bytes == 1
+
+
+def test_persistent_cache_purge_escapes_prefix(disk_cache):
+    """Test that LIKE wildcards in a key prefix are matched literally"""
+    disk_cache.set("gpt4_text_abc", "gpt4_text", "1")
+    disk_cache.set("gpt4_textXabc", "gpt4_text", "2")
+
+    assert disk_cache.purge(key_prefix="gpt4_text_") == 1
+    assert disk_cache.stats()["gpt4_text"]["entries"] == 1
+
+
+def test_cache_stats_endpoint(client):
+    """Test /cache/stats reports per-type counters"""
+    set_cached_content("gpt4_text_stats", "texto")
+    get_cached_content("gpt4_text_stats")
+
+    response = client.get("/cache/stats")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["memory"]["content_types"]["gpt4_text"]["hits"] >= 1
+    assert "limits" in data["memory"]
+    content_cache.delete("gpt4_text_stats")
+
+
+def test_cache_stats_endpoint_survives_unreachable_backend(client):
+    """Test /cache/stats reports a backend error instead of failing when Redis is down"""
+    unreachable = main.RedisCacheBackend("redis://127.0.0.1:1/0", "content", max_entries=10, max_bytes=1024, ttl=60,
+                                         socket_timeout=0.2)
+    with patch('main.response_cache', unreachable):
+        response = client.get("/cache/stats")
+
+    assert response.status_code == 200
+    responses = response.json()["responses"]
+    assert responses["entries"] == 0 and responses["bytes"] == 0
+    assert "error" in responses
+
+
+def test_cache_purge_endpoint(client):
+    """Test /cache/purge removes entries and validates input"""
+    set_cached_content("dalle_image_purge", "https://example.com/a.png")
+
+    response = client.post("/cache/purge", json={"content_type": "dalle_image"})
+    assert response.status_code == 200
+    assert response.json()["removed"]["memory"] >= 1
+    assert get_cached_content("dalle_image_purge") is None
+
+    response = client.post("/cache/purge", json={})
+    assert response.status_code == 400
+
+
+def test_analyze_brief_endpoint_is_memoized(client):
+    """Test repeated identical /analyze-brief requests skip recomputation and DB writes"""
+    payload = {"text": "Marca de cerâmica artesanal moderna para memoização de teste.", "project_id": "proj-memo"}
+    with patch('main.supabase') as mock_supabase:
+        mock_supabase.table.return_value.insert.return_value.execute.return_value.data = [{"id": "brief-memo"}]
+
+        first = client.post("/analyze-brief", json=payload)
+        second = client.post("/analyze-brief", json=payload)
+
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert mock_supabase.table.return_value.insert.call_count == 1
+
+
+def test_parse_document_endpoint_is_memoized_by_file_bytes(client):
+    """Test /parse-document is memoized on the uploaded file content"""
+    text = ("Nossa empresa foi fundada para oferecer consultoria de marca a pequenos negócios. "
+            "O público-alvo são profissionais jovens entre 25 e 35 anos. ") * 3
+
+    first = client.post("/parse-document", files={"file": ("brief.txt", text.encode("utf-8"), "text/plain")})
+    second = client.post("/parse-document", files={"file": ("brief.txt", text.encode("utf-8"), "text/plain")})
+    changed = client.post("/parse-document", files={"file": ("brief.txt", (text + " Extra.").encode("utf-8"), "text/plain")})
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert changed.headers["X-Cache"] == "MISS"
+
+
+def test_memoize_result_returns_independent_copies():
+    """Test memoized pure functions compute once and return copies"""
+    calls = []
+
+    @memoize_result("test_memo")
+    def compute(value):
+        calls.append(value)
+        return {"items": [value]}
+
+    first = compute("memo-copy")
+    first["items"].append("alterado")
+    second = compute("memo-copy")
+
+    assert calls == ["memo-copy"]
+    assert second == {"items": ["memo-copy"]}
+    response_cache.purge(content_type="test_memo")
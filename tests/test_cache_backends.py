@@ -0,0 +1,279 @@
+import asyncio
+import pytest
+import re
+import socketserver
+import threading
+import time
+from unittest.mock import AsyncMock, patch
+
+import main
+
+from main import (
+    ContentCache,
+    SQLiteCacheBackend,
+    RedisCacheBackend,
+    create_cache_backend,
+    encode_cache_value,
+    decode_cache_value
+)
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Minimal RESP server supporting the commands used by RedisCacheBackend"""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def write_bulk(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        else:
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            now = time.time()
+            for key in [k for k, (_, expires) in store.items() if expires <= now]:
+                del store[key]
+
+            if command == b"PING":
+                self.wfile.write(b"+PONG\r\n")
+            elif command == b"GET":
+                self.write_bulk(store.get(args[1], (None, 0))[0])
+            elif command == b"SET":
+                expires = float("inf")
+                if len(args) >= 5 and args[3].upper() == b"PX":
+                    expires = now + int(args[4]) / 1000
+                store[args[1]] = (args[2], expires)
+                self.wfile.write(b"+OK\r\n")
+            elif command == b"DEL":
+                removed = sum(1 for key in args[1:] if store.pop(key, None) is not None)
+                self.wfile.write(b":%d\r\n" % removed)
+            elif command == b"STRLEN":
+                self.wfile.write(b":%d\r\n" % len(store.get(args[1], (b"", 0))[0]))
+            elif command == b"SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode()
+                regex = re.compile("".join(
+                    ".*" if tok == "*" else re.escape(tok[-1]) for tok in re.findall(r"\\.|\*|[^*\\]", pattern)
+                ) + r"\Z")
+                keys = [k for k in store if regex.match(k.decode())]
+                self.wfile.write(b"*2\r\n")
+                self.write_bulk(b"0")
+                self.wfile.write(b"*%d\r\n" % len(keys))
+                for key in keys:
+                    self.write_bulk(key)
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+
+@pytest.fixture
+def fake_redis():
+    """Local Redis-protocol stand-in server"""
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.store = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+def test_encode_decode_cache_value():
+    """Test JSON serialization round-trips text, dicts and bytes"""
+    for value in ["texto", {"a": [1, 2]}, b"\x89PNG\x00"]:
+        assert decode_cache_value(encode_cache_value(value)) == value
+
+
+def test_encode_decode_nested_bytes():
+    """Test bytes inside dicts and lists (e.g. the stale-while-revalidate envelope) round-trip"""
+    envelope = {"value": b"\x89PNG\x00", "refresh_at": 1000.0, "parts": [b"a", {"b": b"c"}]}
+    assert decode_cache_value(encode_cache_value(envelope)) == envelope
+
+
+def test_create_cache_backend_selection(tmp_path):
+    """Test backend selection by name and fallback to memory"""
+    with patch('main.CACHE_SQLITE_PATH', str(tmp_path / "shared.sqlite3")):
+        assert isinstance(create_cache_backend("t", 10, 1024, 60, backend="sqlite"), SQLiteCacheBackend)
+    assert isinstance(create_cache_backend("t", 10, 1024, 60, backend="redis"), RedisCacheBackend)
+    assert isinstance(create_cache_backend("t", 10, 1024, 60, backend="memory"), ContentCache)
+    assert isinstance(create_cache_backend("t", 10, 1024, 60, backend="desconhecido"), ContentCache)
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    """Test two backend instances on the same file see each other's entries"""
+    path = str(tmp_path / "shared.sqlite3")
+    worker_a = SQLiteCacheBackend(path, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    worker_b = SQLiteCacheBackend(path, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    other_namespace = SQLiteCacheBackend(path, "responses", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+
+    worker_a.set("gpt4_text_abc", "texto")
+    worker_a.set("image_bytes_abc", b"\x89PNG")
+
+    assert worker_b.get("gpt4_text_abc") == "texto"
+    assert worker_b.get("image_bytes_abc") == b"\x89PNG"
+    assert other_namespace.get("gpt4_text_abc") is None
+    assert worker_b.stats()["gpt4_text"]["hits"] == 1
+
+
+def test_sqlite_backend_ttl_and_lru_eviction(tmp_path):
+    """Test expiry and least-recently-used eviction in the SQLite backend"""
+    cache = SQLiteCacheBackend(str(tmp_path / "shared.sqlite3"), "content", max_entries=2,
+                               max_bytes=1024 * 1024, ttl=60)
+    with patch('main.time.time', return_value=1000.0):
+        cache.set("gpt4_text_a", "1")
+    with patch('main.time.time', return_value=1001.0):
+        cache.set("gpt4_text_b", "2")
+    with patch('main.time.time', return_value=1002.0):
+        cache.get("gpt4_text_a")
+    with patch('main.time.time', return_value=1003.0):
+        cache.set("gpt4_text_c", "3")
+    with patch('main.time.time', return_value=1004.0):
+        assert cache.get("gpt4_text_b") is None
+        assert cache.get("gpt4_text_a") == "1"
+    with patch('main.time.time', return_value=1100.0):
+        assert cache.get("gpt4_text_c") is None
+
+    stats = cache.stats()["gpt4_text"]
+    assert stats["evictions"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_sqlite_backend_purge(tmp_path):
+    """Test purging the SQLite backend by content type and prefix"""
+    cache = SQLiteCacheBackend(str(tmp_path / "shared.sqlite3"), "content", max_entries=10,
+                               max_bytes=1024 * 1024, ttl=60)
+    cache.set("gpt4_text_aa", "1")
+    cache.set("gpt4_text_ab", "2")
+    cache.set("dalle_image_aa", "3")
+
+    assert cache.purge(key_prefix="gpt4_text_a") == 2
+    assert cache.purge(content_type="dalle_image") == 1
+    assert len(cache) == 0
+
+
+def test_redis_backend_roundtrip(fake_redis):
+    """Test the Redis backend against a local RESP stand-in"""
+    cache = RedisCacheBackend(fake_redis, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    other_worker = RedisCacheBackend(fake_redis, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+
+    cache.set("gpt4_text_abc", {"purpose": "teste"})
+    cache.set("image_bytes_abc", b"\x89PNG")
+
+    assert other_worker.get("gpt4_text_abc") == {"purpose": "teste"}
+    assert other_worker.get("image_bytes_abc") == b"\x89PNG"
+    assert other_worker.get("gpt4_text_missing") is None
+    assert cache.stats()["gpt4_text"]["entries"] == 1
+    assert other_worker.stats()["gpt4_text"]["hits"] == 1
+
+
+def test_redis_backend_purge_and_ttl(fake_redis):
+    """Test purge by type/prefix and per-entry TTL on the Redis backend"""
+    cache = RedisCacheBackend(fake_redis, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    cache.set("gpt4_text_aa", "1")
+    cache.set("gpt4_text_ab", "2")
+    cache.set("dalle_image_aa", "3")
+    cache.set("gpt4_text_short", "4", ttl=0.05)
+
+    assert cache.purge(key_prefix="gpt4_text_a") == 2
+    time.sleep(0.1)
+    assert cache.get("gpt4_text_short") is None
+    assert cache.purge(content_type="dalle_image") == 1
+    assert len(cache) == 0
+
+
+def test_redis_backend_usage_samples_sizes_in_one_round_trip(fake_redis):
+    """Test usage counts every key but sizes only a pipelined sample per content type"""
+    cache = RedisCacheBackend(fake_redis, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    cache.usage_sample_size = 2
+    for i in range(5):
+        cache.set(f"gpt4_text_{i}", "abc")
+    cache.set("dalle_image_a", "url")
+
+    with patch.object(cache, "_pipeline", wraps=cache._pipeline) as pipeline:
+        usage = cache.usage()
+
+    size = len(encode_cache_value("abc").encode('utf-8'))
+    assert usage["gpt4_text"] == {"entries": 5, "bytes": 5 * size}
+    assert usage["dalle_image"]["entries"] == 1
+    strlen_batches = [call.args[0] for call in pipeline.call_args_list if call.args[0][0][0] == "STRLEN"]
+    assert sorted(len(batch) for batch in strlen_batches) == [1, 2]
+
+
+def test_redis_backend_unavailable_is_a_miss():
+    """Test that an unreachable Redis server degrades to cache misses"""
+    cache = RedisCacheBackend("redis://127.0.0.1:1/0", "content", max_entries=10, max_bytes=1024, ttl=60,
+                              socket_timeout=0.2)
+    cache.set("gpt4_text_abc", "texto")
+
+    assert cache.get("gpt4_text_abc") is None
+    assert cache.stats()["gpt4_text"]["misses"] == 1
+
+
+def test_redis_backend_unavailable_delete_and_purge_do_not_raise():
+    """Test purge and delete degrade to no-ops while Redis is down"""
+    cache = RedisCacheBackend("redis://127.0.0.1:1/0", "content", max_entries=10, max_bytes=1024, ttl=60,
+                              socket_timeout=0.2)
+
+    assert cache.delete("gpt4_text_abc") is False
+    assert cache.purge(content_type="gpt4_text") == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_never_connects_on_event_loop():
+    """Test a disconnected backend misses immediately on the event loop and reconnects in a thread"""
+    cache = RedisCacheBackend("redis://127.0.0.1:1/0", "content", max_entries=10, max_bytes=1024, ttl=60)
+    connecting = threading.Event()
+
+    def slow_connect(*args, **kwargs):
+        connecting.set()
+        time.sleep(0.5)
+        raise OSError("timeout")
+
+    with patch('main.socket.create_connection', side_effect=slow_connect):
+        started = time.monotonic()
+        assert cache.get("gpt4_text_abc") is None
+        cache.set("gpt4_text_abc", "texto")
+        assert time.monotonic() - started < 0.2
+        assert connecting.wait(1)
+
+
+@pytest.mark.asyncio
+async def test_redis_commands_run_off_the_event_loop(fake_redis):
+    """Test a slow Redis does not block the event loop during get_or_compute"""
+    cache = RedisCacheBackend(fake_redis, "content", max_entries=10, max_bytes=1024 * 1024, ttl=60)
+    command = cache._command
+    ticks = 0
+
+    def slow_command(*args):
+        time.sleep(0.2)
+        return command(*args)
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    with patch.object(cache, "_command", side_effect=slow_command), \
+            patch('main.content_cache', cache), \
+            patch('main.persistent_cache', None):
+        task = asyncio.create_task(ticker())
+        assert await main.get_or_compute("gpt4_text_abc", AsyncMock(return_value="texto")) == "texto"
+        task.cancel()
+
+    assert ticks >= 10
+    assert cache.get("gpt4_text_abc")["value"] == "texto"
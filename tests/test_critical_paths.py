@@ -113,7 +113,7 @@ async def test_blend_concepts_endpoint(client):
         ]
         mock_supabase.table.return_value.select.return_value.in_.return_value.execute.return_value.data = mock_concepts
         
-        with patch('main.download_image_from_url') as mock_download:
+        with patch('main.download_image_from_url_async', new_callable=AsyncMock) as mock_download:
             from PIL import Image
             mock_image = Mock(spec=Image.Image)
             mock_download.return_value = mock_image
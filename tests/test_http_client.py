@@ -0,0 +1,118 @@
+import pytest
+import httpx
+from io import BytesIO
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+from main import HttpClientPool, parse_host_limits, fetch_image_bytes_async, download_image_from_url_async
+
+
+def _png_bytes(color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), color=color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_parse_host_limits():
+    """Test per-host connection limits parsing ignores malformed entries"""
+    assert parse_host_limits("api.openai.com=32, Images.Unsplash.com=8,invalido,x=") == {
+        "api.openai.com": 32,
+        "images.unsplash.com": 8
+    }
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_one_client_per_origin():
+    """Test requests to the same host share a client and other hosts get their own"""
+    pool = HttpClientPool()
+    first = pool.client_for("https://example.com/a.png")
+
+    assert pool.client_for("https://EXAMPLE.com/b.png?x=1") is first
+    assert pool.client_for("https://other.example.com/c.png") is not first
+    assert sorted(pool.clients) == ["https://example.com", "https://other.example.com"]
+    await pool.aclose()
+    assert pool.clients == {}
+
+
+def test_pool_closes_clients_replaced_by_loop_change():
+    """Test clients left behind by a previous event loop are closed with the pool"""
+    import asyncio
+    pool = HttpClientPool(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+
+    async def open_client():
+        return pool.client_for("https://example.com/a.png")
+
+    old = asyncio.run(open_client())
+    new = asyncio.run(open_client())
+    assert new is not old and not old.is_closed
+
+    asyncio.run(pool.aclose())
+    assert old.is_closed and new.is_closed
+    assert pool._retired == []
+
+
+@pytest.mark.asyncio
+async def test_pool_records_request_stats():
+    """Test per-host request and error counters"""
+    def handler(request):
+        if request.url.path == "/falha":
+            raise httpx.ConnectError("sem conexão", request=request)
+        return httpx.Response(200, content=b"ok")
+
+    pool = HttpClientPool(transport=httpx.MockTransport(handler))
+    assert (await pool.get("https://example.com/ok")).content == b"ok"
+    with pytest.raises(httpx.ConnectError):
+        await pool.get("https://example.com/falha")
+
+    assert pool.snapshot()["hosts"]["https://example.com"] == {"requests": 2, "errors": 1, "http2_responses": 0}
+    assert await pool.prewarm(["https://example.com/ok", "https://example.com/falha"]) == 1
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_image_download_uses_pool_and_cache():
+    """Test async image fetches go through the shared pool and reuse cached bytes"""
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, content=_png_bytes())
+
+    pool = HttpClientPool(transport=httpx.MockTransport(handler))
+    url = "https://example.com/pool-cached.png"
+    main.image_bytes_cache.delete(main.image_bytes_cache_key(url))
+    with patch('main.http_pool', pool), patch('main.requests.get') as mock_get:
+        image = await download_image_from_url_async(url)
+        await fetch_image_bytes_async(url)
+
+    assert image.size == (8, 8)
+    assert calls == [url]
+    mock_get.assert_not_called()
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_async_image_download_error_raises_http_exception():
+    """Test HTTP errors surface as 400 like the sync download"""
+    pool = HttpClientPool(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    with patch('main.http_pool', pool):
+        with pytest.raises(main.HTTPException) as exc_info:
+            await download_image_from_url_async("https://example.com/missing-pool.png")
+
+    assert exc_info.value.status_code == 400
+    await pool.aclose()
+
+
+def test_lifespan_binds_openai_client_to_shared_pool():
+    """Test the OpenAI SDK uses the pooled client while the app runs and the pool closes on shutdown"""
+    original = main.AsyncOpenAI(api_key="test-key")
+    with patch('main.openai_client', original):
+        with TestClient(main.app) as client:
+            assert main.openai_client is not original
+            assert main.openai_client._client is main.http_pool.clients["https://api.openai.com"]
+            assert "http_pool" in client.get("/health").json()["services"]
+
+        assert main.openai_client is original
+        assert main.http_pool.clients == {}
@@ -10,7 +10,14 @@ from main import (
     blend_images,
     apply_color_palette_to_image,
     apply_artistic_filter,
-    image_to_base64
+    image_to_base64,
+    ContentCache,
+    remove_logo_background,
+    crop_logo_icon,
+    create_logo_derivatives,
+    rgb_to_lab,
+    lab_to_rgb,
+    recolor_image_to_palette
 )
 
 def test_create_test_image():
@@ -381,4 +388,126 @@ def test_download_image_from_url_error(mock_get):
         assert result is None or isinstance(result, Image.Image)
     except Exception:
         # Exception is acceptable for error cases
-        pass
\ No newline at end of file
+        pass
+
+
+@pytest.fixture
+def empty_image_caches():
+    """Isolated source-image caches"""
+    bytes_cache = ContentCache(max_entries=10, max_bytes=10 * 1024 * 1024, ttl=60)
+    decoded_cache = ContentCache(max_entries=10, max_bytes=10 * 1024 * 1024, ttl=60)
+    with patch('main.image_bytes_cache', bytes_cache), patch('main.decoded_image_cache', decoded_cache):
+        yield bytes_cache, decoded_cache
+
+
+def _png_response(color='orange'):
+    mock_response = Mock()
+    img_bytes = io.BytesIO()
+    Image.new('RGB', (64, 64), color=color).save(img_bytes, format='PNG')
+    mock_response.content = img_bytes.getvalue()
+    return mock_response
+
+
+def test_download_image_reuses_cached_bytes(empty_image_caches):
+    """Test repeated downloads of the same URL hit the network once"""
+    with patch('main.requests.get', return_value=_png_response()) as mock_get:
+        first = download_image_from_url("https://example.com/cached.png")
+        second = download_image_from_url("https://example.com/cached.png")
+
+    assert mock_get.call_count == 1
+    assert first.mode == 'RGBA'
+    assert first.tobytes() == second.tobytes()
+
+
+def test_decoded_images_are_shared_by_content_hash(empty_image_caches):
+    """Test identical content under different URLs is decoded once"""
+    _, decoded_cache = empty_image_caches
+    with patch('main.requests.get', return_value=_png_response()):
+        download_image_from_url("https://example.com/a.png")
+        download_image_from_url("https://example.com/b.png")
+
+    assert len(decoded_cache) == 1
+
+
+def test_download_image_returns_independent_copies(empty_image_caches):
+    """Test callers can modify the returned image without corrupting the cache"""
+    with patch('main.requests.get', return_value=_png_response('orange')):
+        first = download_image_from_url("https://example.com/copy.png")
+        first.paste((0, 0, 255, 255), (0, 0, 64, 64))
+        second = download_image_from_url("https://example.com/copy.png")
+
+    assert second.getpixel((0, 0)) != (0, 0, 255, 255)
+
+
+def _logo_on_white():
+    image = Image.new('RGB', (128, 128), 'white')
+    ImageDraw.Draw(image).ellipse([40, 32, 88, 80], fill=(30, 60, 200))
+    return image
+
+
+def test_remove_logo_background_keeps_soft_edges():
+    """Test the background becomes transparent while edge pixels stay partially opaque"""
+    alpha = np.array(remove_logo_background(_logo_on_white().filter(ImageFilter.GaussianBlur(2))).getchannel('A'))
+
+    assert alpha[0, 0] == 0
+    assert alpha[56, 64] == 255
+    assert ((alpha > 0) & (alpha < 255)).any()
+
+
+def test_crop_logo_icon_centers_symbol():
+    """Test the icon crop removes empty space around the symbol"""
+    icon = crop_logo_icon(remove_logo_background(_logo_on_white()), size=100)
+    bbox = icon.getchannel('A').getbbox()
+
+    assert icon.size == (100, 100)
+    assert bbox[2] - bbox[0] >= 78
+    assert abs((bbox[0] + bbox[2]) / 2 - 50) <= 1
+
+
+def test_create_logo_derivatives_are_distinct():
+    """Test the derivative engine returns genuinely different variations"""
+    palette = ['#2D3748', '#4A5568', '#E2E8F0', '#F7FAFC', '#1A202C']
+    derivatives = create_logo_derivatives(_logo_on_white(), "Eco Vida", palette)
+
+    assert list(derivatives) == ["monochrome", "inverted", "transparent", "icon", "horizontal"]
+    encoded = {name: image_to_base64(image) for name, image in derivatives.items()}
+    assert len(set(encoded.values())) == 5
+    assert derivatives["inverted"].getpixel((0, 0)) == (0x1A, 0x20, 0x2C)
+    assert derivatives["horizontal"].width > derivatives["horizontal"].height
+
+
+def test_lab_conversion_round_trip():
+    """Test sRGB -> CIELAB -> sRGB preserves colors"""
+    colors = np.array([[0, 0, 0], [255, 255, 255], [30, 60, 200], [212, 175, 55]], dtype=np.uint8)
+    lab = rgb_to_lab(colors)
+
+    assert abs(lab[1, 0] - 100) < 0.01
+    assert np.abs(lab_to_rgb(lab).astype(int) - colors).max() <= 1
+
+
+def test_recolor_image_to_palette_maps_clusters_by_luminance():
+    """Test logo colors move to the palette while edges stay blended"""
+    logo = _logo_on_white().filter(ImageFilter.GaussianBlur(1))
+    result = recolor_image_to_palette(logo, ['#F0FFF4', '#276749'])
+    pixels = np.array(result.convert('RGB')).astype(int)
+
+    assert np.abs(pixels[56, 64] - [0x27, 0x67, 0x49]).max() <= 10
+    assert np.abs(pixels[0, 0] - [0xF0, 0xFF, 0xF4]).max() <= 10
+    edge_row = pixels[56, 30:45, 1]
+    assert len(np.unique(edge_row)) > 2
+
+
+def test_apply_style_recolor(client):
+    """Test /apply-style re-skins a data URL logo without any download"""
+    logo = "data:image/png;base64," + image_to_base64(_logo_on_white())
+    with patch('main.requests.get') as mock_get:
+        response = client.post("/apply-style", json={
+            "image_url": logo,
+            "style_data": {"colors": ['#F0FFF4', '#276749']},
+            "style_type": "recolor"
+        })
+
+    assert response.status_code == 200
+    mock_get.assert_not_called()
+    styled = Image.open(io.BytesIO(base64.b64decode(response.json()["styled_image"].split(",", 1)[1])))
+    assert np.abs(np.array(styled.convert('RGB'))[56, 64].astype(int) - [0x27, 0x67, 0x49]).max() <= 10
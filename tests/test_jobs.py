@@ -0,0 +1,218 @@
+import pytest
+import pytest_asyncio
+import asyncio
+import json
+from unittest.mock import patch
+
+import main
+from main import JobStore, JobQueue, JobQueueFullError, report_job_progress
+
+
+@pytest_asyncio.fixture
+async def queue():
+    """Job queue backed by an in-memory store"""
+    job_queue = JobQueue(JobStore(":memory:"), workers=2, max_pending=10)
+    yield job_queue
+    await job_queue.close()
+
+
+async def wait_until_finished(job_queue, job_id, timeout=2):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while job_queue.store.get(job_id)["status"] not in main.JOB_TERMINAL_STATUSES:
+        assert asyncio.get_running_loop().time() < deadline
+        await job_queue.wait_for_change(job_id, 0.1)
+    return job_queue.store.get(job_id)
+
+
+@pytest.mark.asyncio
+async def test_job_runs_in_background_and_stores_result(queue):
+    """Test submit returns immediately and the worker stores the result"""
+    release = asyncio.Event()
+
+    async def handler(payload):
+        report_job_progress("working", step=1)
+        await release.wait()
+        return {"echo": payload["value"]}
+
+    queue.register("echo", handler)
+    job, created = queue.submit("echo", {"value": 42})
+
+    assert created
+    assert job["status"] == "queued"
+    await asyncio.sleep(0.01)
+    running = queue.store.get(job["job_id"])
+    assert running["status"] == "running"
+    assert running["progress"] == {"stage": "working", "step": 1}
+
+    release.set()
+    finished = await wait_until_finished(queue, job["job_id"])
+    assert finished["status"] == "succeeded"
+    assert finished["result"] == {"echo": 42}
+
+
+@pytest.mark.asyncio
+async def test_identical_pending_jobs_are_deduplicated(queue):
+    """Test a retried submission reuses the pending job instead of duplicating work"""
+    calls = 0
+
+    async def handler(payload):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return payload
+
+    queue.register("echo", handler)
+    first, _ = queue.submit("echo", {"value": 1})
+    second, created = queue.submit("echo", {"value": 1})
+
+    assert not created
+    assert second["job_id"] == first["job_id"]
+    await wait_until_finished(queue, first["job_id"])
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_job_records_error(queue):
+    """Test handler exceptions mark the job as failed"""
+    async def handler(payload):
+        raise main.HTTPException(status_code=400, detail="Keywords ou attributes são necessários")
+
+    queue.register("broken", handler)
+    job, _ = queue.submit("broken", {})
+    finished = await wait_until_finished(queue, job["job_id"])
+
+    assert finished["status"] == "failed"
+    assert finished["error"] == "Keywords ou attributes são necessários"
+
+
+@pytest.mark.asyncio
+async def test_queue_rejects_when_full():
+    """Test the pending-job limit is enforced"""
+    job_queue = JobQueue(JobStore(":memory:"), workers=1, max_pending=1)
+    blocker = asyncio.Event()
+
+    async def handler(payload):
+        await blocker.wait()
+
+    job_queue.register("slow", handler)
+    job_queue.submit("slow", {"n": 1})
+    with pytest.raises(JobQueueFullError):
+        job_queue.submit("slow", {"n": 2})
+    await job_queue.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_jobs_resume_after_restart(tmp_path):
+    """Test queued and interrupted jobs are picked up again from the persistent store"""
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    queued = store.create("echo", {"value": "a"}, "key-a")
+    interrupted = store.create("echo", {"value": "b"}, "key-b")
+    store.mark_running(interrupted["job_id"])
+
+    job_queue = JobQueue(JobStore(path), workers=1, max_pending=10)
+
+    async def handler(payload):
+        return payload["value"]
+
+    job_queue.register("echo", handler)
+    # Lease expirado: o worker que executava o job morreu
+    with patch('main.JOB_LEASE_SECONDS', 0):
+        job_queue.ensure_started()
+
+    assert (await wait_until_finished(job_queue, queued["job_id"]))["result"] == "a"
+    resumed = await wait_until_finished(job_queue, interrupted["job_id"])
+    assert resumed["result"] == "b"
+    assert resumed["attempts"] == 2
+    await job_queue.close()
+
+
+@pytest.mark.asyncio
+async def test_running_job_of_live_worker_is_not_rerun(tmp_path):
+    """Test a restart does not re-run a job another worker holds a fresh lease on"""
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    job = store.create("echo", {"value": "a"}, "key-a")
+    assert store.claim(job["job_id"])
+    assert not JobStore(path).claim(job["job_id"])
+
+    calls = 0
+
+    async def handler(payload):
+        nonlocal calls
+        calls += 1
+
+    job_queue = JobQueue(JobStore(path), workers=1, max_pending=10)
+    job_queue.register("echo", handler)
+    job_queue.ensure_started()
+    await asyncio.sleep(0.05)
+
+    assert calls == 0
+    assert store.get(job["job_id"])["status"] == "running"
+    await job_queue.close()
+
+
+def test_stale_job_fails_after_max_attempts():
+    """Test a job that keeps killing its worker is not retried on every boot"""
+    store = JobStore(":memory:")
+    job = store.create("echo", {}, "key")
+    for _ in range(main.JOB_MAX_ATTEMPTS):
+        store.mark_running(job["job_id"])
+
+    assert store.requeue_stale(lease=-1, max_attempts=main.JOB_MAX_ATTEMPTS) == []
+    failed = store.get(job["job_id"])
+    assert failed["status"] == "failed"
+    assert failed["error"]
+
+
+@pytest.mark.asyncio
+async def test_close_returns_running_job_to_queue(tmp_path):
+    """Test a graceful shutdown hands the interrupted job to the next start without spending an attempt"""
+    path = str(tmp_path / "jobs.sqlite3")
+    job_queue = JobQueue(JobStore(path), workers=1, max_pending=10)
+    started = asyncio.Event()
+
+    async def handler(payload):
+        started.set()
+        await asyncio.sleep(10)
+
+    job_queue.register("slow", handler)
+    job, _ = job_queue.submit("slow", {})
+    await started.wait()
+    await job_queue.close()
+
+    interrupted = JobStore(path).get(job["job_id"])
+    assert interrupted["status"] == "queued"
+    assert interrupted["attempts"] == 0
+
+
+def test_job_store_purges_old_results():
+    """Test finished jobs are removed after the result TTL"""
+    store = JobStore(":memory:")
+    job = store.create("echo", {}, "key")
+    store.update(job["job_id"], status="succeeded", result={}, finished_at=main.time.time() - 100)
+
+    assert store.purge_finished(older_than=50) == 1
+    assert store.get(job["job_id"]) is None
+
+
+def test_galaxy_job_endpoints(client):
+    """Test submit, long-poll and SSE endpoints for a galaxy generation job"""
+    response = client.post("/jobs/generate-galaxy", json={"keywords": ["café"], "attributes": ["moderno"]})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    status = client.get(f"/jobs/{job_id}", params={"wait": 5}).json()
+    assert status["status"] == "succeeded"
+    assert status["result"]["success"] is True
+    assert status["progress"]["stage"] == "saving"
+
+    events = client.get(f"/jobs/{job_id}/events").text.strip().split("\n\n")
+    assert events[-1].startswith("event: complete")
+    assert json.loads(events[-1].split("data: ", 1)[1])["job_id"] == job_id
+
+
+def test_unknown_job_returns_404(client):
+    """Test fetching a missing job"""
+    assert client.get("/jobs/desconhecido").status_code == 404
+    assert client.get("/jobs/desconhecido/events").status_code == 404
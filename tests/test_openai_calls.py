@@ -0,0 +1,1167 @@
+import pytest
+import asyncio
+import json
+import base64
+import os
+import httpx
+import openai
+from types import SimpleNamespace
+from unittest.mock import Mock, patch, AsyncMock
+
+import main
+from main import (
+    ContentCache,
+    run_single_flight,
+    inflight_requests,
+    get_or_compute,
+    refresh_tasks,
+    set_cached_content,
+    get_cached_content,
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_circuit_breaker,
+    ModelRateLimiter,
+    TokenBucket,
+    get_retry_after,
+    generate_text_with_gpt4,
+    generate_image_with_dalle,
+    generate_image_bytes_with_dalle,
+    generate_logo_with_dalle,
+    store_image_blob,
+    load_image_blob,
+    purge_image_blobs,
+    deadline_scope,
+    remaining_budget,
+    ensure_budget,
+    DeadlineExceededError,
+    UsageTelemetry,
+    request_scope,
+    generate_visual_metaphors,
+    generate_visual_concept_data,
+    stream_text_with_gpt4,
+    ModelRouter,
+    TextBatcher,
+    DegradationController,
+    FALLBACK_METAPHOR_IMAGES
+)
+
+
+def make_chat_response(text, usage=None):
+    """Build a minimal chat completion response"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+def make_image_response(url):
+    """Build a minimal image generation response"""
+    return SimpleNamespace(data=[SimpleNamespace(url=url)])
+
+
+def make_b64_image_response(content):
+    """Build a minimal b64_json image generation response"""
+    return SimpleNamespace(data=[SimpleNamespace(b64_json=base64.b64encode(content).decode())])
+
+
+@pytest.fixture
+def live_openai():
+    """Run OpenAI helpers through the real (non-testing) path with a mocked client"""
+    mock_client = Mock()
+    mock_client.chat.completions.create = AsyncMock()
+    mock_client.images.generate = AsyncMock()
+    memory = ContentCache(max_entries=100, max_bytes=1024 * 1024, ttl=60)
+    with patch('main.is_testing', False), \
+            patch('main.openai_client', mock_client), \
+            patch('main.content_cache', memory), \
+            patch('main.persistent_cache', None), \
+            patch('main.circuit_breakers', {}), \
+            patch('main._openai_semaphore', None), \
+            patch('main.rate_limiters', {}), \
+            patch('main.model_router', ModelRouter(main.TEXT_MODEL_TIERS)), \
+            patch('main.usage_telemetry', UsageTelemetry(":memory:")), \
+            patch('main.degradation_controller', DegradationController(main.DEGRADATION_STAGES)), \
+            patch('main.failure_cache', ContentCache(max_entries=100, max_bytes=1024 * 1024, ttl=30)):
+        yield mock_client
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    """Test that concurrent callers share a single execution"""
+    calls = 0
+
+    async def slow_request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "resultado"
+
+    results = await asyncio.gather(*[run_single_flight("key", slow_request) for _ in range(5)])
+
+    assert results == ["resultado"] * 5
+    assert calls == 1
+    assert "key" not in inflight_requests
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_to_all_callers():
+    """Test that an error reaches every waiting caller"""
+    async def failing_request():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("falha")
+
+    results = await asyncio.gather(
+        *[run_single_flight("key", failing_request) for _ in range(3)],
+        return_exceptions=True
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert "key" not in inflight_requests
+
+
+@pytest.mark.asyncio
+async def test_single_flight_joiner_survives_leader_cancellation():
+    """Test cancelling the first caller does not cancel the callers waiting on the same key"""
+    release = asyncio.Event()
+
+    async def slow_request():
+        await release.wait()
+        return "resultado"
+
+    leader = asyncio.create_task(run_single_flight("key", slow_request))
+    await asyncio.sleep(0)
+    joiner = asyncio.create_task(run_single_flight("key", slow_request))
+    await asyncio.sleep(0)
+
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    release.set()
+
+    assert await joiner == "resultado"
+    assert "key" not in inflight_requests
+
+
+@pytest.mark.asyncio
+async def test_single_flight_runs_again_after_completion():
+    """Test that keys are released once the request finishes"""
+    request = AsyncMock(return_value="ok")
+
+    await run_single_flight("key", request)
+    await run_single_flight("key", request)
+
+    assert request.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_gpt4_concurrent_identical_prompts_call_api_once(live_openai):
+    """Test duplicate GPT-4 prompts in flight are coalesced"""
+    async def delayed_response(**kwargs):
+        await asyncio.sleep(0.01)
+        return make_chat_response("texto gerado")
+
+    live_openai.chat.completions.create.side_effect = delayed_response
+
+    results = await asyncio.gather(*[generate_text_with_gpt4("mesmo prompt") for _ in range(4)])
+
+    assert results == ["texto gerado"] * 4
+    assert live_openai.chat.completions.create.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_dalle_concurrent_failure_falls_back_for_all(live_openai):
+    """Test that a coalesced DALL-E failure falls back for every caller"""
+    async def delayed_failure(**kwargs):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("API indisponível")
+
+    live_openai.images.generate.side_effect = delayed_failure
+
+    results = await asyncio.gather(*[generate_image_with_dalle("mesmo prompt") for _ in range(3)])
+
+    assert all(url in FALLBACK_METAPHOR_IMAGES for url in results)
+    assert live_openai.images.generate.await_count == 1
+
+
+@pytest.fixture
+def isolated_cache():
+    """Isolated in-memory cache without the disk tier"""
+    memory = ContentCache(max_entries=100, max_bytes=1024 * 1024, ttl=60)
+    with patch('main.content_cache', memory), patch('main.persistent_cache', None):
+        yield memory
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_serves_fresh_value(isolated_cache):
+    """Test that a fresh entry is served without recomputing"""
+    compute = AsyncMock(return_value="novo")
+    set_cached_content("gpt4_text_swr", {"value": "cacheado", "refresh_at": main.time.time() + 60})
+
+    assert await get_or_compute("gpt4_text_swr", compute) == "cacheado"
+    compute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_serves_stale_and_refreshes_once(isolated_cache):
+    """Test stale entries are served immediately with a single background refresh"""
+    refreshed = asyncio.Event()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        refreshed.set()
+        return "novo"
+
+    compute_mock = AsyncMock(side_effect=compute)
+    set_cached_content("gpt4_text_stale", {"value": "velho", "refresh_at": main.time.time() - 1})
+
+    results = await asyncio.gather(*[get_or_compute("gpt4_text_stale", compute_mock) for _ in range(5)])
+    assert results == ["velho"] * 5
+
+    await asyncio.wait_for(refreshed.wait(), timeout=1)
+    await asyncio.sleep(0)
+    assert compute_mock.await_count == 1
+    assert "gpt4_text_stale" not in refresh_tasks
+    assert await get_or_compute("gpt4_text_stale", compute_mock) == "novo"
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_refresh_failure_keeps_stale_value(isolated_cache):
+    """Test a failed background refresh keeps serving the stale value"""
+    compute = AsyncMock(side_effect=RuntimeError("API indisponível"))
+    set_cached_content("gpt4_text_fail", {"value": "velho", "refresh_at": main.time.time() - 1})
+
+    assert await get_or_compute("gpt4_text_fail", compute) == "velho"
+    await asyncio.sleep(0.01)
+    assert await get_or_compute("gpt4_text_fail", compute) == "velho"
+
+
+@pytest.mark.asyncio
+async def test_background_refresh_does_not_inherit_request_scope(isolated_cache):
+    """Test the refresh runs without the triggering request's deadline and attribution"""
+    seen = {}
+    done = asyncio.Event()
+
+    async def compute():
+        seen["budget"] = remaining_budget()
+        seen["endpoint"] = main.request_endpoint.get()
+        seen["usage"] = main.current_usage.get()
+        done.set()
+        return "novo"
+
+    set_cached_content("gpt4_text_scope", {"value": "velho", "refresh_at": main.time.time() - 1})
+    with request_scope("generate_galaxy", "proj-1"), deadline_scope(0.5), main.track_openai_usage("galaxy_metaphor"):
+        assert await get_or_compute("gpt4_text_scope", compute) == "velho"
+    await asyncio.wait_for(done.wait(), timeout=1)
+
+    assert seen["budget"] is None
+    assert seen["endpoint"] is None
+    assert seen["usage"]["call_site"] == "galaxy_metaphor"
+    assert seen["usage"]["project_id"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_blocks_on_miss_with_single_computation(isolated_cache):
+    """Test that after the hard TTL only one caller recomputes"""
+    async def compute():
+        await asyncio.sleep(0.01)
+        return "calculado"
+
+    compute_mock = AsyncMock(side_effect=compute)
+    results = await asyncio.gather(*[get_or_compute("gpt4_text_miss", compute_mock) for _ in range(4)])
+
+    assert results == ["calculado"] * 4
+    assert compute_mock.await_count == 1
+    assert get_cached_content("gpt4_text_miss")["value"] == "calculado"
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_accepts_legacy_entries(isolated_cache):
+    """Test entries stored without refresh metadata are still served"""
+    set_cached_content("gpt4_text_legacy", "texto antigo")
+
+    assert await get_or_compute("gpt4_text_legacy", AsyncMock()) == "texto antigo"
+
+
+def test_circuit_breaker_opens_after_threshold():
+    """Test the breaker opens after N consecutive failures"""
+    breaker = CircuitBreaker("gpt-4", failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+
+def test_circuit_breaker_half_open_probe():
+    """Test a single probe is allowed after the recovery timeout"""
+    breaker = CircuitBreaker("gpt-4", failure_threshold=1, recovery_timeout=30)
+    with patch('main.time.time', return_value=1000.0):
+        breaker.record_failure()
+    with patch('main.time.time', return_value=1031.0):
+        assert breaker.allow_request()
+        assert breaker.state == "half_open"
+        assert not breaker.allow_request()
+
+        breaker.record_failure()
+        assert breaker.state == "open"
+    with patch('main.time.time', return_value=1062.0):
+        assert breaker.allow_request()
+        breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_half_open_breaker(live_openai):
+    """Test a probe cancelled mid-call does not leave the breaker stuck in half-open"""
+    breaker = main.get_circuit_breaker("gpt-4")
+    with patch('main.time.time', return_value=1000.0):
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+    with patch('main.time.time', return_value=1000.0 + breaker.recovery_timeout + 1):
+        probe = asyncio.create_task(
+            call_with_circuit_breaker("gpt-4", "gpt4_text_probe", lambda: asyncio.sleep(10))
+        )
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert breaker.allow_request()
+    assert main.failure_cache.get("gpt4_text_probe") is None
+
+
+@pytest.mark.asyncio
+async def test_negative_cache_short_circuits_identical_prompt():
+    """Test a failed prompt is not retried while its failure is cached"""
+    request = AsyncMock(side_effect=RuntimeError("timeout"))
+    with patch('main.circuit_breakers', {}), \
+            patch('main.failure_cache', ContentCache(max_entries=10, max_bytes=1024, ttl=30)):
+        with pytest.raises(RuntimeError):
+            await call_with_circuit_breaker("gpt-4", "gpt4_text_neg", request)
+        with pytest.raises(CircuitOpenError):
+            await call_with_circuit_breaker("gpt-4", "gpt4_text_neg", request)
+
+    assert request.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_falls_back_immediately(live_openai):
+    """Test that an open circuit skips the API and uses the local fallback"""
+    live_openai.chat.completions.create.side_effect = RuntimeError("serviço degradado")
+
+    with patch('main.OPENAI_CIRCUIT_FAILURE_THRESHOLD', 2):
+        for i in range(2):
+            await generate_text_with_gpt4(f"prompt {i}")
+        result = await generate_text_with_gpt4("prompt novo")
+
+    assert result.startswith("Conteúdo baseado em:")
+    assert live_openai.chat.completions.create.await_count == 2
+    assert main.circuit_breakers["gpt-4-turbo-preview"].state == "open"
+
+
+@pytest.mark.asyncio
+async def test_visual_metaphors_fan_out_respects_limit_and_order():
+    """Test DALL-E calls run concurrently up to the limit and keep prompt order"""
+    active = 0
+    peak = 0
+
+    async def fake_dalle(prompt, size="1024x1024", quality="standard", call_site="image"):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if "energia" in prompt:
+            raise RuntimeError("falha pontual")
+        return f"https://example.com/{prompt}"
+
+    with patch('main.generate_image_with_dalle', side_effect=fake_dalle), \
+            patch('main.METAPHOR_CONCURRENCY', 2):
+        result = await generate_visual_metaphors(["energia", "agua"], ["moderno", "premium"])
+
+    assert peak == 2
+    assert len(result) == 6
+    for metaphor in result:
+        if "energia" in metaphor["prompt"]:
+            assert metaphor["image_url"] in FALLBACK_METAPHOR_IMAGES
+        else:
+            assert metaphor["image_url"] == f"https://example.com/{metaphor['prompt']}"
+
+
+@pytest.mark.asyncio
+async def test_global_openai_limit_caps_concurrent_calls(live_openai):
+    """Test the shared limiter bounds in-flight OpenAI requests"""
+    active = 0
+    peak = 0
+
+    async def delayed_response(**kwargs):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return make_chat_response("ok")
+
+    live_openai.chat.completions.create.side_effect = delayed_response
+
+    with patch('main.OPENAI_MAX_CONCURRENCY', 3):
+        results = await asyncio.gather(*[generate_text_with_gpt4(f"prompt {i}") for i in range(8)])
+
+    assert results == ["ok"] * 8
+    assert peak == 3
+
+
+@pytest.mark.asyncio
+async def test_visual_concepts_share_one_recolored_master_logo():
+    """Test concepts re-skin a single logo generation and keep their order"""
+    logo = AsyncMock(return_value=main.create_fallback_logo("EV", ["#2D3748", "#F7FAFC"]))
+
+    async def fake_text(prompt, max_tokens=1000, temperature=0.7, tier=None, call_site=None):
+        await asyncio.sleep(0.01)
+        return prompt.split("Conceito ")[1][:1]
+
+    analysis = {"personality_traits": ["Confiável"], "values": ["Qualidade"]}
+    preferences = {"traditional_contemporary": 50, "corporate_creative": 50}
+    with patch('main.generate_logo_with_dalle', logo):
+        with patch('main.generate_text_with_gpt4', side_effect=fake_text):
+            concepts = await generate_visual_concept_data(analysis, ["eco", "vida"], ["moderno"], preferences)
+
+    assert logo.await_count == 1
+    assert [c["id"] for c in concepts] == ["concept_1", "concept_2", "concept_3"]
+    assert [c["rationale"] for c in concepts] == ["1", "2", "3"]
+    assert len({c["logo_variations"][0] for c in concepts}) == 3
+    for concept in concepts:
+        assert concept["logo_variation_types"] == main.LOGO_VARIATION_TYPES
+        assert len(concept["logo_variations"]) == len(main.LOGO_VARIATION_TYPES)
+        assert len(set(concept["logo_variations"])) == len(concept["logo_variations"])
+        assert all(v.startswith("data:image/png;base64,") for v in concept["logo_variations"])
+
+
+@pytest.mark.asyncio
+async def test_visual_concepts_fallback_failure_degrades_per_concept():
+    """Test a concept whose local fallback also fails gets placeholders without sinking the others"""
+    logo = AsyncMock(return_value=main.create_fallback_logo("EV", ["#2D3748", "#F7FAFC"]))
+    recolor = main.recolor_image_to_palette
+
+    def flaky_recolor(image, palette):
+        if palette[0] == "#805AD5":
+            raise ValueError("falha ao recolorir")
+        return recolor(image, palette)
+
+    analysis = {"personality_traits": [], "values": []}
+    preferences = {"traditional_contemporary": 50, "corporate_creative": 50}
+    with patch('main.generate_logo_with_dalle', logo), \
+            patch('main.recolor_image_to_palette', side_effect=flaky_recolor), \
+            patch('main.create_fallback_logo', side_effect=OSError("fonte indisponível")):
+        concepts = await generate_visual_concept_data(analysis, ["eco"], [], preferences)
+
+    placeholders = [c for c in concepts if c["logo_variations"][0] == main.FALLBACK_LOGO_URL]
+    assert len(placeholders) == 1
+    assert placeholders[0]["logo_variations"] == [main.FALLBACK_LOGO_URL] * len(main.LOGO_VARIATION_TYPES)
+    assert all(c["rationale"] for c in concepts)
+
+
+@pytest.mark.asyncio
+async def test_visual_concepts_master_failure_degrades_to_fallback():
+    """Test a failed master generation still yields local logos for every concept"""
+    analysis = {"personality_traits": [], "values": []}
+    preferences = {"traditional_contemporary": 50, "corporate_creative": 50}
+    with patch('main.generate_logo_with_dalle', AsyncMock(side_effect=RuntimeError("falha"))) as logo:
+        concepts = await generate_visual_concept_data(analysis, [], [], preferences)
+
+    # Sem keywords cada conceito tem seu próprio texto e, portanto, seu próprio mestre
+    assert logo.await_count == 3
+    for i, concept in enumerate(concepts):
+        assert concept["logo_variations"][0] == main.create_fallback_logo(f"C{i+1}", concept["color_palette"])
+
+
+def make_rate_limit_error(retry_after):
+    """Build a 429 error carrying a Retry-After header"""
+    response = httpx.Response(429, headers={"retry-after": str(retry_after)},
+                              request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_token_bucket_wait_time():
+    """Test the bucket reports the time needed to refill"""
+    bucket = TokenBucket(rate_per_minute=60, burst_seconds=2)
+    assert bucket.capacity == 2
+    assert bucket.time_until(2, bucket.updated_at) == 0
+    bucket.consume(2)
+    assert bucket.time_until(1, bucket.updated_at) == pytest.approx(1.0)
+
+
+def test_rate_limiter_aimd_concurrency():
+    """Test concurrency halves on throttling and grows back additively"""
+    limiter = ModelRateLimiter("gpt-4", requests_per_minute=600, tokens_per_minute=0, max_concurrency=8)
+    limiter.in_flight = 1
+    limiter.release("throttled", retry_after=0)
+    assert limiter.concurrency_limit == 4
+    limiter.in_flight = 1
+    limiter.release("error")
+    assert limiter.concurrency_limit == 2
+    limiter.in_flight = 1
+    limiter.release("success")
+    assert limiter.concurrency_limit == 2.5
+    limiter.in_flight = 1
+    limiter.release("neutral")
+    assert limiter.concurrency_limit == 2.5
+    assert limiter.snapshot()["throttled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_queues_beyond_concurrency():
+    """Test callers queue when the concurrency limit is reached"""
+    limiter = ModelRateLimiter("dall-e-3", requests_per_minute=6000, tokens_per_minute=0, max_concurrency=1)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0.01)
+
+    assert not waiter.done()
+    assert limiter.snapshot()["queue_depth"] == 1
+
+    limiter.release("success")
+    await asyncio.wait_for(waiter, timeout=1)
+    snapshot = limiter.snapshot()
+    assert snapshot["in_flight"] == 1
+    assert snapshot["queue_depth"] == 0
+    assert snapshot["p95_wait_ms"] >= 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_honors_retry_after():
+    """Test a throttled release blocks new acquisitions until Retry-After expires"""
+    limiter = ModelRateLimiter("gpt-4", requests_per_minute=6000, tokens_per_minute=0, max_concurrency=4)
+    await limiter.acquire()
+    limiter.release("throttled", retry_after=get_retry_after(make_rate_limit_error(0.05)))
+
+    started = main.time.monotonic()
+    await limiter.acquire()
+    assert main.time.monotonic() - started >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_slot_released_when_call_is_cancelled(live_openai):
+    """Test cancelling an in-flight call gives its limiter slot back"""
+    started = asyncio.Event()
+
+    async def hang():
+        started.set()
+        await asyncio.sleep(60)
+
+    task = asyncio.create_task(main.call_with_rate_limit("gpt-4", 10, hang))
+    await started.wait()
+    assert main.get_rate_limiter("gpt-4").snapshot()["in_flight"] == 1
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert main.get_rate_limiter("gpt-4").snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_gpt4_retries_after_rate_limit(live_openai):
+    """Test a 429 is retried once after Retry-After without tripping the breaker"""
+    live_openai.chat.completions.create.side_effect = [
+        make_rate_limit_error(0.01),
+        make_chat_response("texto após 429")
+    ]
+
+    assert await generate_text_with_gpt4("prompt limitado") == "texto após 429"
+    assert live_openai.chat.completions.create.await_count == 2
+    assert main.circuit_breakers["gpt-4-turbo-preview"].state == "closed"
+    assert main.rate_limiters["gpt-4-turbo-preview"].snapshot()["throttled"] == 1
+
+
+class FakeChatStream:
+    """Async iterator of streamed chat completion chunks"""
+
+    def __init__(self, parts, error=None):
+        self.parts = list(parts)
+        self.error = error
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.parts:
+            if self.error:
+                raise self.error
+            raise StopAsyncIteration
+        text = self.parts.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def parse_sse(body):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.mark.asyncio
+async def test_stream_text_forwards_chunks_and_caches_result(live_openai):
+    """Test streamed chunks are yielded as they arrive and cached once complete"""
+    live_openai.chat.completions.create.return_value = FakeChatStream(["Brand ", "guidelines", None])
+
+    first = [chunk async for chunk in stream_text_with_gpt4("guidelines prompt", max_tokens=20)]
+    second = [chunk async for chunk in stream_text_with_gpt4("guidelines prompt", max_tokens=20)]
+
+    assert first == ["Brand ", "guidelines"]
+    assert second == ["Brand guidelines"]
+    assert live_openai.chat.completions.create.await_count == 1
+    assert live_openai.chat.completions.create.await_args.kwargs["stream"] is True
+    assert await generate_text_with_gpt4("guidelines prompt", max_tokens=20) == "Brand guidelines"
+
+
+@pytest.mark.asyncio
+async def test_stream_text_failure_is_not_cached(live_openai):
+    """Test a stream that breaks midway raises and records the failure"""
+    live_openai.chat.completions.create.return_value = FakeChatStream(["parcial"], error=RuntimeError("conexão caiu"))
+
+    with pytest.raises(RuntimeError):
+        async for _ in stream_text_with_gpt4("prompt instável"):
+            pass
+
+    assert main.circuit_breakers["gpt-4-turbo-preview"].consecutive_failures == 1
+    assert main.rate_limiters["gpt-4-turbo-preview"].snapshot()["in_flight"] == 0
+
+
+def test_brand_kit_stream_endpoint(client):
+    """Test the SSE endpoint sends assets first, then tokens, then the persisted kit"""
+    concept = {
+        "id": "concept_1",
+        "logo_variations": ["logo0", "logo1", "logo2", "logo3"],
+        "color_palette": ["#111111", "#222222", "#333333", "#444444", "#555555"],
+        "typography": {"primary": "Inter", "secondary": "Lato"}
+    }
+    with patch('main.supabase') as mock_supabase:
+        response = client.post("/generate-brand-kit/stream", json={
+            "brief_id": "brief_1",
+            "project_id": "project_1",
+            "brand_name": "EcoVida",
+            "selected_concept": concept,
+            "strategic_analysis": {"purpose": "Sustentabilidade", "values": ["Qualidade"]},
+            "kit_preferences": {}
+        })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["assets", "token", "complete"]
+    assert events[0][1]["assets_package"]["fonts"][0]["name"] == "Inter"
+    kit = events[-1][1]
+    assert kit["brand_name"] == "EcoVida"
+    assert main.base64.b64decode(kit["guidelines_pdf"].split(",", 1)[1]).decode() == events[1][1]["text"]
+    mock_supabase.table.assert_called_with("final_brand_kits")
+
+
+def test_model_router_downgrades_when_p95_exceeds_budget():
+    """Test a tier moves to its next model once p95 latency passes the budget"""
+    router = ModelRouter({"rationale": (["rapido", "mais-rapido"], 1000)})
+    with patch('main.OPENAI_ROUTER_MIN_SAMPLES', 20):
+        for _ in range(19):
+            router.record("rationale", "rapido", 0.2)
+        router.record("rationale", "rapido", 3.0)
+        assert router.select("rationale") == "rapido"
+
+        router.record("rationale", "rapido", 3.0)
+        assert router.select("rationale") == "mais-rapido"
+
+    snapshot = router.snapshot()["rationale"]
+    assert snapshot["samples"] == 0
+    assert snapshot["calls_by_model"] == {"rapido": 21}
+    # Última opção da lista: não há para onde rebaixar
+    for _ in range(20):
+        router.record("rationale", "mais-rapido", 5.0)
+    assert router.select("rationale") == "mais-rapido"
+
+
+def test_model_router_recovers_after_cooldown():
+    """Test a downgraded tier retries its preferred model after the recovery period"""
+    router = ModelRouter({"guidelines": (["principal", "reserva"], 1000)})
+    with patch('main.OPENAI_ROUTER_MIN_SAMPLES', 1), patch('main.time.monotonic', return_value=100.0):
+        router.record("guidelines", "principal", 2.0)
+        assert router.select("guidelines") == "reserva"
+    with patch('main.time.monotonic', return_value=100.0 + main.OPENAI_ROUTER_RECOVERY_SECONDS):
+        assert router.select("guidelines") == "principal"
+
+
+def test_model_router_unknown_tier_uses_default_model():
+    """Test call sites without a tier keep the flagship model"""
+    router = ModelRouter({})
+    assert router.select(None) == main.DEFAULT_TEXT_MODEL
+    router.record(None, main.DEFAULT_TEXT_MODEL, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_text_tier_uses_routed_model(live_openai):
+    """Test the tier's configured model is sent to the API and its latency recorded"""
+    live_openai.chat.completions.create.return_value = make_chat_response("rationale")
+
+    await generate_text_with_gpt4("rationale prompt", max_tokens=150, tier="rationale")
+
+    expected = main.TEXT_MODEL_TIERS["rationale"][0][0]
+    assert live_openai.chat.completions.create.await_args.kwargs["model"] == expected
+    assert main.model_router.snapshot()["rationale"]["samples"] == 1
+    assert expected in main.circuit_breakers
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_merges_concurrent_prompts(live_openai):
+    """Test concurrent items share one JSON-array request and are cached per item"""
+    live_openai.chat.completions.create.return_value = make_chat_response('["um", "dois", "três"]')
+    batcher = TextBatcher(window=0.01, max_items=8)
+
+    results = await asyncio.gather(*[
+        batcher.generate("contexto comum", f"item {i}", max_tokens=100, tier="rationale") for i in range(3)
+    ])
+
+    assert results == ["um", "dois", "três"]
+    assert live_openai.chat.completions.create.await_count == 1
+    kwargs = live_openai.chat.completions.create.await_args.kwargs
+    assert kwargs["messages"][1]["content"].count("contexto comum") == 1
+    assert kwargs["max_tokens"] == 350
+
+    # Cada item fica no cache com a chave da chamada individual
+    assert await batcher.generate("contexto comum", "item 1", max_tokens=100, tier="rationale") == "dois"
+    assert await generate_text_with_gpt4(
+        TextBatcher.individual_prompt("contexto comum", "item 2"), max_tokens=100, temperature=0.7
+    ) == "três"
+    assert live_openai.chat.completions.create.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_falls_back_to_individual_calls(live_openai):
+    """Test a malformed batch response is retried item by item"""
+    live_openai.chat.completions.create.side_effect = [
+        make_chat_response("não é JSON"),
+        make_chat_response("a"),
+        make_chat_response("b")
+    ]
+    batcher = TextBatcher(window=0.01, max_items=8)
+
+    results = await asyncio.gather(*[batcher.generate("ctx", f"item {i}") for i in range(2)])
+
+    assert sorted(results) == ["a", "b"]
+    assert live_openai.chat.completions.create.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_flushes_at_max_items(live_openai):
+    """Test a full batch is sent without waiting for the window"""
+    live_openai.chat.completions.create.return_value = make_chat_response('```json\n["x", "y"]\n```')
+    batcher = TextBatcher(window=10, max_items=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.generate("ctx", "a"), batcher.generate("ctx", "b")), timeout=1
+    )
+    assert results == ["x", "y"]
+
+
+@pytest.mark.asyncio
+async def test_dalle_logo_uses_b64_bytes_without_second_download(live_openai):
+    """Test logos are built from the b64_json payload and cached as bytes"""
+    logo_bytes = b"\x89PNG-logo"
+    live_openai.images.generate.return_value = make_b64_image_response(logo_bytes)
+
+    with patch('main.http_pool') as pool, patch('main.requests.get') as mock_get:
+        first = await generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+        second = await generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+
+    assert first == second == "data:image/png;base64," + base64.b64encode(logo_bytes).decode()
+    assert live_openai.images.generate.await_count == 1
+    assert live_openai.images.generate.await_args.kwargs["response_format"] == "b64_json"
+    pool.get.assert_not_called()
+    mock_get.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_dalle_logo_falls_back_when_generation_fails(live_openai):
+    """Test a failed generation produces the local fallback logo"""
+    live_openai.images.generate.side_effect = RuntimeError("falha")
+
+    logo = await generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+
+    assert logo == main.create_fallback_logo("Eco", ["#276749", "#F0FFF4"])
+
+
+@pytest.mark.asyncio
+async def test_dalle_bytes_cached_as_blob_reference(live_openai, tmp_path):
+    """Test the cache keeps a local blob reference and regenerates if the blob disappears"""
+    live_openai.images.generate.return_value = make_b64_image_response(b"imagem")
+
+    with patch('main.IMAGE_BLOB_DIR', str(tmp_path)):
+        assert await generate_image_bytes_with_dalle("prompt") == b"imagem"
+        cache_key = main.get_cache_key("dalle_image_bytes", {"prompt": "prompt", "size": "1024x1024", "quality": "standard"})
+        reference = main.content_cache.get(cache_key)["value"]
+        assert reference.startswith("blob:")
+        assert load_image_blob(reference) == b"imagem"
+
+        for name in os.listdir(tmp_path):
+            os.remove(tmp_path / name)
+        assert await generate_image_bytes_with_dalle("prompt") == b"imagem"
+
+    assert live_openai.images.generate.await_count == 2
+
+
+def test_image_blob_store_roundtrip_and_purge(tmp_path):
+    """Test content-addressed blobs, invalid references and age-based purge"""
+    with patch('main.IMAGE_BLOB_DIR', str(tmp_path)):
+        reference = store_image_blob(b"abc")
+        assert store_image_blob(b"abc") == reference
+        assert load_image_blob(reference) == b"abc"
+        assert load_image_blob("blob:../../etc/passwd") is None
+        assert load_image_blob("https://example.com/a.png") is None
+
+        assert purge_image_blobs(older_than=60) == 0
+        with patch('main.time.time', return_value=main.time.time() + 120):
+            assert purge_image_blobs(older_than=60) == 1
+        assert load_image_blob(reference) is None
+
+    with patch('main.IMAGE_BLOB_DIR', ""):
+        assert store_image_blob(b"abc") == b"abc"
+        assert load_image_blob(b"abc") == b"abc"
+
+
+def test_deadline_scope_nests_without_extending():
+    """Test inner scopes can only shorten the outer deadline"""
+    assert remaining_budget() is None
+    with deadline_scope(10):
+        assert 9 < remaining_budget() <= 10
+        with deadline_scope(60):
+            assert remaining_budget() <= 10
+        with deadline_scope(1):
+            assert remaining_budget() <= 1
+            with pytest.raises(DeadlineExceededError):
+                ensure_budget(5)
+        with deadline_scope(0):
+            assert remaining_budget() > 9
+    assert remaining_budget() is None
+
+
+@pytest.mark.asyncio
+async def test_text_generation_skips_remote_call_without_budget(live_openai):
+    """Test a nearly spent deadline goes straight to the local fallback without penalizing the model"""
+    with deadline_scope(1):
+        with pytest.raises(DeadlineExceededError):
+            await generate_text_with_gpt4("prompt sem tempo", tier="guidelines")
+
+    live_openai.chat.completions.create.assert_not_awaited()
+    assert main.circuit_breakers == {}
+    assert len(main.failure_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_openai_timeout_is_capped_by_deadline(live_openai):
+    """Test the per-call timeout never exceeds the remaining budget"""
+    live_openai.chat.completions.create.return_value = make_chat_response("ok")
+
+    with deadline_scope(10):
+        assert await generate_text_with_gpt4("prompt com prazo") == "ok"
+
+    assert live_openai.chat.completions.create.await_args.kwargs["timeout"] <= 10
+
+
+@pytest.mark.asyncio
+async def test_logo_and_rationale_use_local_fallbacks_when_budget_is_low(live_openai):
+    """Test concept stages fall back to the geometric logo and template rationale"""
+    analysis = {"personality_traits": ["ousada"], "values": ["inovação"]}
+    style = {"traditional_contemporary": 70, "corporate_creative": 30}
+
+    with deadline_scope(2):
+        logo = await generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+        rationale = await main.generate_concept_rationale(0, analysis, style)
+
+    assert logo == main.create_fallback_logo("Eco", ["#276749", "#F0FFF4"])
+    assert rationale.startswith("Conceito 1 combina ousada")
+    live_openai.images.generate.assert_not_awaited()
+    live_openai.chat.completions.create.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_guidelines_use_local_fallback_when_budget_is_low(live_openai):
+    """Test the brand kit falls back to the simple guidelines instead of the generic text"""
+    concept = {
+        "id": "concept_1",
+        "logo_variations": ["logo0", "logo1", "logo2", "logo3"],
+        "color_palette": ["#111111", "#222222", "#333333", "#444444", "#555555"],
+        "typography": {"primary": "Inter", "secondary": "Lato"}
+    }
+
+    with deadline_scope(1):
+        brand_kit = await main.generate_brand_kit_data("Eco", concept, {"purpose": "Cuidar"})
+
+    guidelines = main.base64.b64decode(brand_kit["guidelines_pdf"].split(",", 1)[1]).decode()
+    assert guidelines == main.build_fallback_guidelines("Eco", main.build_brand_kit_assets(concept))
+    live_openai.chat.completions.create.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_does_not_retry_items_after_deadline(live_openai):
+    """Test a batch that runs out of budget is not retried item by item"""
+    batcher = TextBatcher(window=0.01, max_items=8)
+
+    with patch.object(batcher, "_run_batch", AsyncMock(side_effect=DeadlineExceededError("sem prazo"))):
+        results = await asyncio.gather(*[batcher.generate("ctx", f"item {i}") for i in range(2)], return_exceptions=True)
+
+    assert all(isinstance(result, DeadlineExceededError) for result in results)
+    live_openai.chat.completions.create.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_refreshes_stale_cached_items(live_openai):
+    """Test a stale item is served from cache and revalidated in the background"""
+    live_openai.chat.completions.create.return_value = make_chat_response("novo")
+    batcher = TextBatcher(window=0.01, max_items=8)
+    prompt = TextBatcher.individual_prompt("ctx", "item 0")
+    cache_key = main.get_cache_key("gpt4_text", {"prompt": prompt, "max_tokens": 150, "temperature": 0.7})
+    set_cached_content(cache_key, {"value": "velho", "refresh_at": main.time.time() - 1})
+
+    assert await batcher.generate("ctx", "item 0") == "velho"
+    await asyncio.wait_for(refresh_tasks[cache_key], timeout=1)
+
+    assert live_openai.chat.completions.create.await_count == 1
+    assert await batcher.generate("ctx", "item 0") == "novo"
+
+
+@pytest.mark.asyncio
+async def test_text_batcher_runs_with_largest_item_deadline(live_openai):
+    """Test the merged call uses the longest remaining budget, outside any single request's context"""
+    batcher = TextBatcher(window=0.01, max_items=8)
+    seen = []
+
+    async def run_batch(shared_context, instructions, *args):
+        seen.append((remaining_budget(), main.request_endpoint.get()))
+        return [f"r{i}" for i in range(len(instructions))]
+
+    async def item(index, seconds, endpoint):
+        with request_scope(endpoint), deadline_scope(seconds):
+            return await batcher.generate("ctx", f"item {index}")
+
+    with patch.object(batcher, "_run_batch", side_effect=run_batch):
+        assert await asyncio.gather(item(0, 5, "a"), item(1, 30, "b")) == ["r0", "r1"]
+        remaining, endpoint = seen[-1]
+        assert 25 < remaining <= 30 and endpoint is None
+
+        async def unbounded():
+            return await batcher.generate("ctx", "item 1")
+
+        with deadline_scope(5):
+            await asyncio.gather(
+                batcher.generate("ctx", "item 0"),
+                asyncio.create_task(unbounded(), context=main.contextvars.Context())
+            )
+        assert seen[-1][0] is None
+
+
+@pytest.mark.asyncio
+async def test_stream_text_respects_deadline(live_openai):
+    """Test streaming checks the remaining budget and caps the request timeout"""
+    live_openai.chat.completions.create.return_value = FakeChatStream(["ok"])
+
+    with deadline_scope(1):
+        with pytest.raises(DeadlineExceededError):
+            [chunk async for chunk in stream_text_with_gpt4("prompt sem tempo")]
+    live_openai.chat.completions.create.assert_not_awaited()
+
+    with deadline_scope(10):
+        assert [chunk async for chunk in stream_text_with_gpt4("prompt com prazo")] == ["ok"]
+    assert live_openai.chat.completions.create.await_args.kwargs["timeout"] <= 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_wait_counts_against_deadline(live_openai):
+    """Test a throttled model does not hold the request past its deadline"""
+    limiter = main.get_rate_limiter("gpt-4-turbo-preview")
+    limiter.blocked_until = main.time.monotonic() + 60
+
+    with patch.dict('main.DEADLINE_MIN_REMAINING', {"text": 0.5}), deadline_scope(0.6):
+        started = main.time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            await main.call_with_circuit_breaker(
+                "gpt-4-turbo-preview", "gpt4_text_deadline", AsyncMock(), min_remaining=0.5
+            )
+
+    assert main.time.monotonic() - started < 1
+    assert main.circuit_breakers["gpt-4-turbo-preview"].state == "closed"
+    assert main.failure_cache.get("gpt4_text_deadline") is None
+
+
+@pytest.mark.asyncio
+async def test_usage_telemetry_attributes_tokens_and_cache_outcome(live_openai):
+    """Test text and image calls record call site, endpoint, project, tokens, images and cache outcome"""
+    live_openai.chat.completions.create.return_value = make_chat_response(
+        "texto", usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=500)
+    )
+    live_openai.images.generate.return_value = make_b64_image_response(b"logo")
+
+    with request_scope("generate_brand_kit", "proj-1"):
+        await generate_text_with_gpt4("diretrizes", tier="guidelines", call_site="brand_guidelines")
+        await generate_text_with_gpt4("diretrizes", tier="guidelines", call_site="brand_guidelines")
+        await generate_image_bytes_with_dalle("logo", call_site="concept_logo")
+
+    sites = {site["call_site"]: site for site in main.usage_telemetry.top_call_sites(0, project_id="proj-1")}
+
+    guidelines = sites["brand_guidelines"]
+    assert guidelines["endpoint"] == "generate_brand_kit"
+    assert guidelines["calls"] == 2
+    assert guidelines["api_calls"] == 1
+    assert guidelines["outcomes"] == {"miss": 1, "hit": 1}
+    assert guidelines["models"] == {"gpt-4-turbo-preview": 1}
+    assert guidelines["prompt_tokens"] == 1000 and guidelines["completion_tokens"] == 500
+    assert guidelines["cost_usd"] == pytest.approx(0.01 + 0.015)
+
+    logo = sites["concept_logo"]
+    assert logo["images"] == 1
+    assert logo["cost_usd"] == pytest.approx(0.04)
+    assert main.usage_telemetry.top_call_sites(0, project_id="outro") == []
+
+
+@pytest.mark.asyncio
+async def test_usage_telemetry_records_deadline_and_batch_calls(live_openai):
+    """Test skipped calls are recorded as deadline and batches under their own call site"""
+    live_openai.chat.completions.create.return_value = make_chat_response('["a", "b"]')
+    batcher = TextBatcher(window=0.01, max_items=8)
+
+    with request_scope("generate_visual_concepts", "proj-2"):
+        await asyncio.gather(*[
+            batcher.generate("ctx", f"item {i}", tier="rationale", call_site="concept_rationale") for i in range(2)
+        ])
+        with deadline_scope(0.5), pytest.raises(DeadlineExceededError):
+            await generate_text_with_gpt4("sem tempo", call_site="brief_analysis")
+
+    sites = {site["call_site"]: site for site in main.usage_telemetry.top_call_sites(0)}
+    assert sites["concept_rationale_batch"]["outcomes"] == {"miss": 1}
+    assert sites["concept_rationale_batch"]["endpoint"] == "generate_visual_concepts"
+    assert sites["concept_rationale_batch"]["prompt_tokens"] > 0
+    assert sites["brief_analysis"]["outcomes"] == {"deadline": 1}
+    assert sites["brief_analysis"]["cost_usd"] == 0
+
+
+def test_usage_telemetry_flush_and_ranking(tmp_path):
+    """Test aggregates survive a flush to disk and rank by cost or p95 latency"""
+    path = str(tmp_path / "usage.sqlite3")
+    telemetry = UsageTelemetry(path)
+    for latency in (100, 120, 110):
+        telemetry.record({"call_site": "barato_lento", "model": "gpt-4o-mini", "outcome": "miss",
+                          "api_calls": 1, "cost_usd": 0.001, "latency_ms": latency * 50})
+    telemetry.record({"call_site": "caro_rapido", "model": "dall-e-3", "outcome": "miss",
+                      "api_calls": 1, "images": 1, "cost_usd": 0.04, "latency_ms": 800})
+    telemetry.record({"call_site": "caro_rapido", "outcome": "hit", "latency_ms": 1})
+
+    assert telemetry.flush() == 3
+    assert telemetry.flush() == 0
+
+    reopened = UsageTelemetry(path)
+    by_cost = reopened.top_call_sites(0, order_by="cost")
+    by_p95 = reopened.top_call_sites(0, order_by="p95", limit=1)
+
+    assert [site["call_site"] for site in by_cost] == ["caro_rapido", "barato_lento"]
+    assert by_cost[0]["calls"] == 2
+    assert by_cost[0]["remote_p95_ms"] == 800
+    assert [site["call_site"] for site in by_p95] == ["barato_lento"]
+    assert by_p95[0]["p95_ms"] == 6000
+    assert reopened.purge(older_than=-60) == 3
+
+
+def test_usage_endpoint(client):
+    """Test the usage query endpoint validates ordering and returns call sites"""
+    with patch('main.usage_telemetry', UsageTelemetry(":memory:")) as telemetry:
+        telemetry.record({"call_site": "galaxy_metaphor", "endpoint": "generate_galaxy", "model": "dall-e-3",
+                          "outcome": "miss", "api_calls": 1, "images": 1, "cost_usd": 0.04, "latency_ms": 900})
+
+        response = client.get("/usage/openai", params={"order_by": "p95", "hours": 1})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["call_sites"][0]["call_site"] == "galaxy_metaphor"
+        assert body["total_cost_usd"] == pytest.approx(0.04)
+        assert client.get("/usage/openai", params={"order_by": "tokens"}).status_code == 400
+
+
+def degrade(controller, model, latency, samples=None):
+    """Feed the controller enough slow calls to cross the stage thresholds"""
+    for _ in range(samples or main.DEGRADED_MIN_SAMPLES):
+        controller.record(model, latency)
+
+
+def test_degradation_controller_switches_and_recovers_with_hysteresis():
+    """Test a p95 spike degrades the stages of that signal and recovery needs a lower p95"""
+    controller = DegradationController({"concept_rationale": ("text", 1000), "concept_logo": ("image", 1000)})
+    degrade(controller, "gpt-4o-mini", 0.9)
+    assert not controller.should_degrade("concept_rationale")
+
+    degrade(controller, "gpt-4o-mini", 5.0)
+    with patch('main.DEGRADED_PROBE_INTERVAL', 60):
+        assert controller.should_degrade("concept_rationale")
+        assert not controller.should_degrade("concept_logo")
+        assert not controller.should_degrade("unknown_stage")
+    assert controller.snapshot()["mode"] == "degraded"
+
+    # Só as chamadas feitas após a degradação contam; 900ms não basta (histerese de 0.7 × 1000ms)
+    degrade(controller, "gpt-4o-mini", 0.9, samples=main.DEGRADED_RECOVERY_MIN_SAMPLES)
+    assert controller.snapshot()["stages"]["concept_rationale"]["degraded"]
+
+    recovering = DegradationController({"concept_rationale": ("text", 1000)})
+    degrade(recovering, "gpt-4o-mini", 5.0)
+    degrade(recovering, "gpt-4o-mini", 0.2, samples=main.DEGRADED_RECOVERY_MIN_SAMPLES)
+    assert recovering.snapshot()["mode"] == "normal"
+    # As chamadas lentas anteriores à recuperação não degradam a etapa de novo
+    recovering.record("gpt-4o-mini", 0.2)
+    assert recovering.snapshot()["mode"] == "normal"
+    assert controller.snapshot()["stages"]["concept_rationale"]["served_locally"] == 1
+
+
+def test_degraded_stage_lets_probes_through():
+    """Test a degraded stage periodically sends one call upstream to measure recovery"""
+    controller = DegradationController({"galaxy_metaphor": ("image", 1000)})
+    degrade(controller, "dall-e-3", 5.0)
+
+    with patch('main.DEGRADED_PROBE_INTERVAL', 0):
+        assert not controller.should_degrade("galaxy_metaphor")
+    with patch('main.DEGRADED_PROBE_INTERVAL', 60):
+        assert controller.should_degrade("galaxy_metaphor")
+    assert not DegradationController({"galaxy_metaphor": ("image", 1000)}, enabled=False).should_degrade("galaxy_metaphor")
+
+
+@pytest.mark.asyncio
+async def test_slow_upstream_switches_pipeline_stages_to_local_versions(live_openai):
+    """Test slow OpenAI calls move logo, rationale, analysis and metaphors to their local versions"""
+    live_openai.chat.completions.create.return_value = make_chat_response("ok")
+    assert await generate_text_with_gpt4("prompt medido") == "ok"
+    assert main.degradation_controller.snapshot()["signals"]["text"]["samples"] == 1
+    live_openai.chat.completions.create.reset_mock()
+    degrade(main.degradation_controller, "gpt-4-turbo-preview", 60.0)
+    degrade(main.degradation_controller, "dall-e-3", 60.0)
+
+    analysis = {"personality_traits": ["ousada"], "values": ["inovação"]}
+    style = {"traditional_contemporary": 70, "corporate_creative": 30}
+    with patch('main.DEGRADED_PROBE_INTERVAL', 60), request_scope("generate_visual_concepts") as degraded_stages:
+        logo = await generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+        rationale = await main.generate_concept_rationale(0, analysis, style)
+        strategic = await main.analyze_brief_with_gpt4("Marca de café sustentável", ["café"], ["sustentável"])
+        metaphors = await generate_visual_metaphors(["café"], ["sustentável"])
+
+    assert logo == main.create_fallback_logo("Eco", ["#276749", "#F0FFF4"])
+    assert rationale.startswith("Conceito 1 combina ousada")
+    assert strategic == main.analyze_strategic_elements("Marca de café sustentável", ["café"], ["sustentável"])
+    assert all(metaphor["image_url"] in FALLBACK_METAPHOR_IMAGES for metaphor in metaphors)
+    assert degraded_stages == {"concept_logo", "concept_rationale", "brief_analysis", "galaxy_metaphor"}
+    assert main.service_mode_report(degraded_stages)["mode"] == "degraded"
+    live_openai.images.generate.assert_not_awaited()
+    live_openai.chat.completions.create.assert_not_awaited()
+
+
+def test_health_reports_degraded_mode(client):
+    """Test /health exposes the degradation state of each stage"""
+    with patch('main.degradation_controller', DegradationController(main.DEGRADATION_STAGES)):
+        degrade(main.degradation_controller, "dall-e-3", 600.0)
+        services = client.get("/health").json()["services"]
+
+    assert services["degraded_mode"]["mode"] == "degraded"
+    assert services["degraded_mode"]["stages"]["galaxy_metaphor"]["degraded"]
+    assert not services["degraded_mode"]["stages"]["concept_rationale"]["degraded"]
@@ -0,0 +1,127 @@
+import pytest
+import asyncio
+import base64
+import json
+import httpx
+import openai
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+import main
+from main import ContentCache, ModelRouter, UsageTelemetry
+from openai_stub_server import create_stub_app, canned_chat_content, StubServer
+
+
+def stub_client(stub_app, max_retries=0):
+    """Real AsyncOpenAI client talking to the stub app in-process"""
+    return AsyncOpenAI(
+        api_key="stub",
+        base_url="http://stub.local/v1",
+        max_retries=max_retries,
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=stub_app), base_url="http://stub.local")
+    )
+
+
+def test_canned_content_matches_call_site_formats():
+    """Test batch prompts get a JSON array of the requested size and analysis prompts a JSON object"""
+    batch = canned_chat_content([{"role": "user", "content": main.build_batch_prompt("ctx", ["a", "b", "c"])}])
+    assert len(main.parse_batch_response(batch, 3)) == 3
+
+    analysis = json.loads(canned_chat_content([{"role": "user", "content": 'JSON com: "purpose"'}]))
+    assert {"purpose", "values", "personality_traits"} <= set(analysis)
+
+
+def test_latency_follows_profile_quantiles():
+    """Test sampled latencies roughly match the configured median and p95"""
+    stub = StubServer({"latency": {"chat": [100, 400]}, "seed": 7})
+    samples = sorted(stub.latency_seconds("chat") * 1000 for _ in range(2000))
+
+    assert 85 < samples[1000] < 115
+    assert 320 < samples[1900] < 480
+    assert StubServer({"profile": "instant"}).latency_seconds("images") == 0.0
+
+
+def test_stub_config_rejects_invalid_profile_and_latency():
+    """Test /stub/config answers 400 for bad values and keeps the previous configuration"""
+    client = TestClient(create_stub_app({"profile": "instant"}))
+
+    for changes in ({"profile": "bogus"}, {"latency": {"chat": [100]}}, {"latency": {"chat": ["a", 5]}},
+                    {"latency": {"audio": [1, 2]}}, {"error_rate": "alto"}):
+        response = client.post("/stub/config", json=changes)
+        assert response.status_code == 400, changes
+        assert response.json()["error"]["message"]
+
+    assert client.get("/stub/stats").json()["config"]["profile"] == "instant"
+    assert client.post("/stub/config", json={"profile": "fast", "latency": {"chat": [1, 2]}}).status_code == 200
+    with pytest.raises(ValueError):
+        StubServer({"profile": "bogus"})
+
+
+@pytest.mark.asyncio
+async def test_sdk_chat_and_images_against_stub():
+    """Test the OpenAI SDK parses chat, streaming and both image response formats"""
+    client = stub_client(create_stub_app({"profile": "instant"}))
+
+    chat = await client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "olá"}])
+    assert chat.choices[0].message.content
+    assert chat.model == "gpt-4o-mini"
+    assert chat.usage.prompt_tokens > 0
+
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini", messages=[{"role": "user", "content": "olá"}], stream=True
+    )
+    streamed = "".join([chunk.choices[0].delta.content or "" async for chunk in stream])
+    assert streamed == chat.choices[0].message.content
+
+    b64 = await client.images.generate(model="dall-e-3", prompt="logo", response_format="b64_json")
+    assert base64.b64decode(b64.data[0].b64_json).startswith(b"\x89PNG")
+
+    by_url = await client.images.generate(model="dall-e-3", prompt="logo")
+    image = await client._client.get(by_url.data[0].url)
+    assert image.status_code == 200
+    assert image.content == base64.b64decode(b64.data[0].b64_json)
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_stub_errors_and_rate_limit_bursts():
+    """Test configured 500s and 429 bursts surface as the SDK's typed errors"""
+    stub_app = create_stub_app({"profile": "instant", "burst_interval": 60, "burst_duration": 30, "retry_after": 2})
+    client = stub_client(stub_app)
+
+    with pytest.raises(openai.RateLimitError) as exc_info:
+        await client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "x"}])
+    assert main.get_retry_after(exc_info.value) == 2
+
+    stub_app.state.stub.update({"burst_interval": 0, "error_rate": 1.0})
+    with pytest.raises(openai.InternalServerError):
+        await client.images.generate(model="dall-e-3", prompt="logo")
+
+    stats = stub_app.state.stub.stats
+    assert stats["chat"]["429"] == 1 and stats["images"]["500"] == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_app_generation_path_runs_against_stub():
+    """Test the real generation path (limiter, breaker, cache, telemetry) end to end against the stub"""
+    stub_app = create_stub_app({"profile": "instant"})
+    with patch('main.is_testing', False), \
+            patch('main.openai_client', stub_client(stub_app)), \
+            patch('main.content_cache', ContentCache(max_entries=100, max_bytes=1024 * 1024, ttl=60)), \
+            patch('main.persistent_cache', None), \
+            patch('main.circuit_breakers', {}), \
+            patch('main._openai_semaphore', None), \
+            patch('main.rate_limiters', {}), \
+            patch('main.model_router', ModelRouter(main.TEXT_MODEL_TIERS)), \
+            patch('main.usage_telemetry', UsageTelemetry(":memory:")), \
+            patch('main.failure_cache', ContentCache(max_entries=100, max_bytes=1024 * 1024, ttl=30)):
+        texts = await asyncio.gather(*[main.generate_text_with_gpt4(f"prompt {i}") for i in range(5)])
+        logo = await main.generate_logo_with_dalle("Eco", ["#276749", "#F0FFF4"], ["moderno"])
+
+        assert all(text.startswith("Conteúdo simulado") for text in texts)
+        assert logo.startswith("data:image/png;base64,")
+        assert logo != main.create_fallback_logo("Eco", ["#276749", "#F0FFF4"])
+        assert main.rate_limiters["gpt-4-turbo-preview"].acquired == 5
+        assert stub_app.state.stub.stats["chat"]["200"] == 5